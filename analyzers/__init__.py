@@ -1,9 +1,10 @@
 from .arbitrage_analyzer import ArbitrageAnalyzer
-from .opportunity_finder import classify_opportunity, filter_opportunities
+from .opportunity_finder import OpportunityIndex, classify_opportunity, filter_opportunities
 from .spread_calculator import calculate_international_profit, calculate_p2p_profit, calculate_spread_percent
 
 __all__ = [
     "ArbitrageAnalyzer",
+    "OpportunityIndex",
     "classify_opportunity",
     "filter_opportunities",
     "calculate_spread_percent",
@@ -1,13 +1,47 @@
 from __future__ import annotations
 
 from collections import defaultdict
-from typing import Any
+from typing import TYPE_CHECKING, Any, Sequence
 
+from analyzers.execution import ExecutableSpreadCalculator
+from analyzers.graph_arbitrage import GraphArbitrageEngine
 from analyzers.opportunity_finder import classify_opportunity, filter_opportunities
 from analyzers.spread_calculator import calculate_spread_percent
+from analyzers.vectorized import SymbolMatrix, VectorizedSpreadEngine
+
+if TYPE_CHECKING:
+    from parsers.order_book_store import OrderBookStore
 
 
 class ArbitrageAnalyzer:
+    dex_fees_abs = 1.5
+    p2p_fees_abs = 1.0
+
+    def __init__(
+        self,
+        book_store: OrderBookStore | None = None,
+        max_book_age_sec: float | None = None,
+        vectorized: bool = True,
+        max_cycle_length: int = 4,
+        depth_sizes_usd: Sequence[float] = (100, 500, 1000, 5000, 10000, 50000),
+        dex_fees_abs: float | None = None,
+        p2p_fees_abs: float | None = None,
+        graph_time_budget_sec: float | None = None,
+    ) -> None:
+        # комиссии по умолчанию заданы на классе; конструктор переопределяет их (настройки, реплей)
+        if dex_fees_abs is not None:
+            self.dex_fees_abs = dex_fees_abs
+        if p2p_fees_abs is not None:
+            self.p2p_fees_abs = p2p_fees_abs
+        # если задан live-стор стаканов (стриминг), CEX-котировки берутся из него, а не из REST-снапшота
+        self.book_store = book_store
+        self.max_book_age_sec = max_book_age_sec
+        # cex-cex и dex-cex считаются матрицами NumPy; vectorized=False оставляет построчный расчёт
+        self.engine = VectorizedSpreadEngine(self.dex_fees_abs) if vectorized else None
+        # поиск циклов — самая дорогая часть скана; бюджет не даёт ему растянуть find на секунды
+        self.graph = GraphArbitrageEngine(max_cycle_length=max_cycle_length, time_budget_sec=graph_time_budget_sec)
+        self.execution = ExecutableSpreadCalculator(depth_sizes_usd)
+
     def find(
         self,
         cex_data: list[dict[str, Any]],
@@ -16,9 +50,17 @@ class ArbitrageAnalyzer:
         min_profit_percent: float,
         strategy: str = "all",
     ) -> list[dict[str, Any]]:
+        cex_data = self.live_cex(cex_data)
         opportunities: list[dict[str, Any]] = []
-        opportunities.extend(self._cex_to_cex(cex_data))
-        opportunities.extend(self._dex_to_cex(dex_data, cex_data))
+        if self.engine is not None:
+            matrix = SymbolMatrix(cex_data)
+            opportunities.extend(self.engine.cex_to_cex(matrix, min_profit=min_profit_percent))
+            opportunities.extend(self.engine.dex_to_cex(dex_data, matrix, min_profit=min_profit_percent))
+        else:
+            opportunities.extend(self._cex_to_cex(cex_data))
+            opportunities.extend(self._dex_to_cex(dex_data, cex_data))
+        # ликвидность cex-cex — исполнимый по стаканам объём в USD, а не сумма уровней в base
+        self.execution.apply(opportunities, cex_data, min_profit_percent)
         opportunities.extend(self._p2p_pairs(p2p_data))
         opportunities.extend(self._triangular(cex_data))
 
@@ -27,6 +69,14 @@ class ArbitrageAnalyzer:
 
         return filter_opportunities(opportunities, min_profit=min_profit_percent, strategy=strategy)
 
+    def live_cex(self, cex_data: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Живые стаканы из стрима поверх REST-строк: REST остаётся для рынков, которых нет в стриме."""
+        if self.book_store is None or not len(self.book_store):
+            return cex_data
+        live = self.book_store.rows(max_age_sec=self.max_book_age_sec)
+        streamed = {(row["exchange"], row["symbol"]) for row in live}
+        return live + [row for row in cex_data if (row.get("exchange"), row.get("symbol")) not in streamed]
+
     def _cex_to_cex(self, cex_data: list[dict[str, Any]]) -> list[dict[str, Any]]:
         by_symbol: dict[str, list[dict[str, Any]]] = defaultdict(list)
         for item in cex_data:
@@ -36,106 +86,117 @@ class ArbitrageAnalyzer:
         for symbol, markets in by_symbol.items():
             for buy in markets:
                 for sell in markets:
-                    if buy["exchange"] == sell["exchange"]:
-                        continue
-                    buy_price = float(buy.get("ask") or buy.get("spot_price") or 0)
-                    sell_price = float(sell.get("bid") or sell.get("spot_price") or 0)
-                    if buy_price <= 0 or sell_price <= 0:
-                        continue
-                    fee = float(buy.get("taker_fee", 0)) * buy_price + float(sell.get("maker_fee", 0)) * sell_price
-                    spread = calculate_spread_percent(buy_price, sell_price, fee)
-                    out.append(
-                        {
-                            "type": "cex-cex",
-                            "route": f"{buy['exchange']} -> {sell['exchange']} ({symbol})",
-                            "buy_price": buy_price,
-                            "sell_price": sell_price,
-                            "fees": fee,
-                            "spread_percent": spread,
-                            "liquidity": min(float(buy.get("orderbook_depth", 0)), float(sell.get("orderbook_depth", 0))),
-                        }
-                    )
+                    opp = self.cex_pair(symbol, buy, sell)
+                    if opp is not None:
+                        out.append(opp)
         return out
 
     def _dex_to_cex(self, dex_data: list[dict[str, Any]], cex_data: list[dict[str, Any]]) -> list[dict[str, Any]]:
         out: list[dict[str, Any]] = []
         for dex in dex_data:
-            symbol = dex.get("symbol")
             for cex in cex_data:
-                if cex.get("symbol") != symbol:
+                if cex.get("symbol") != dex.get("symbol"):
                     continue
-                buy_price = float(dex.get("price") or 0)
-                sell_price = float(cex.get("bid") or cex.get("spot_price") or 0)
-                if buy_price <= 0 or sell_price <= 0:
-                    continue
-                fees = 1.5
-                spread = calculate_spread_percent(buy_price, sell_price, fees)
-                out.append(
-                    {
-                        "type": "dex-cex",
-                        "route": f"{dex['exchange']} -> {cex['exchange']} ({symbol})",
-                        "buy_price": buy_price,
-                        "sell_price": sell_price,
-                        "fees": fees,
-                        "spread_percent": spread,
-                        "liquidity": min(float(dex.get("liquidity", 0)), float(cex.get("orderbook_depth", 0))),
-                    }
-                )
+                opp = self.dex_pair(dex, cex)
+                if opp is not None:
+                    out.append(opp)
         return out
 
     def _p2p_pairs(self, p2p_data: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        # одна возможность на маршрут: лучшая цена покупки одной площадки против лучшей цены продажи другой
+        books = list(self.p2p_top_of_book(p2p_data).values())
         out: list[dict[str, Any]] = []
-        for buy in p2p_data:
-            for sell in p2p_data:
-                if buy["exchange"] == sell["exchange"]:
-                    continue
-                if buy["fiat"] != sell["fiat"]:
-                    continue
-                buy_price = float(buy.get("price", 0))
-                sell_price = float(sell.get("price", 0))
-                if sell_price <= buy_price:
-                    continue
-                fees = 1.0
-                spread = calculate_spread_percent(buy_price, sell_price, fees)
-                out.append(
-                    {
-                        "type": "p2p",
-                        "route": f"{buy['exchange']} -> {sell['exchange']} ({buy['asset']}/{buy['fiat']})",
-                        "buy_price": buy_price,
-                        "sell_price": sell_price,
-                        "fees": fees,
-                        "spread_percent": spread,
-                        "liquidity": min(float(buy.get("max_limit", 0)), float(sell.get("max_limit", 0))),
-                    }
-                )
+        for buy, _ in books:
+            for _, sell in books:
+                opp = self.p2p_pair(buy, sell)
+                if opp is not None:
+                    out.append(opp)
         return out
 
-    def _triangular(self, cex_data: list[dict[str, Any]]) -> list[dict[str, Any]]:
-        # Упрощенный поиск: ищем символы BTC/USDT, ETH/BTC, ETH/USDT в одной бирже
-        by_exchange: dict[str, dict[str, float]] = defaultdict(dict)
-        for row in cex_data:
-            exchange = row.get("exchange", "")
-            symbol = row.get("symbol", "")
-            price = float(row.get("spot_price") or 0)
-            if symbol and price > 0:
-                by_exchange[exchange][symbol] = price
-
-        out: list[dict[str, Any]] = []
-        for exchange, prices in by_exchange.items():
-            if not {"BTC/USDT", "ETH/BTC", "ETH/USDT"}.issubset(set(prices.keys())):
+    @staticmethod
+    def p2p_top_of_book(ads: list[dict[str, Any]]) -> dict[tuple[str, str, str], tuple[dict[str, Any], dict[str, Any]]]:
+        """Самое дешёвое и самое дорогое объявление в каждой группе (площадка, актив, фиат)."""
+        books: dict[tuple[str, str, str], tuple[dict[str, Any], dict[str, Any]]] = {}
+        for ad in ads:
+            price = float(ad.get("price", 0))
+            if price <= 0:
+                continue
+            group = (ad["exchange"], ad.get("asset", ""), ad["fiat"])
+            best = books.get(group)
+            if best is None:
+                books[group] = (ad, ad)
                 continue
-            theoretical = prices["BTC/USDT"] * prices["ETH/BTC"]
-            actual = prices["ETH/USDT"]
-            spread = calculate_spread_percent(theoretical, actual, fees_abs=theoretical * 0.002)
-            out.append(
-                {
-                    "type": "triangle",
-                    "route": f"{exchange}: USDT -> BTC -> ETH -> USDT",
-                    "buy_price": theoretical,
-                    "sell_price": actual,
-                    "fees": theoretical * 0.002,
-                    "spread_percent": spread,
-                    "liquidity": 0,
-                }
+            cheapest, dearest = best
+            books[group] = (
+                ad if price < float(cheapest["price"]) else cheapest,
+                ad if price > float(dearest["price"]) else dearest,
             )
-        return out
+        return books
+
+    def cex_pair(self, symbol: str, buy: dict[str, Any], sell: dict[str, Any]) -> dict[str, Any] | None:
+        if buy["exchange"] == sell["exchange"]:
+            return None
+        buy_price = float(buy.get("ask") or buy.get("spot_price") or 0)
+        sell_price = float(sell.get("bid") or sell.get("spot_price") or 0)
+        if buy_price <= 0 or sell_price <= 0:
+            return None
+        fee = float(buy.get("taker_fee", 0)) * buy_price + float(sell.get("maker_fee", 0)) * sell_price
+        spread = calculate_spread_percent(buy_price, sell_price, fee)
+        return {
+            "type": "cex-cex",
+            "route": f"{buy['exchange']} -> {sell['exchange']} ({symbol})",
+            "symbol": symbol,
+            "buy_exchange": buy["exchange"],
+            "sell_exchange": sell["exchange"],
+            "buy_price": buy_price,
+            "sell_price": sell_price,
+            "fees": fee,
+            "spread_percent": spread,
+            "liquidity": min(float(buy.get("orderbook_depth", 0)), float(sell.get("orderbook_depth", 0))),
+        }
+
+    def dex_pair(self, dex: dict[str, Any], cex: dict[str, Any]) -> dict[str, Any] | None:
+        symbol = dex.get("symbol")
+        buy_price = float(dex.get("price") or 0)
+        sell_price = float(cex.get("bid") or cex.get("spot_price") or 0)
+        if buy_price <= 0 or sell_price <= 0:
+            return None
+        fees = self.dex_fees_abs
+        spread = calculate_spread_percent(buy_price, sell_price, fees)
+        return {
+            "type": "dex-cex",
+            "route": f"{dex['exchange']} -> {cex['exchange']} ({symbol})",
+            "symbol": symbol,
+            "buy_exchange": dex["exchange"],
+            "sell_exchange": cex["exchange"],
+            "buy_price": buy_price,
+            "sell_price": sell_price,
+            "fees": fees,
+            "spread_percent": spread,
+            "liquidity": min(float(dex.get("liquidity", 0)), float(cex.get("orderbook_depth", 0))),
+        }
+
+    def p2p_pair(self, buy: dict[str, Any], sell: dict[str, Any]) -> dict[str, Any] | None:
+        if buy["exchange"] == sell["exchange"]:
+            return None
+        if buy["fiat"] != sell["fiat"]:
+            return None
+        buy_price = float(buy.get("price", 0))
+        sell_price = float(sell.get("price", 0))
+        if sell_price <= buy_price:
+            return None
+        fees = self.p2p_fees_abs
+        spread = calculate_spread_percent(buy_price, sell_price, fees)
+        return {
+            "type": "p2p",
+            "route": f"{buy['exchange']} -> {sell['exchange']} ({buy['asset']}/{buy['fiat']})",
+            "buy_price": buy_price,
+            "sell_price": sell_price,
+            "fees": fees,
+            "spread_percent": spread,
+            "liquidity": min(float(buy.get("max_limit", 0)), float(sell.get("max_limit", 0))),
+        }
+
+    def _triangular(self, cex_data: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        # циклы длины 3..max_cycle_length по всем рынкам биржи; граф переиспользуется между сканами
+        return self.graph.find(cex_data)
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from parsers.order_book_store import CompactBook
+
+USD_QUOTES = frozenset({"USD", "USDT", "USDC", "BUSD", "FDUSD", "DAI", "TUSD"})
+
+
+def _pad(books: list[CompactBook], side: str) -> tuple[np.ndarray, np.ndarray]:
+    prices = [getattr(book, f"{side}_prices") for book in books]
+    sizes = [getattr(book, f"{side}_sizes") for book in books]
+    width = max((len(p) for p in prices), default=0)
+    price_out = np.zeros((len(books), max(width, 1)))
+    size_out = np.zeros_like(price_out)
+    for n, (p, q) in enumerate(zip(prices, sizes)):
+        price_out[n, : len(p)] = p
+        size_out[n, : len(q)] = q
+    return price_out, size_out
+
+
+def _walk(prices: np.ndarray, sizes: np.ndarray, amounts: np.ndarray, spend_quote: bool) -> tuple[np.ndarray, np.ndarray]:
+    """Проход по уровням стакана для матрицы объёмов [pairs × sizes].
+
+    spend_quote=True: тратим `amounts` котируемой валюты на asks, возвращаем купленный base.
+    spend_quote=False: продаём `amounts` base в bids, возвращаем полученную котируемую валюту.
+    Второй массив — маска объёмов, которые стакан может исполнить целиком.
+    """
+    quote = np.cumsum(prices * sizes, axis=1)
+    base = np.cumsum(sizes, axis=1)
+    have, get = (quote, base) if spend_quote else (base, quote)
+    prev_have = np.pad(have, ((0, 0), (1, 0)))[:, :-1]
+    prev_get = np.pad(get, ((0, 0), (1, 0)))[:, :-1]
+
+    level = (have[:, None, :] < amounts[:, :, None]).sum(axis=2)
+    fillable = (amounts > 0) & (amounts <= have[:, -1:])
+    level = np.minimum(level, prices.shape[1] - 1)
+
+    price = np.take_along_axis(prices, level, axis=1)
+    rest = amounts - np.take_along_axis(prev_have, level, axis=1)
+    got = np.take_along_axis(prev_get, level, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        got = got + (rest / price if spend_quote else rest * price)
+    return np.where(fillable, got, 0.0), fillable
+
+
+def execution_grid(
+    buy_books: list[CompactBook],
+    sell_books: list[CompactBook],
+    quote_sizes: np.ndarray,
+    taker_fees: np.ndarray,
+    maker_fees: np.ndarray,
+) -> dict[str, np.ndarray]:
+    """VWAP покупки/продажи и спред для каждой пары и каждого объёма (в котируемой валюте).
+
+    Комиссия считается так же, как для top-of-book: taker * buy + maker * sell на единицу base.
+    """
+    ask_prices, ask_sizes = _pad(buy_books, "ask")
+    bid_prices, bid_sizes = _pad(sell_books, "bid")
+    bought, can_buy = _walk(ask_prices, ask_sizes, quote_sizes, spend_quote=True)
+    proceeds, can_sell = _walk(bid_prices, bid_sizes, bought, spend_quote=False)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        buy_vwap = quote_sizes / bought
+        sell_vwap = proceeds / bought
+        fee = taker_fees[:, None] * buy_vwap + maker_fees[:, None] * sell_vwap
+        spread = ((sell_vwap - buy_vwap - fee) / buy_vwap) * 100
+    return {
+        "fillable": can_buy & can_sell,
+        "buy_price": buy_vwap,
+        "sell_price": sell_vwap,
+        "spread_percent": spread,
+    }
+
+
+class ExecutableSpreadCalculator:
+    """Пересчитывает cex-cex возможности по глубине стакана на сетке объёмов в USD.
+
+    `liquidity` становится наибольшим объёмом сетки (USD), который стаканы исполняют целиком
+    со спредом не ниже `min_profit`. Пары считаются одним набором матриц, без цикла по парам.
+    """
+
+    def __init__(self, sizes_usd: Sequence[float]) -> None:
+        self.sizes_usd = np.array(sorted(sizes_usd), dtype=np.float64)
+
+    def apply(self, opportunities: list[dict[str, Any]], cex_data: list[dict[str, Any]], min_profit: float) -> None:
+        if not len(self.sizes_usd):
+            return
+        rows = {(row.get("exchange"), row.get("symbol")): row for row in cex_data}
+        usd = self._usd_prices(cex_data)
+
+        targets: list[tuple[dict[str, Any], dict[str, Any], dict[str, Any], float]] = []
+        for opp in opportunities:
+            if opp.get("type") != "cex-cex":
+                continue
+            buy = rows.get((opp.get("buy_exchange"), opp.get("symbol")))
+            sell = rows.get((opp.get("sell_exchange"), opp.get("symbol")))
+            if buy is None or sell is None or buy.get("book") is None or sell.get("book") is None:
+                continue
+            quote_usd = usd.get(opp["symbol"].split("/")[-1])
+            if not quote_usd:
+                opp["liquidity"] = 0.0
+                continue
+            targets.append((opp, buy, sell, quote_usd))
+        if not targets:
+            return
+
+        quote_usd = np.array([t[3] for t in targets])
+        grid = execution_grid(
+            [t[1]["book"] for t in targets],
+            [t[2]["book"] for t in targets],
+            self.sizes_usd[None, :] / quote_usd[:, None],
+            np.array([float(t[1].get("taker_fee", 0)) for t in targets]),
+            np.array([float(t[2].get("maker_fee", 0)) for t in targets]),
+        )
+        clears = grid["fillable"] & (grid["spread_percent"] >= min_profit)
+        # VWAP только ухудшается с объёмом, поэтому берём последний объём, проходящий порог
+        best = np.where(clears.any(axis=1), clears.shape[1] - 1 - np.argmax(clears[:, ::-1], axis=1), -1).tolist()
+
+        fillable = grid["fillable"].tolist()
+        buy_prices, sell_prices = grid["buy_price"].tolist(), grid["sell_price"].tolist()
+        spreads = grid["spread_percent"].tolist()
+        sizes = self.sizes_usd.tolist()
+        for n, (opp, _, _, _) in enumerate(targets):
+            opp["depth_grid"] = [
+                {
+                    "size_usd": sizes[k],
+                    "buy_price": buy_prices[n][k],
+                    "sell_price": sell_prices[n][k],
+                    "spread_percent": spreads[n][k],
+                }
+                for k in range(len(sizes))
+                if fillable[n][k]
+            ]
+            opp["liquidity"] = sizes[best[n]] if best[n] >= 0 else 0.0
+
+    @staticmethod
+    def _usd_prices(cex_data: list[dict[str, Any]]) -> dict[str, float]:
+        usd: dict[str, float] = {quote: 1.0 for quote in USD_QUOTES}
+        for row in cex_data:
+            base, _, quote = str(row.get("symbol", "")).partition("/")
+            if quote not in USD_QUOTES or base in usd:
+                continue
+            bid, ask = float(row.get("bid") or 0), float(row.get("ask") or 0)
+            price = (bid + ask) / 2 if bid > 0 and ask > 0 else float(row.get("spot_price") or 0)
+            if price > 0:
+                usd[base] = price
+        return usd
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Iterable
+
+
+@dataclass(slots=True)
+class Edge:
+    target: int
+    weight: float
+    rate: float
+    fee: float
+    symbol: str
+    side: str
+    generation: int
+
+
+class CurrencyGraph:
+    """Граф валют одной биржи: ребро A -> B с весом -log(курс обмена A на B с учётом комиссии).
+
+    Прибыльный цикл обмена — цикл отрицательного веса. Граф живёт между сканами:
+    новые котировки только обновляют веса рёбер, а сошедшиеся потенциалы вершин из прошлого
+    скана служат тёплым стартом для проверки на отрицательный цикл (SPFA).
+    """
+
+    def __init__(self) -> None:
+        self.currencies: list[str] = []
+        self.index: dict[str, int] = {}
+        self.edges: list[dict[int, Edge]] = []
+        self.potential: list[float] = []
+        self.generation = 0
+
+    def update(self, rows: Iterable[dict[str, Any]]) -> None:
+        self.generation += 1
+        for row in rows:
+            symbol = row.get("symbol", "")
+            if "/" not in symbol:
+                continue
+            base, quote = symbol.split("/", 1)
+            bid = float(row.get("bid") or row.get("spot_price") or 0)
+            ask = float(row.get("ask") or row.get("spot_price") or 0)
+            fee = float(row.get("taker_fee", 0))
+            if bid > 0:
+                self._set_edge(base, quote, bid * (1 - fee), fee, symbol, "sell")
+            if ask > 0:
+                self._set_edge(quote, base, (1 - fee) / ask, fee, symbol, "buy")
+        # рынки, пропавшие из снапшота, не должны давать устаревшие циклы
+        for out in self.edges:
+            for target in [t for t, edge in out.items() if edge.generation != self.generation]:
+                del out[target]
+
+    def find_cycles(self, max_length: int = 4, min_length: int = 3, limit: int = 50) -> list[list[int]]:
+        if not self._has_negative_cycle():
+            return []
+        # веса, перевзвешенные потенциалами: вес цикла не меняется, а "масштаб" валют уходит,
+        # поэтому отсечение по отрицательной префиксной сумме в DFS режет почти все ветки
+        potential = self._tree_potential()
+        # рёбра по возрастанию приведённого веса: перебор обрывается на первом, что не оставляет
+        # префикс отрицательным, и у хабов (USDT, BTC) не просматриваются сотни лишних рёбер
+        weights = [{target: edge.weight + potential[source] - potential[target] for target, edge in out.items()} for source, out in enumerate(self.edges)]
+        reduced = [sorted(out.items(), key=lambda item: item[1]) for out in weights]
+        seen: set[tuple[int, ...]] = set()
+        cycles: list[tuple[float, list[int]]] = []
+
+        def close(path: list[int], total: float) -> None:
+            key = self._canonical(path)
+            if key not in seen:
+                seen.add(key)
+                cycles.append((total, list(key)))
+
+        def dfs(start: int, path: list[int], total: float, depth: int) -> None:
+            node = path[-1]
+            if depth == max_length:
+                # на последнем шаге годится только ребро обратно в старт — без перебора всех рёбер узла
+                weight = weights[node].get(start)
+                if weight is not None and total + weight < 0:
+                    close(path, total + weight)
+                return
+            for target, weight in reduced[node]:
+                new_total = total + weight
+                if new_total >= 0:
+                    break
+                if target == start:
+                    if depth >= min_length:
+                        close(path, new_total)
+                elif target not in path:
+                    path.append(target)
+                    dfs(start, path, new_total, depth + 1)
+                    path.pop()
+
+        # у любого цикла отрицательного веса есть поворот, все префиксы которого отрицательны
+        for start in range(len(self.currencies)):
+            dfs(start, [start], 0.0, 1)
+        cycles.sort(key=lambda item: item[0])
+        return [cycle for _, cycle in cycles[:limit]]
+
+    def edge(self, source: int, target: int) -> Edge:
+        return self.edges[source][target]
+
+    def _set_edge(self, source: str, target: str, rate: float, fee: float, symbol: str, side: str) -> None:
+        if rate <= 0:
+            return
+        u, v = self._node(source), self._node(target)
+        self.edges[u][v] = Edge(v, -math.log(rate), rate, fee, symbol, side, self.generation)
+
+    def _node(self, currency: str) -> int:
+        node = self.index.get(currency)
+        if node is None:
+            node = len(self.currencies)
+            self.index[currency] = node
+            self.currencies.append(currency)
+            self.edges.append({})
+            self.potential.append(0.0)
+        return node
+
+    def _has_negative_cycle(self) -> bool:
+        """SPFA от виртуального истока с указателями на родителя.
+
+        Раз в `n` релаксаций дерево родителей проверяется на цикл: цикл в нём есть только при
+        отрицательном цикле графа, и при отрицательном цикле он рано или поздно появляется,
+        поэтому выходим сразу, не доводя все n проходов Bellman-Ford. Потенциалы сохраняются
+        как тёплый старт только если релаксация сошлась.
+        """
+        n = len(self.currencies)
+        potential = [min(p, 0.0) for p in self.potential]
+        parent = [-1] * n
+        queue = deque(range(n))
+        queued = [True] * n
+        relaxations = 0
+        while queue:
+            source = queue.popleft()
+            queued[source] = False
+            base = potential[source]
+            for target, edge in self.edges[source].items():
+                if base + edge.weight < potential[target] - 1e-12:
+                    potential[target] = base + edge.weight
+                    parent[target] = source
+                    relaxations += 1
+                    if relaxations % n == 0 and self._parent_cycle(parent):
+                        return True
+                    if not queued[target]:
+                        queued[target] = True
+                        queue.append(target)
+        self.potential = potential
+        return False
+
+    def _tree_potential(self) -> list[float]:
+        """Потенциалы по BFS-дереву рёбер — логарифм mid-цены валюты относительно корня.
+
+        При отрицательном цикле сошедшихся потенциалов нет, а дерево даёт их приближение по текущим
+        котировкам. Ребро дерева берётся по середине между покупкой и продажей, поэтому оба его
+        направления получают положительный приведённый вес (половина спреда и комиссий), и в минус
+        уходят только рёбра реально рассогласованных рынков.
+        """
+        n = len(self.currencies)
+        potential: list[float | None] = [None] * n
+        # корнем берём самую связанную валюту, чтобы дерево было неглубоким
+        for root in sorted(range(n), key=lambda node: -len(self.edges[node])):
+            if potential[root] is not None:
+                continue
+            potential[root] = 0.0
+            queue = deque([root])
+            while queue:
+                source = queue.popleft()
+                base = potential[source]
+                assert base is not None
+                for target, edge in self.edges[source].items():
+                    if potential[target] is None:
+                        reverse = self.edges[target].get(source)
+                        potential[target] = base + (edge.weight if reverse is None else (edge.weight - reverse.weight) / 2)
+                        queue.append(target)
+        return [p or 0.0 for p in potential]
+
+    @staticmethod
+    def _parent_cycle(parent: list[int]) -> bool:
+        walk_of = [-1] * len(parent)
+        for start in range(len(parent)):
+            node = start
+            while node != -1 and walk_of[node] == -1:
+                walk_of[node] = start
+                node = parent[node]
+            if node != -1 and walk_of[node] == start:
+                return True
+        return False
+
+    @staticmethod
+    def _canonical(path: list[int]) -> tuple[int, ...]:
+        pivot = path.index(min(path))
+        return tuple(path[pivot:] + path[:pivot])
+
+
+class GraphArbitrageEngine:
+    """Поиск циклического арбитража внутри каждой биржи по всем её рынкам.
+
+    `time_budget_sec` ограничивает время одного `find`: биржи обходятся по кругу, и когда бюджет
+    исчерпан, оставшиеся переносятся на следующий скан (начнётся с них). Бюджет проверяется между
+    биржами, так что одна биржа всегда досчитывается целиком. None — считать все биржи каждый раз.
+    """
+
+    preferred_start = ("USDT", "USDC", "USD", "BTC", "ETH")
+
+    def __init__(self, max_cycle_length: int = 4, max_cycles_per_exchange: int = 50, time_budget_sec: float | None = None) -> None:
+        self.max_cycle_length = max_cycle_length
+        self.max_cycles_per_exchange = max_cycles_per_exchange
+        self.time_budget_sec = time_budget_sec
+        self.graphs: dict[str, CurrencyGraph] = {}
+        self._resume_from: str | None = None
+
+    def find(self, cex_data: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        by_exchange: dict[str, list[dict[str, Any]]] = {}
+        for row in cex_data:
+            by_exchange.setdefault(row.get("exchange", ""), []).append(row)
+
+        exchanges = list(by_exchange)
+        if self._resume_from in by_exchange:
+            pivot = exchanges.index(self._resume_from)
+            exchanges = exchanges[pivot:] + exchanges[:pivot]
+        self._resume_from = None
+        deadline = None if self.time_budget_sec is None else time.perf_counter() + self.time_budget_sec
+        out: list[dict[str, Any]] = []
+        for n, exchange in enumerate(exchanges):
+            if n and deadline is not None and time.perf_counter() >= deadline:
+                self._resume_from = exchange
+                break
+            out.extend(self.find_exchange(exchange, by_exchange[exchange]))
+        return out
+
+    def find_exchange(self, exchange: str, rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Обновляет граф одной биржи её текущими рынками и возвращает найденные циклы."""
+        graph = self.graphs.setdefault(exchange, CurrencyGraph())
+        graph.update(rows)
+        return [
+            self._opportunity(exchange, graph, self._rotate(graph, cycle))
+            for cycle in graph.find_cycles(self.max_cycle_length, limit=self.max_cycles_per_exchange)
+        ]
+
+    def _rotate(self, graph: CurrencyGraph, cycle: list[int]) -> list[int]:
+        names = [graph.currencies[node] for node in cycle]
+        for currency in self.preferred_start:
+            if currency in names:
+                pivot = names.index(currency)
+                return cycle[pivot:] + cycle[:pivot]
+        return cycle
+
+    def _opportunity(self, exchange: str, graph: CurrencyGraph, cycle: list[int]) -> dict[str, Any]:
+        gross = net = 1.0
+        for source, target in zip(cycle, cycle[1:] + cycle[:1]):
+            edge = graph.edge(source, target)
+            net *= edge.rate
+            gross *= edge.rate / (1 - edge.fee)
+        route = " -> ".join(graph.currencies[node] for node in cycle + cycle[:1])
+        return {
+            "type": "triangle",
+            "route": f"{exchange}: {route}",
+            "buy_price": 1.0,
+            "sell_price": gross,
+            "fees": gross - net,
+            "spread_percent": (net - 1.0) * 100,
+            "liquidity": 0,
+        }
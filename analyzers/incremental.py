@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Hashable, Iterable
+
+from analyzers.arbitrage_analyzer import ArbitrageAnalyzer
+from analyzers.graph_arbitrage import GraphArbitrageEngine
+from analyzers.opportunity_finder import classify_opportunity, filter_opportunities
+
+CEX_FIELDS = ("bid", "ask", "spot_price", "maker_fee", "taker_fee", "orderbook_depth")
+DEX_FIELDS = ("price", "liquidity")
+P2P_FIELDS = ("price", "min_limit", "max_limit")
+
+
+@dataclass
+class OpportunityChanges:
+    appeared: list[dict[str, Any]] = field(default_factory=list)
+    changed: list[dict[str, Any]] = field(default_factory=list)
+    disappeared: list[dict[str, Any]] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.appeared or self.changed or self.disappeared)
+
+
+class IncrementalAnalyzer:
+    """Держит котировки и найденные возможности между сканами и пересчитывает только затронутое.
+
+    `update` принимает снапшот (отсутствующие котировки считаются удалёнными) или, при
+    `partial=True`, только изменившиеся котировки. Пересчитываются пары с изменившейся
+    котировкой, циклы бирж, где поменялся хоть один рынок, и P2P-пары изменившихся групп
+    объявлений (exchange, asset, fiat). Хранятся только возможности со спредом не ниже
+    `min_profit_percent`. Граф валют у инкрементального пути свой: общий граф анализатора
+    обновляется полными сканами (/scan), и чужие обновления сбивали бы состояние между вызовами.
+    """
+
+    def __init__(self, analyzer: ArbitrageAnalyzer, min_profit_percent: float) -> None:
+        self.analyzer = analyzer
+        self.graph = GraphArbitrageEngine(analyzer.graph.max_cycle_length, analyzer.graph.max_cycles_per_exchange)
+        self.reset(min_profit_percent)
+
+    def reset(self, min_profit_percent: float) -> None:
+        self.min_profit_percent = min_profit_percent
+        self._cex: dict[str, dict[str, dict[str, Any]]] = defaultdict(dict)  # symbol -> exchange -> row
+        self._dex: dict[str, dict[str, dict[str, Any]]] = defaultdict(dict)
+        self._p2p: dict[tuple[str, str, str], tuple[dict[str, Any], dict[str, Any]]] = {}  # (exchange, asset, fiat) -> (cheapest, dearest)
+        self._opportunities: dict[Hashable, dict[str, Any]] = {}
+        self._by_quote: dict[Hashable, set[Hashable]] = defaultdict(set)
+        self._quotes_of: dict[Hashable, tuple[Hashable, ...]] = {}
+
+    def current(self, min_profit_percent: float | None = None, strategy: str = "all") -> list[dict[str, Any]]:
+        threshold = self.min_profit_percent if min_profit_percent is None else min_profit_percent
+        return filter_opportunities(list(self._opportunities.values()), min_profit=threshold, strategy=strategy)
+
+    def update(
+        self,
+        cex_data: list[dict[str, Any]] | None = None,
+        dex_data: list[dict[str, Any]] | None = None,
+        p2p_data: list[dict[str, Any]] | None = None,
+        partial: bool = False,
+    ) -> OpportunityChanges:
+        changes = OpportunityChanges()
+        graph_exchanges: set[str] = set()
+        touched_cex: list[tuple[str, str]] = []
+        touched_dex: list[tuple[str, str]] = []
+        touched_p2p: list[tuple[str, str, str]] = []
+
+        if cex_data is not None:
+            cex_data = self.analyzer.live_cex(cex_data)
+            for symbol, exchange in self._merge(self._cex, cex_data, CEX_FIELDS, partial, changes, "cex"):
+                touched_cex.append((symbol, exchange))
+                graph_exchanges.add(exchange)
+        if dex_data is not None:
+            touched_dex = list(self._merge(self._dex, dex_data, DEX_FIELDS, partial, changes, "dex"))
+        if p2p_data is not None:
+            touched_p2p = self._merge_p2p(p2p_data, partial, changes)
+
+        cex_pairs: dict[Hashable, tuple[tuple[Hashable, ...], dict[str, Any] | None]] = {}
+        for symbol, exchange in touched_cex:
+            row = self._cex.get(symbol, {}).get(exchange)
+            if row is None:
+                continue
+            for other in self._cex[symbol].values():
+                for buy, sell in ((row, other), (other, row)):
+                    key = ("cex-cex", symbol, buy["exchange"], sell["exchange"])
+                    if key not in cex_pairs:
+                        quotes = (("cex", symbol, buy["exchange"]), ("cex", symbol, sell["exchange"]))
+                        cex_pairs[key] = (quotes, self.analyzer.cex_pair(symbol, buy, sell))
+        pending = [(key, quotes, opp) for key, (quotes, opp) in cex_pairs.items()]
+        passing = [opp for _, _, opp in pending if opp is not None and self._passes(opp)]
+        if passing:
+            rows = [row for markets in self._cex.values() for row in markets.values()]
+            self.analyzer.execution.apply(passing, rows, self.min_profit_percent)
+
+        dex_pairs: set[tuple[str, str, str]] = set()
+        for symbol, exchange in touched_cex:
+            dex_pairs.update((symbol, dex_exchange, exchange) for dex_exchange in self._dex.get(symbol, {}))
+        for symbol, exchange in touched_dex:
+            dex_pairs.update((symbol, exchange, cex_exchange) for cex_exchange in self._cex.get(symbol, {}))
+        for symbol, dex_exchange, cex_exchange in sorted(dex_pairs):
+            dex = self._dex.get(symbol, {}).get(dex_exchange)
+            cex = self._cex.get(symbol, {}).get(cex_exchange)
+            if dex is not None and cex is not None:
+                key = ("dex-cex", symbol, dex_exchange, cex_exchange)
+                quotes = (("dex", symbol, dex_exchange), ("cex", symbol, cex_exchange))
+                pending.append((key, quotes, self.analyzer.dex_pair(dex, cex)))
+
+        seen_p2p: set[Hashable] = set()
+        for group in touched_p2p:
+            if not self._p2p.get(group):
+                continue
+            for other_group in list(self._p2p):
+                if other_group[2] != group[2] or other_group[0] == group[0]:
+                    continue
+                for buy_group, sell_group in ((group, other_group), (other_group, group)):
+                    key = ("p2p", buy_group, sell_group)
+                    if key not in seen_p2p:
+                        seen_p2p.add(key)
+                        quotes = (("p2p",) + buy_group, ("p2p",) + sell_group)
+                        buy, sell = self._p2p[buy_group][0], self._p2p[sell_group][1]
+                        pending.append((key, quotes, self.analyzer.p2p_pair(buy, sell)))
+
+        for key, quotes, opp in pending:
+            self._commit(key, quotes, opp, changes)
+
+        for exchange in graph_exchanges:
+            rows = [markets[exchange] for markets in self._cex.values() if exchange in markets]
+            cycles = {("triangle", opp["route"]): opp for opp in self.graph.find_exchange(exchange, rows)}
+            quote = ("graph", exchange)
+            for key in self._by_quote.get(quote, set()) - set(cycles):
+                self._commit(key, (quote,), None, changes)
+            for key, opp in cycles.items():
+                self._commit(key, (quote,), opp, changes)
+        return changes
+
+    def _passes(self, opp: dict[str, Any]) -> bool:
+        return float(opp.get("spread_percent", 0)) >= self.min_profit_percent
+
+    def _commit(
+        self,
+        key: Hashable,
+        quotes: tuple[Hashable, ...],
+        opp: dict[str, Any] | None,
+        changes: OpportunityChanges,
+    ) -> None:
+        old = self._opportunities.get(key)
+        if opp is not None and self._passes(opp):
+            opp["grade"] = classify_opportunity(float(opp.get("spread_percent", 0)))
+            if old is None:
+                changes.appeared.append(opp)
+            elif old != opp:
+                changes.changed.append(opp)
+            else:
+                return
+            self._opportunities[key] = opp
+            self._quotes_of[key] = quotes
+            for quote in quotes:
+                self._by_quote[quote].add(key)
+        elif old is not None:
+            self._drop(key, changes)
+
+    def _drop(self, key: Hashable, changes: OpportunityChanges) -> None:
+        opp = self._opportunities.pop(key, None)
+        if opp is not None:
+            changes.disappeared.append(opp)
+        for quote in self._quotes_of.pop(key, ()):
+            self._by_quote[quote].discard(key)
+
+    def _drop_quote(self, quote: Hashable, changes: OpportunityChanges) -> None:
+        for key in list(self._by_quote.pop(quote, ())):
+            self._drop(key, changes)
+
+    def _merge(
+        self,
+        state: dict[str, dict[str, dict[str, Any]]],
+        rows: Iterable[dict[str, Any]],
+        fields: tuple[str, ...],
+        partial: bool,
+        changes: OpportunityChanges,
+        kind: str,
+    ) -> Iterable[tuple[str, str]]:
+        incoming: dict[tuple[str, str], dict[str, Any]] = {}
+        for row in rows:
+            incoming[(row.get("symbol", ""), row.get("exchange", ""))] = row
+
+        touched: list[tuple[str, str]] = []
+        if not partial:
+            for symbol, markets in list(state.items()):
+                for exchange in [x for x in markets if (symbol, x) not in incoming]:
+                    del markets[exchange]
+                    self._drop_quote((kind, symbol, exchange), changes)
+                    touched.append((symbol, exchange))
+                if not markets:
+                    del state[symbol]
+        for (symbol, exchange), row in incoming.items():
+            old = state.get(symbol, {}).get(exchange)
+            if old is not None and all(old.get(f) == row.get(f) for f in fields):
+                continue
+            state[symbol][exchange] = row
+            touched.append((symbol, exchange))
+        return touched
+
+    def _merge_p2p(self, rows: list[dict[str, Any]], partial: bool, changes: OpportunityChanges) -> list[tuple[str, str, str]]:
+        # пары считаются по вершине стакана группы, изменения глубже неё пересчёта не вызывают
+        incoming = self.analyzer.p2p_top_of_book(rows)
+
+        touched: list[tuple[str, str, str]] = []
+        if not partial:
+            for group in [g for g in self._p2p if g not in incoming]:
+                del self._p2p[group]
+                self._drop_quote(("p2p",) + group, changes)
+        for group, book in incoming.items():
+            old = self._p2p.get(group)
+            if old is not None and self._fingerprint(old) == self._fingerprint(book):
+                continue
+            self._p2p[group] = book
+            touched.append(group)
+        return touched
+
+    @staticmethod
+    def _fingerprint(ads: tuple[dict[str, Any], ...]) -> list[tuple[Any, ...]]:
+        return [tuple(ad.get(f) for f in P2P_FIELDS) for ad in ads]
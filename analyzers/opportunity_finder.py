@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from bisect import bisect_right
 from typing import Any
 
 
@@ -18,3 +19,29 @@ def filter_opportunities(opportunities: list[dict[str, Any]], min_profit: float,
     if strategy != "all":
         out = [o for o in out if o.get("type") == strategy]
     return sorted(out, key=lambda x: x.get("spread_percent", 0), reverse=True)
+
+
+class OpportunityIndex:
+    """Готовый набор возможностей скана, упорядоченный по спреду отдельно для каждой стратегии.
+
+    Топ пользователя — бинарный поиск по порогу и срез, порядок совпадает с `filter_opportunities`.
+    """
+
+    def __init__(self, opportunities: list[dict[str, Any]]) -> None:
+        ordered = sorted(opportunities, key=lambda x: -float(x.get("spread_percent", 0)))
+        self._items: dict[str, list[dict[str, Any]]] = {"all": ordered}
+        for opp in ordered:
+            self._items.setdefault(str(opp.get("type")), []).append(opp)
+        self._keys = {strategy: [-float(x.get("spread_percent", 0)) for x in items] for strategy, items in self._items.items()}
+
+    def __len__(self) -> int:
+        return len(self._items["all"])
+
+    def top(self, min_profit: float, strategy: str = "all", limit: int | None = None) -> list[dict[str, Any]]:
+        items = self._items.get(strategy)
+        if not items:
+            return []
+        end = bisect_right(self._keys[strategy], -min_profit)
+        if limit is not None:
+            end = min(end, limit)
+        return items[:end]
@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, Sequence
+
+import numpy as np
+
+from analyzers.arbitrage_analyzer import ArbitrageAnalyzer
+from data.ticks import KINDS, TickStore
+
+SPREAD_PERCENTILES = (50, 90, 99)
+
+
+@dataclass
+class ReplayConfig:
+    min_profit_percent: float = 0.5
+    strategy: str = "all"
+    dex_fees_abs: float = 1.5
+    p2p_fees_abs: float = 1.0
+    max_cycle_length: int = 4
+    # разрыв записи длиннее этого (бот лежал) обрывает все открытые эпизоды, котировки старше него
+    # выпадают из состояния рынка
+    max_gap_sec: float = 300.0
+    # группы тиков ближе этого к началу пачки складываются в одно состояние до прогона анализатора
+    step_sec: float = 1.0
+
+
+@dataclass
+class SliceResult:
+    snapshots: int = 0
+    first_ts: float = 0.0
+    last_ts: float = 0.0
+    spreads: dict[str, np.ndarray] = field(default_factory=dict)
+    # (route, start, last_seen, snapshots, открыт на первом снапшоте слайса, открыт на последнем)
+    episodes: list[tuple[str, float, float, int, bool, bool]] = field(default_factory=list)
+
+
+@dataclass
+class ReplayReport:
+    snapshots: int
+    opportunities: int
+    by_type: dict[str, int]
+    spread: dict[str, dict[str, float]]
+    persistence: dict[str, float]
+    replayed_sec: float
+    elapsed_sec: float
+
+    @property
+    def speedup(self) -> float:
+        return self.replayed_sec / self.elapsed_sec if self.elapsed_sec > 0 else 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {**asdict(self), "speedup": self.speedup}
+
+
+class MarketState:
+    """Последние записанные котировки: рекордер пишет каждую загрузку парсера отдельной группой тиков.
+
+    CEX/DEX-строки заменяются по (биржа, символ), объявления P2P — целиком по (площадка, актив, фиат).
+    """
+
+    def __init__(self) -> None:
+        self.cex: dict[tuple[str, str], tuple[float, dict[str, Any]]] = {}
+        self.dex: dict[tuple[str, str], tuple[float, dict[str, Any]]] = {}
+        self.p2p: dict[tuple[str, str, str], tuple[float, list[dict[str, Any]]]] = {}
+
+    def apply(self, ts: float, cex: list[dict[str, Any]], dex: list[dict[str, Any]], p2p: list[dict[str, Any]]) -> None:
+        for row in cex:
+            self.cex[(row["exchange"], row["symbol"])] = (ts, row)
+        for row in dex:
+            self.dex[(row["exchange"], row["symbol"])] = (ts, row)
+        groups: dict[tuple[str, str, str], list[dict[str, Any]]] = {}
+        for ad in p2p:
+            groups.setdefault((ad["exchange"], ad["asset"], ad["fiat"]), []).append(ad)
+        for group, ads in groups.items():
+            self.p2p[group] = (ts, ads)
+
+    def snapshot(self, since: float) -> tuple[list[dict[str, Any]], list[dict[str, Any]], list[dict[str, Any]]]:
+        for quotes in (self.cex, self.dex, self.p2p):
+            for key in [key for key, (ts, _) in quotes.items() if ts < since]:
+                del quotes[key]
+        cex = [row for _, row in self.cex.values()]
+        dex = [row for _, row in self.dex.values()]
+        return cex, dex, [ad for _, ads in self.p2p.values() for ad in ads]
+
+
+def iter_snapshots(store: TickStore, path: Path) -> Iterator[tuple[float, list[dict[str, Any]], list[dict[str, Any]], list[dict[str, Any]]]]:
+    """Восстанавливает из чанка группы тиков (ts, cex, dex, p2p) в формате парсеров.
+
+    Одна группа — одна записанная загрузка (или пачка обновлений стрима), она целиком лежит в одном
+    чанке, поэтому группировка по ts внутри чанка достаточна. NaN-поля в строки не попадают.
+    """
+    chunk = store.load_chunk(path)
+    ts = np.asarray(chunk["ts"])
+    if not ts.size:
+        return
+    symbols, exchanges = store.dictionary["symbol"], store.dictionary["exchange"]
+    columns = {name: np.asarray(values).tolist() for name, values in chunk.items()}
+    bounds = [0, *(np.flatnonzero(np.diff(ts)) + 1).tolist(), len(ts)]
+    cex_kind, dex_kind, _ = range(len(KINDS))
+    for start, end in zip(bounds, bounds[1:]):
+        cex: list[dict[str, Any]] = []
+        dex: list[dict[str, Any]] = []
+        p2p: list[dict[str, Any]] = []
+        for i in range(start, end):
+            kind, symbol, exchange = columns["kind"][i], symbols[columns["symbol"][i]], exchanges[columns["exchange"][i]]
+            if kind == cex_kind:
+                row = {
+                    "bid": columns["bid"][i],
+                    "ask": columns["ask"][i],
+                    "spot_price": columns["price"][i],
+                    "orderbook_depth": columns["depth"][i],
+                    "maker_fee": columns["maker_fee"][i],
+                    "taker_fee": columns["taker_fee"][i],
+                }
+                cex.append({"exchange": exchange, "symbol": symbol, **{k: v for k, v in row.items() if v == v}})
+            elif kind == dex_kind:
+                dex.append({"exchange": exchange, "symbol": symbol, "price": columns["price"][i], "liquidity": columns["depth"][i]})
+            else:
+                asset, _, fiat = symbol.partition("/")
+                p2p.append(
+                    {
+                        "exchange": exchange,
+                        "asset": asset,
+                        "fiat": fiat,
+                        "price": columns["price"][i],
+                        "min_limit": columns["min_limit"][i],
+                        "max_limit": columns["max_limit"][i],
+                    }
+                )
+        yield float(ts[start]), cex, dex, p2p
+
+
+def replay_slice(root: str, paths: Sequence[str], config: ReplayConfig, warmup: str | None = None) -> SliceResult:
+    """Прогоняет подряд идущие чанки через ArbitrageAnalyzer.find (выполняется в воркере).
+
+    Тики накладываются на `MarketState`, анализатор видит состояние рынка раз в `step_sec`. Чанк
+    `warmup` (последний из предыдущего слайса) только наполняет состояние, чтобы слайс начинался
+    с того же рынка, что и последовательный прогон.
+    """
+    store = TickStore(root)
+    analyzer = ArbitrageAnalyzer(
+        max_cycle_length=config.max_cycle_length,
+        depth_sizes_usd=(),
+        dex_fees_abs=config.dex_fees_abs,
+        p2p_fees_abs=config.p2p_fees_abs,
+    )
+    result = SliceResult()
+    spreads: dict[str, list[float]] = {}
+    open_: dict[str, list[Any]] = {}  # route -> [start, last_seen, snapshots, at_first]
+    prev_ts: float | None = None
+    market = MarketState()
+    if warmup is not None:
+        for ts, cex, dex, p2p in iter_snapshots(store, Path(warmup)):
+            market.apply(ts, cex, dex, p2p)
+
+    def close(route: str, at_last: bool) -> None:
+        start, last, seen, at_first = open_.pop(route)
+        result.episodes.append((route, start, last, seen, at_first, at_last))
+
+    def evaluate(ts: float) -> None:
+        nonlocal prev_ts
+        if prev_ts is not None and ts - prev_ts > config.max_gap_sec:
+            for route in list(open_):
+                close(route, False)
+        cex, dex, p2p = market.snapshot(ts - config.max_gap_sec)
+        opportunities = analyzer.find(cex, dex, p2p, config.min_profit_percent, strategy=config.strategy)
+        routes = {opp["route"] for opp in opportunities}
+        for opp in opportunities:
+            spreads.setdefault(opp["type"], []).append(float(opp["spread_percent"]))
+        for route in [r for r in open_ if r not in routes]:
+            close(route, False)
+        for route in routes:
+            if route in open_:
+                open_[route][1] = ts
+                open_[route][2] += 1
+            else:
+                open_[route] = [ts, ts, 1, result.snapshots == 0]
+        if result.snapshots == 0:
+            result.first_ts = ts
+        result.snapshots += 1
+        result.last_ts = prev_ts = ts
+
+    batch_start: float | None = None
+    applied_ts = 0.0
+    for path in paths:
+        for ts, cex, dex, p2p in iter_snapshots(store, Path(path)):
+            if batch_start is not None and ts - batch_start >= config.step_sec:
+                evaluate(applied_ts)
+                batch_start = None
+            market.apply(ts, cex, dex, p2p)
+            batch_start = ts if batch_start is None else batch_start
+            applied_ts = ts
+    if batch_start is not None:
+        evaluate(applied_ts)
+    for route in list(open_):
+        close(route, True)
+    result.spreads = {kind: np.array(values) for kind, values in spreads.items()}
+    return result
+
+
+class ReplayEngine:
+    """Офлайн-реплей записанных TickRecorder снапшотов через ArbitrageAnalyzer.
+
+    Чанки делятся на подряд идущие временные слайсы и считаются в пуле процессов; эпизоды
+    (маршрут виден в подряд идущих снапшотах), пересекающие границу слайсов, склеиваются при сборке.
+    """
+
+    def __init__(self, root: str, config: ReplayConfig | None = None, workers: int | None = None) -> None:
+        self.store = TickStore(root)
+        self.config = config or ReplayConfig()
+        self.workers = workers or os.cpu_count() or 1
+
+    def slices(self, start_day: str | None = None, end_day: str | None = None) -> list[list[str]]:
+        paths = [str(p) for p in self.store.chunk_paths(start_day, end_day)]
+        count = min(len(paths), self.workers * 4)
+        return [part.tolist() for part in np.array_split(np.array(paths, dtype=object), count)] if count else []
+
+    def run(self, start_day: str | None = None, end_day: str | None = None) -> ReplayReport:
+        started = time.perf_counter()
+        slices = self.slices(start_day, end_day)
+        root = str(self.store.root)
+        warmups = [None] + [paths[-1] for paths in slices[:-1]]
+        if self.workers == 1 or len(slices) <= 1:
+            results = [replay_slice(root, paths, self.config, warmup) for paths, warmup in zip(slices, warmups)]
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(slices))) as pool:
+                results = list(pool.map(replay_slice, [root] * len(slices), slices, [self.config] * len(slices), warmups))
+        return self._report([r for r in results if r.snapshots], time.perf_counter() - started)
+
+    def _report(self, results: list[SliceResult], elapsed: float) -> ReplayReport:
+        spreads: dict[str, list[np.ndarray]] = {}
+        for result in results:
+            for kind, values in result.spreads.items():
+                spreads.setdefault(kind, []).append(values)
+        by_type = {kind: int(sum(len(v) for v in parts)) for kind, parts in sorted(spreads.items())}
+        spread = {kind: self._distribution(np.concatenate(parts)) for kind, parts in sorted(spreads.items())}
+
+        durations, seen = self._episodes(results)
+        persistence: dict[str, float] = {"episodes": float(len(durations))}
+        if durations.size:
+            persistence.update(
+                {
+                    "mean_sec": float(durations.mean()),
+                    **{f"p{q}_sec": float(np.percentile(durations, q)) for q in SPREAD_PERCENTILES},
+                    "max_sec": float(durations.max()),
+                    "mean_snapshots": float(seen.mean()),
+                }
+            )
+        return ReplayReport(
+            snapshots=sum(r.snapshots for r in results),
+            opportunities=sum(by_type.values()),
+            by_type=by_type,
+            spread=spread,
+            persistence=persistence,
+            replayed_sec=results[-1].last_ts - results[0].first_ts if results else 0.0,
+            elapsed_sec=elapsed,
+        )
+
+    def _episodes(self, results: list[SliceResult]) -> tuple[np.ndarray, np.ndarray]:
+        durations: list[float] = []
+        seen: list[int] = []
+        carry: dict[str, tuple[float, int]] = {}  # эпизоды, открытые на конце предыдущего слайса
+        prev_last: float | None = None
+        for result in results:
+            joined = prev_last is not None and result.first_ts - prev_last <= self.config.max_gap_sec
+            continued: dict[str, tuple[float, int]] = {}
+            for route, start, last, count, at_first, at_last in result.episodes:
+                if joined and at_first and route in carry:
+                    prev_start, prev_count = carry.pop(route)
+                    start, count = prev_start, prev_count + count
+                if at_last:
+                    continued[route] = (start, count)
+                    continue
+                durations.append(last - start)
+                seen.append(count)
+            for start, count in carry.values():
+                durations.append(prev_last - start if prev_last is not None else 0.0)
+                seen.append(count)
+            carry, prev_last = continued, result.last_ts
+        # эпизоды, открытые в конце записи, учитываются по последнему снапшоту
+        for start, count in carry.values():
+            durations.append((prev_last or start) - start)
+            seen.append(count)
+        return np.array(durations, dtype=np.float64), np.array(seen, dtype=np.float64)
+
+    @staticmethod
+    def _distribution(values: np.ndarray) -> dict[str, float]:
+        return {
+            "count": float(values.size),
+            "mean": float(values.mean()),
+            "min": float(values.min()),
+            **{f"p{q}": float(np.percentile(values, q)) for q in SPREAD_PERCENTILES},
+            "max": float(values.max()),
+        }
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    from config import get_settings
+
+    settings = get_settings()
+    parser = argparse.ArgumentParser(
+        prog="python -m analyzers.replay",
+        description="Реплей записанных снапшотов рынка через ArbitrageAnalyzer быстрее реального времени.",
+    )
+    parser.add_argument("--ticks", default=settings.ticks_dir, help="каталог TickStore")
+    parser.add_argument("--start", help="первый день, YYYY-MM-DD")
+    parser.add_argument("--end", help="последний день, YYYY-MM-DD")
+    parser.add_argument("--min-profit", type=float, default=settings.min_profit_percent)
+    parser.add_argument("--strategy", default="all")
+    parser.add_argument("--dex-fee", type=float, default=settings.dex_fees_abs)
+    parser.add_argument("--p2p-fee", type=float, default=settings.p2p_fees_abs)
+    parser.add_argument("--max-cycle-length", type=int, default=settings.graph_max_cycle_length)
+    parser.add_argument("--max-gap-sec", type=float, default=ReplayConfig.max_gap_sec)
+    parser.add_argument("--step-sec", type=float, default=ReplayConfig.step_sec)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", help="куда записать JSON-отчёт (по умолчанию stdout)")
+    args = parser.parse_args(argv)
+
+    config = ReplayConfig(
+        min_profit_percent=args.min_profit,
+        strategy=args.strategy,
+        dex_fees_abs=args.dex_fee,
+        p2p_fees_abs=args.p2p_fee,
+        max_cycle_length=args.max_cycle_length,
+        max_gap_sec=args.max_gap_sec,
+        step_sec=args.step_sec,
+    )
+    report = ReplayEngine(args.ticks, config, workers=args.workers).run(args.start, args.end)
+    payload = json.dumps(report.to_dict(), ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(payload, encoding="utf-8")
+    else:
+        sys.stdout.write(payload + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
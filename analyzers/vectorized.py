@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+from typing import Any
+
+import numpy as np
+
+
+class SymbolMatrix:
+    """CEX-котировки, упакованные в матрицы symbol × slot.
+
+    Slot — порядковый номер строки внутри символа (в порядке входных данных), поэтому обход
+    ненулевых элементов в row-major порядке совпадает с порядком вложенных циклов по строкам.
+    """
+
+    def __init__(self, cex_data: list[dict[str, Any]]) -> None:
+        groups: dict[str, list[dict[str, Any]]] = {}
+        for item in cex_data:
+            groups.setdefault(item.get("symbol", ""), []).append(item)
+
+        self.symbols = list(groups)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.rows = list(groups.values())
+        width = max((len(rows) for rows in self.rows), default=0)
+        shape = (len(self.rows), width)
+
+        ordered = [row for rows in self.rows for row in rows]
+        sym_idx = np.repeat(np.arange(len(self.rows)), [len(rows) for rows in self.rows])
+        slot_idx = np.concatenate([np.arange(len(rows)) for rows in self.rows]) if self.rows else sym_idx
+        codes: dict[str, int] = {}
+
+        def pack(values: list[float], fill: float = 0.0, dtype: Any = float) -> np.ndarray:
+            out = np.full(shape, fill, dtype=dtype)
+            out[sym_idx, slot_idx] = values
+            return out
+
+        self.ask = pack([float(row.get("ask") or row.get("spot_price") or 0) for row in ordered])
+        self.bid = pack([float(row.get("bid") or row.get("spot_price") or 0) for row in ordered])
+        self.taker_fee = pack([float(row.get("taker_fee", 0)) for row in ordered])
+        self.maker_fee = pack([float(row.get("maker_fee", 0)) for row in ordered])
+        self.depth = pack([float(row.get("orderbook_depth", 0)) for row in ordered])
+        self.exchange = pack([codes.setdefault(row["exchange"], len(codes)) for row in ordered], -1, np.int64)
+
+
+class VectorizedSpreadEngine:
+    """Расчёт cex-cex и dex-cex спредов броадкастингом NumPy.
+
+    Формулы и порядок операций те же, что в `ArbitrageAnalyzer._cex_to_cex`/`_dex_to_cex`,
+    поэтому результаты совпадают побитово. Словари создаются только для пар со спредом
+    не ниже `min_profit` (если он задан).
+    """
+
+    def __init__(self, dex_fees_abs: float = 1.5) -> None:
+        self.dex_fees_abs = dex_fees_abs
+
+    def cex_to_cex(self, matrix: SymbolMatrix, min_profit: float | None = None) -> list[dict[str, Any]]:
+        if not matrix.rows:
+            return []
+        buy = matrix.ask[:, :, None]
+        sell = matrix.bid[:, None, :]
+        fee = matrix.taker_fee[:, :, None] * buy + matrix.maker_fee[:, None, :] * sell
+        with np.errstate(divide="ignore", invalid="ignore"):
+            spread = ((sell - buy - fee) / buy) * 100
+
+        mask = (buy > 0) & (sell > 0) & (matrix.exchange[:, :, None] != matrix.exchange[:, None, :])
+        if min_profit is not None:
+            mask &= spread >= min_profit
+
+        s_idx, i_idx, j_idx = np.nonzero(mask)
+        buy_prices = matrix.ask[s_idx, i_idx].tolist()
+        sell_prices = matrix.bid[s_idx, j_idx].tolist()
+        fees = fee[s_idx, i_idx, j_idx].tolist()
+        spreads = spread[s_idx, i_idx, j_idx].tolist()
+        buy_depth = matrix.depth[s_idx, i_idx].tolist()
+        sell_depth = matrix.depth[s_idx, j_idx].tolist()
+
+        out: list[dict[str, Any]] = []
+        for n, (s, i, j) in enumerate(zip(s_idx.tolist(), i_idx.tolist(), j_idx.tolist())):
+            rows = matrix.rows[s]
+            out.append(
+                {
+                    "type": "cex-cex",
+                    "route": f"{rows[i]['exchange']} -> {rows[j]['exchange']} ({matrix.symbols[s]})",
+                    "symbol": matrix.symbols[s],
+                    "buy_exchange": rows[i]["exchange"],
+                    "sell_exchange": rows[j]["exchange"],
+                    "buy_price": buy_prices[n],
+                    "sell_price": sell_prices[n],
+                    "fees": fees[n],
+                    "spread_percent": spreads[n],
+                    "liquidity": min(buy_depth[n], sell_depth[n]),
+                }
+            )
+        return out
+
+    def dex_to_cex(
+        self,
+        dex_data: list[dict[str, Any]],
+        matrix: SymbolMatrix,
+        min_profit: float | None = None,
+    ) -> list[dict[str, Any]]:
+        dex_rows = [dex for dex in dex_data if dex.get("symbol") in matrix.index]
+        if not dex_rows:
+            return []
+        sym_idx = np.array([matrix.index[dex["symbol"]] for dex in dex_rows], dtype=np.int64)
+        buy = np.array([float(dex.get("price") or 0) for dex in dex_rows])[:, None]
+        liquidity = [float(dex.get("liquidity", 0)) for dex in dex_rows]
+        sell = matrix.bid[sym_idx]
+        fees = self.dex_fees_abs
+        with np.errstate(divide="ignore", invalid="ignore"):
+            spread = ((sell - buy - fees) / buy) * 100
+
+        mask = (buy > 0) & (sell > 0)
+        if min_profit is not None:
+            mask &= spread >= min_profit
+
+        d_idx, k_idx = np.nonzero(mask)
+        buy_prices = buy[d_idx, 0].tolist()
+        sell_prices = sell[d_idx, k_idx].tolist()
+        spreads = spread[d_idx, k_idx].tolist()
+        cex_depth = matrix.depth[sym_idx[d_idx], k_idx].tolist()
+
+        out: list[dict[str, Any]] = []
+        for n, (d, k) in enumerate(zip(d_idx.tolist(), k_idx.tolist())):
+            dex = dex_rows[d]
+            cex = matrix.rows[sym_idx[d]][k]
+            out.append(
+                {
+                    "type": "dex-cex",
+                    "route": f"{dex['exchange']} -> {cex['exchange']} ({dex['symbol']})",
+                    "symbol": dex["symbol"],
+                    "buy_exchange": dex["exchange"],
+                    "sell_exchange": cex["exchange"],
+                    "buy_price": buy_prices[n],
+                    "sell_price": sell_prices[n],
+                    "fees": fees,
+                    "spread_percent": spreads[n],
+                    "liquidity": min(liquidity[d], cex_depth[n]),
+                }
+            )
+        return out
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from parsers.order_book_store import CompactBook
+
+P2P_EXCHANGES = ("binance_p2p", "bybit_p2p", "garantex_p2p")
+P2P_FIATS = ("RUB", "RUB", "RUB", "KZT")
+OPPORTUNITY_TYPES = ("cex-cex", "dex-cex", "p2p", "triangle")
+
+
+@dataclass(frozen=True)
+class Scale:
+    exchanges: int
+    symbols: int
+    dex_rows: int
+    p2p_ads: int
+    opportunities: int
+    db_rows: int
+    excel_rows: int
+
+
+SCALES = {
+    "small": Scale(exchanges=5, symbols=50, dex_rows=20, p2p_ads=200, opportunities=2_000, db_rows=2_000, excel_rows=200),
+    "realistic": Scale(exchanges=12, symbols=300, dex_rows=100, p2p_ads=1_000, opportunities=20_000, db_rows=20_000, excel_rows=2_000),
+    "extreme": Scale(exchanges=100, symbols=2_000, dex_rows=500, p2p_ads=10_000, opportunities=200_000, db_rows=200_000, excel_rows=20_000),
+}
+
+
+def symbols(count: int) -> list[str]:
+    """BTC/ETH и `count` альткоинов к USDT; у каждого пятого есть рынок к BTC, чтобы в графе были циклы."""
+    out = ["BTC/USDT", "ETH/USDT", "ETH/BTC"]
+    for i in range(max(count - len(out), 0)):
+        out.append(f"T{i:04d}/USDT")
+        if i % 5 == 0:
+            out.append(f"T{i:04d}/BTC")
+    return out[: max(count, 3)]
+
+
+def _book(rng: random.Random, bid: float, ask: float, levels: int) -> CompactBook:
+    bids = [[bid * (1 - 0.0005 * n), rng.uniform(0.5, 20.0)] for n in range(levels)]
+    asks = [[ask * (1 + 0.0005 * n), rng.uniform(0.5, 20.0)] for n in range(levels)]
+    return CompactBook.from_levels(bids, asks)
+
+
+def base_prices(names: list[str], seed: int = 0) -> dict[str, float]:
+    """Справедливая цена каждого символа; одна и та же для CEX и DEX при одном seed."""
+    rng = random.Random(seed + 5)
+    usd = {"BTC": 60_000.0, "ETH": 3_000.0, "USDT": 1.0}
+    for name in names:
+        usd.setdefault(name.partition("/")[0], rng.lognormvariate(0, 2))
+    return {name: usd[name.partition("/")[0]] / usd[name.partition("/")[2]] for name in names}
+
+
+def cex_rows(scale: Scale, seed: int = 0, book_levels: int = 5, dislocated: float = 0.02) -> list[dict[str, Any]]:
+    """Котировки `exchanges × symbols` с шумом ±0.3%; у доли `dislocated` символов одна биржа дешевле на 2%."""
+    rng = random.Random(seed)
+    names = symbols(scale.symbols)
+    base = base_prices(names, seed)
+    rows: list[dict[str, Any]] = []
+    for name in names:
+        mid = base[name]
+        cheap = rng.randrange(scale.exchanges) if rng.random() < dislocated else -1
+        for ex in range(scale.exchanges):
+            price = mid * rng.uniform(0.997, 1.003) * (0.98 if ex == cheap else 1.0)
+            bid, ask = price * 0.99975, price * 1.00025
+            book = _book(rng, bid, ask, book_levels)
+            rows.append(
+                {
+                    "source": "CCXT",
+                    "exchange": f"cex{ex:03d}",
+                    "symbol": name,
+                    "spot_price": price,
+                    "bid": bid,
+                    "ask": ask,
+                    "orderbook_depth": book.total_size(),
+                    "book": book,
+                    "maker_fee": 0.001,
+                    "taker_fee": 0.001,
+                }
+            )
+    return rows
+
+
+def dex_rows(scale: Scale, seed: int = 0) -> list[dict[str, Any]]:
+    rng = random.Random(seed + 1)
+    base = base_prices(symbols(scale.symbols), seed)
+    names = [name for name in base if name.endswith("/USDT")]
+    return [
+        {
+            "source": "CoinCap",
+            "exchange": f"dex{n % 4}",
+            "symbol": name,
+            "price": base[name] * rng.uniform(0.98, 1.01),
+            "liquidity": rng.uniform(1e4, 1e8),
+            "network": "ethereum",
+        }
+        for n, name in enumerate(rng.choices(names, k=scale.dex_rows))
+    ]
+
+
+def p2p_ads(scale: Scale, seed: int = 0) -> list[dict[str, Any]]:
+    rng = random.Random(seed + 2)
+    ads: list[dict[str, Any]] = []
+    for _ in range(scale.p2p_ads):
+        fiat = rng.choice(P2P_FIATS)
+        price = (90.0 if fiat == "RUB" else 470.0) * rng.uniform(0.98, 1.03)
+        low = rng.choice((500.0, 1_000.0, 5_000.0))
+        ads.append(
+            {
+                "exchange": rng.choice(P2P_EXCHANGES),
+                "asset": "USDT",
+                "fiat": fiat,
+                "price": price,
+                "min_limit": low,
+                "max_limit": low * rng.uniform(10, 200),
+                "merchant": rng.random() < 0.3,
+                "payments": ["Tinkoff"],
+            }
+        )
+    return ads
+
+
+def opportunities(count: int, seed: int = 0) -> list[dict[str, Any]]:
+    rng = random.Random(seed + 3)
+    return [
+        {
+            "type": rng.choice(OPPORTUNITY_TYPES),
+            "route": f"cex{rng.randrange(100):03d} -> cex{rng.randrange(100):03d} (T{rng.randrange(2000):04d}/USDT)",
+            "buy_price": 100.0,
+            "sell_price": 101.0,
+            "fees": 0.2,
+            "spread_percent": rng.expovariate(1.0),
+            "liquidity": rng.uniform(100, 50_000),
+        }
+        for _ in range(count)
+    ]
+
+
+def write_strategy_workbook(path: Path, rows: int, seed: int = 0) -> Path:
+    """xlsx в формате «Базы связок»: несколько листов со строками шагов, спредов и требований."""
+    import pandas as pd
+
+    rng = random.Random(seed + 4)
+    steps = (
+        "Тинькофф -> Binance P2P -> Bybit P2P -> Сбер",
+        "Binance -> Uniswap swap -> OKX",
+        "Bybit -> Huobi (TRC20)",
+        "SWIFT -> Золотая корона -> KZT",
+    )
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for sheet in ("P2P", "DEX", "CEX"):
+            frame = pd.DataFrame(
+                {
+                    "Связка": [rng.choice(steps) for _ in range(rows // 3)],
+                    "Спред": [f"{rng.uniform(0.2, 5):.2f}%" for _ in range(rows // 3)],
+                    "Требования": [rng.choice(("KYC, лимит 100к", "мерчант, банк", "BEP20", "")) for _ in range(rows // 3)],
+                }
+            )
+            frame.to_excel(writer, sheet_name=sheet, index=False)
+    return path
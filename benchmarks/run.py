@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Sequence
+
+import numpy as np
+
+from analyzers.arbitrage_analyzer import ArbitrageAnalyzer
+from analyzers.graph_arbitrage import GraphArbitrageEngine
+from analyzers.opportunity_finder import filter_opportunities
+from analyzers.vectorized import SymbolMatrix, VectorizedSpreadEngine
+from benchmarks import generators
+from benchmarks.generators import Scale
+from data.database import Database
+from parsers.excel_parser import ExcelStrategyParser
+
+DB_BATCH_SIZE = 500
+HISTORY_USERS = 100
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def _timed(fn: Callable[[], Any], repeat: int) -> list[float]:
+    runs: list[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - started)
+    return runs
+
+
+async def _timed_async(fn: Callable[[], Awaitable[Any]], repeat: int) -> list[float]:
+    runs: list[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        runs.append(time.perf_counter() - started)
+    return runs
+
+
+def bench_find_cex_dex(scale: Scale, repeat: int, seed: int) -> tuple[int, list[float]]:
+    cex, dex = generators.cex_rows(scale, seed), generators.dex_rows(scale, seed)
+    analyzer = ArbitrageAnalyzer(max_cycle_length=3)
+    return len(cex) + len(dex), _timed(lambda: analyzer.find(cex, dex, [], 0.5), repeat)
+
+
+def bench_find_vectorized(scale: Scale, repeat: int, seed: int) -> tuple[int, list[float]]:
+    # только матричный cex-cex/dex-cex, без графа и стаканов — чтобы регрессия одной части не пряталась в другой
+    cex, dex = generators.cex_rows(scale, seed), generators.dex_rows(scale, seed)
+    engine = VectorizedSpreadEngine(ArbitrageAnalyzer.dex_fees_abs)
+
+    def run() -> None:
+        matrix = SymbolMatrix(cex)
+        engine.cex_to_cex(matrix, min_profit=0.5)
+        engine.dex_to_cex(dex, matrix, min_profit=0.5)
+
+    return len(cex) + len(dex), _timed(run, repeat)
+
+
+def bench_find_graph(scale: Scale, repeat: int, seed: int) -> tuple[int, list[float]]:
+    # поиск циклов по всем биржам без бюджета времени; граф переиспользуется между повторами, как между сканами
+    cex = generators.cex_rows(scale, seed)
+    engine = GraphArbitrageEngine(max_cycle_length=4)
+    return len(cex), _timed(lambda: engine.find(cex), repeat)
+
+
+def bench_find_p2p(scale: Scale, repeat: int, seed: int) -> tuple[int, list[float]]:
+    ads = generators.p2p_ads(scale, seed)
+    analyzer = ArbitrageAnalyzer()
+    return len(ads), _timed(lambda: analyzer.find([], [], ads, 0.5), repeat)
+
+
+def bench_filter_opportunities(scale: Scale, repeat: int, seed: int) -> tuple[int, list[float]]:
+    opps = generators.opportunities(scale.opportunities, seed)
+    return len(opps), _timed(lambda: filter_opportunities(opps, min_profit=0.5, strategy="cex-cex"), repeat)
+
+
+def bench_db_save_opportunity(scale: Scale, repeat: int, seed: int) -> tuple[int, list[float]]:
+    # одиночные вставки — по транзакции на строку, поэтому объём на порядок меньше пакетного
+    opps = generators.opportunities(max(scale.db_rows // 10, 1), seed)
+
+    async def run(db: Database) -> list[float]:
+        async def save() -> None:
+            for n, opp in enumerate(opps):
+                await db.save_opportunity(n % HISTORY_USERS, opp)
+
+        return await _timed_async(save, repeat)
+
+    return len(opps), _with_db(run)
+
+
+def bench_db_save_batch(scale: Scale, repeat: int, seed: int) -> tuple[int, list[float]]:
+    rows = [Database.opportunity_row(n % HISTORY_USERS, opp) for n, opp in enumerate(generators.opportunities(scale.db_rows, seed))]
+
+    async def run(db: Database) -> list[float]:
+        async def save() -> None:
+            for start in range(0, len(rows), DB_BATCH_SIZE):
+                await db.save_opportunities(rows[start : start + DB_BATCH_SIZE])
+
+        return await _timed_async(save, repeat)
+
+    return len(rows), _with_db(run)
+
+
+def bench_db_history(scale: Scale, repeat: int, seed: int) -> tuple[int, list[float]]:
+    rows = [Database.opportunity_row(n % HISTORY_USERS, opp) for n, opp in enumerate(generators.opportunities(scale.db_rows, seed))]
+
+    async def run(db: Database) -> list[float]:
+        for start in range(0, len(rows), DB_BATCH_SIZE):
+            await db.save_opportunities(rows[start : start + DB_BATCH_SIZE])
+
+        async def query() -> None:
+            for user_id in range(HISTORY_USERS):
+                await db.get_recent_opportunities(user_id, limit=10)
+
+        return await _timed_async(query, repeat)
+
+    return HISTORY_USERS, _with_db(run)
+
+
+def bench_excel_parse(scale: Scale, repeat: int, seed: int) -> tuple[int, list[float]]:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = generators.write_strategy_workbook(Path(tmp) / "strategies.xlsx", scale.excel_rows, seed)
+        parser = ExcelStrategyParser()
+        return scale.excel_rows, _timed(lambda: parser.parse(str(path)), repeat)
+
+
+def _with_db(run: Callable[[Database], Awaitable[list[float]]]) -> list[float]:
+    async def main(path: str) -> list[float]:
+        db = Database(path)
+        await db.init()
+        try:
+            return await run(db)
+        finally:
+            await db.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        return asyncio.run(main(str(Path(tmp) / "bench.db")))
+
+
+BENCHMARKS: dict[str, Callable[[Scale, int, int], tuple[int, list[float]]]] = {
+    "find_cex_dex": bench_find_cex_dex,
+    "find_vectorized": bench_find_vectorized,
+    "find_graph": bench_find_graph,
+    "find_p2p": bench_find_p2p,
+    "filter_opportunities": bench_filter_opportunities,
+    "db_save_opportunity": bench_db_save_opportunity,
+    "db_save_batch": bench_db_save_batch,
+    "db_history": bench_db_history,
+    "excel_parse": bench_excel_parse,
+}
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run_benchmarks(scale_name: str, repeat: int = 3, seed: int = 0, only: Sequence[str] | None = None) -> dict[str, Any]:
+    scale = generators.SCALES[scale_name]
+    results: dict[str, Any] = {}
+    for name, bench in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        items, runs = bench(scale, repeat, seed)
+        median = statistics.median(runs)
+        results[name] = {
+            "items": items,
+            "runs_sec": runs,
+            "min_sec": min(runs),
+            "median_sec": median,
+            "per_item_us": median / items * 1e6 if items else 0.0,
+        }
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "scale": scale_name,
+            "scale_params": scale.__dict__,
+            "repeat": repeat,
+            "seed": seed,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], threshold: float) -> list[str]:
+    """Бенчмарки, у которых медиана выросла больше чем в `threshold` раз относительно baseline."""
+    regressions: list[str] = []
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base["median_sec"]:
+            continue
+        ratio = result["median_sec"] / base["median_sec"]
+        flag = "REGRESSION" if ratio > threshold else ""
+        print(f"{name:24s} {base['median_sec'] * 1e3:10.2f} ms -> {result['median_sec'] * 1e3:10.2f} ms  x{ratio:5.2f} {flag}", file=sys.stderr)
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="Бенчмарки анализа и персистентности на синтетических данных.")
+    parser.add_argument("--scale", choices=sorted(generators.SCALES), default="realistic")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="запустить только перечисленные бенчмарки")
+    parser.add_argument("--output", help="JSON с результатами (по умолчанию benchmarks/results/<commit>-<scale>.json)")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения медиан")
+    parser.add_argument("--threshold", type=float, default=1.2, help="допустимый рост медианы при --compare")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.scale, repeat=args.repeat, seed=args.seed, only=args.only)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{report['meta']['commit'] or 'local'}-{args.scale}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    for name, result in report["results"].items():
+        print(f"{name:24s} n={result['items']:<8d} median {result['median_sec'] * 1e3:10.2f} ms", file=sys.stderr)
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
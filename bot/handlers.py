@@ -10,7 +10,7 @@ from analyzers import ArbitrageAnalyzer
 from bot.keyboards import main_menu, settings_menu
 from bot.messages import format_opportunity, welcome
 from config import get_settings
-from data import Database
+from data import Database, OpportunityWriter, TickRecorder
 from parsers.cex_parser import CEXParser
 from parsers.dex_parser import DEXParser
 from parsers.p2p_parser import P2PParser
@@ -18,10 +18,41 @@ from utils.validators import validate_profit_threshold
 
 settings = get_settings()
 db = Database(settings.database_path)
+writer = OpportunityWriter(
+    db,
+    batch_size=settings.db_write_batch_size,
+    flush_interval_sec=settings.db_write_flush_sec,
+    max_queue=settings.db_write_queue_max,
+)
 cex_parser = CEXParser()
 dex_parser = DEXParser()
 p2p_parser = P2PParser()
-analyzer = ArbitrageAnalyzer()
+if settings.cache_l2_enabled:
+    for parser in (cex_parser, dex_parser, p2p_parser):
+        parser.cache.attach(db)
+recorder = (
+    TickRecorder(
+        settings.ticks_dir,
+        chunk_rows=settings.ticks_chunk_rows,
+        max_pending_rows=settings.ticks_max_pending_rows,
+        max_buffer_sec=settings.ticks_max_buffer_sec,
+    )
+    if settings.ticks_enabled
+    else None
+)
+if recorder is not None:
+    # пишутся только реально загруженные снапшоты со временем загрузки, а не отданные из кэша
+    for kind, parser in (("cex", cex_parser), ("dex", dex_parser), ("p2p", p2p_parser)):
+        parser.cache.on_load = recorder.hook(kind)
+analyzer = ArbitrageAnalyzer(
+    book_store=cex_parser.book_store if settings.cex_streaming else None,
+    max_book_age_sec=settings.stream_max_age_sec,
+    max_cycle_length=settings.graph_max_cycle_length,
+    graph_time_budget_sec=settings.graph_time_budget_ms / 1000 if settings.graph_time_budget_ms > 0 else None,
+    depth_sizes_usd=settings.depth_size_grid_usd,
+    dex_fees_abs=settings.dex_fees_abs,
+    p2p_fees_abs=settings.p2p_fees_abs,
+)
 
 
 async def start(update: Update, context: CallbackContext) -> None:
@@ -87,8 +118,7 @@ async def scan(update: Update, context: CallbackContext) -> None:
     min_profit = float(user["min_profit_percent"]) if user else settings.min_profit_percent
     strategy = str(user["selected_strategy"]) if user else "all"
 
-    symbols = ["BTC/USDT", "ETH/USDT", "SOL/USDT", "ETH/BTC"]
-    cex_data, dex_data, p2p_data = await _collect_data(symbols)
+    cex_data, dex_data, p2p_data = await _collect_data(settings.scan_symbols)
     opportunities = analyzer.find(cex_data, dex_data, p2p_data, min_profit, strategy=strategy)
 
     filtered = [o for o in opportunities if float(o.get("liquidity", 0)) >= settings.min_liquidity_usd]
@@ -99,7 +129,7 @@ async def scan(update: Update, context: CallbackContext) -> None:
 
     top = filtered[:5]
     for op in top:
-        await db.save_opportunity(update.effective_user.id, op)
+        await writer.enqueue(update.effective_user.id, op)
         if update.message:
             await update.message.reply_html(format_opportunity(op))
 
@@ -107,6 +137,7 @@ async def scan(update: Update, context: CallbackContext) -> None:
 async def history(update: Update, context: CallbackContext) -> None:
     if not update.effective_user or not update.message:
         return
+    await writer.flush_user(update.effective_user.id)
     rows = await db.get_recent_opportunities(update.effective_user.id, limit=10)
     if not rows:
         await update.message.reply_text("История пока пустая.")
@@ -120,6 +151,7 @@ async def history(update: Update, context: CallbackContext) -> None:
 async def export_history(update: Update, context: CallbackContext) -> None:
     if not update.effective_user or not update.message:
         return
+    await writer.flush_user(update.effective_user.id)
     rows = await db.get_recent_opportunities(update.effective_user.id, limit=200)
     if not rows:
         await update.message.reply_text("Нет данных для экспорта.")
@@ -157,7 +189,15 @@ async def export_history(update: Update, context: CallbackContext) -> None:
 
 
 async def _collect_data(symbols: list[str]) -> tuple[list[dict[str, Any]], list[dict[str, Any]], list[dict[str, Any]]]:
-    cex_data = await cex_parser.fetch_market_snapshot(symbols)
+    # при живом стриме анализатор читает стаканы из book_store; REST нужен только биржам,
+    # которых стрим не покрывает (нет ccxt.pro/watchOrderBook или стрим отстал)
+    exchanges = settings.enabled_cex
+    if cex_parser.streaming:
+        streamed = cex_parser.book_store.exchanges(max_age_sec=settings.stream_max_age_sec)
+        exchanges = [exchange for exchange in exchanges if exchange not in streamed]
+    cex_data = await cex_parser.fetch_market_snapshot(symbols, exchanges) if exchanges else []
     dex_data = await dex_parser.fetch_coincap_prices(["bitcoin", "ethereum", "solana"])
     p2p_data = await p2p_parser.fetch_all(asset="USDT")
+    if recorder is not None and cex_parser.streaming:
+        recorder.record_books(cex_parser.book_store.rows(max_age_sec=settings.stream_max_age_sec))
     return cex_data, dex_data, p2p_data
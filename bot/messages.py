@@ -22,3 +22,7 @@ def format_opportunity(op: dict[str, Any]) -> str:
         f"Комиссии: {op.get('fees'):.4f}\n"
         f"Ликвидность: {op.get('liquidity'):.2f}"
     )
+
+
+def format_alert(op: dict[str, Any]) -> str:
+    return f"🚨 {op['route']}\nДоходность: {op['spread_percent']:.2f}%"
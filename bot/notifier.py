@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from utils import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 4096
+# с какого числа bucket'ов чатов начинать выбрасывать простаивающие
+CHAT_BUCKETS_SWEEP_AT = 1024
+
+
+@dataclass
+class NotifierStats:
+    enqueued: int = 0
+    coalesced: int = 0
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    queue_depth: int = 0
+    last_lag_sec: float = 0.0
+    max_lag_sec: float = 0.0
+
+
+class Notifier:
+    """Очередь уведомлений с пулом воркеров и лимитами Telegram.
+
+    Общий token bucket держит ~30 сообщений/с на бота, отдельный bucket на чат — ~1 сообщение/с.
+    Пока чат ждёт отправки, новые алерты для него склеиваются в одно сообщение; алерт с тем же
+    `key` заменяет ещё не отправленный. `on_sent` вызывается только после успешной доставки.
+    RetryAfter выдерживается точно и ставит на паузу общий bucket (flood control — на весь бот);
+    после паузы всегда следует повтор, flood-паузы ограничены `max_retries` отдельно от сетевых
+    ошибок, которые повторяются с экспоненциальной паузой. Bucket'ы чатов, восполнившиеся до
+    полного, выбрасываются, так что память не растёт с числом когда-либо писавших чатов.
+    """
+
+    def __init__(
+        self,
+        bot: Any,
+        workers: int = 8,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        max_retries: int = 3,
+        backoff_sec: float = 1.0,
+    ) -> None:
+        self.bot = bot
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_sec = backoff_sec
+        self.chat_rate = chat_rate
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._sweep_at = CHAT_BUCKETS_SWEEP_AT
+        self._pending: dict[int, dict[Hashable, tuple[str, Callable[[], None] | None]]] = {}
+        self._enqueued_at: dict[int, float] = {}
+        self._queue: asyncio.Queue[int] = asyncio.Queue()
+        self._tasks: list[asyncio.Task[None]] = []
+        self._stats = NotifierStats()
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def enqueue(self, chat_id: int, text: str, key: Hashable | None = None, on_sent: Callable[[], None] | None = None) -> None:
+        self._stats.enqueued += 1
+        item = (text, on_sent)
+        key = object() if key is None else key
+        if chat_id in self._pending:
+            self._pending[chat_id][key] = item
+            self._stats.coalesced += 1
+            return
+        self._pending[chat_id] = {key: item}
+        self._enqueued_at[chat_id] = time.monotonic()
+        self._queue.put_nowait(chat_id)
+
+    def stats(self) -> NotifierStats:
+        self._stats.queue_depth = self._queue.qsize()
+        return self._stats
+
+    async def join(self) -> None:
+        await self._queue.join()
+
+    async def close(self, drain_timeout_sec: float = 5.0) -> None:
+        if self._tasks:
+            try:
+                await asyncio.wait_for(self._queue.join(), drain_timeout_sec)
+            except asyncio.TimeoutError:
+                logger.warning("Dropping %s queued notifications on shutdown", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        while True:
+            chat_id = await self._queue.get()
+            try:
+                # чат снимается с очереди до отправки: алерты, пришедшие во время ожидания лимита,
+                # ещё успевают попасть в это же сообщение
+                await self._chat_bucket(chat_id).acquire()
+                await self.global_bucket.acquire()
+                items = list(self._pending.pop(chat_id, {}).values())
+                lag = time.monotonic() - self._enqueued_at.pop(chat_id, time.monotonic())
+                self._stats.last_lag_sec = lag
+                self._stats.max_lag_sec = max(self._stats.max_lag_sec, lag)
+                for n, (chunk, callbacks) in enumerate(self._chunks(items)):
+                    if n:
+                        await self._chat_bucket(chat_id).acquire()
+                        await self.global_bucket.acquire()
+                    if await self._send(chat_id, chunk):
+                        for callback in callbacks:
+                            callback()
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # noqa: BLE001
+                logger.exception("Notification worker failed for chat %s", chat_id)
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, chat_id: int, text: str) -> bool:
+        attempt = floods = 0
+        while True:
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text)
+                self._stats.sent += 1
+                return True
+            except RetryAfter as exc:
+                if floods == self.max_retries:
+                    logger.warning("Notification to %s dropped after %s flood waits", chat_id, floods)
+                    break
+                floods += 1
+                retry_after = exc.retry_after
+                delay = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+                logger.warning("Telegram flood control, retry in %.1fs", delay)
+                self.global_bucket.pause(delay)
+                await asyncio.sleep(delay)
+            except (Forbidden, BadRequest) as exc:
+                logger.warning("Notification to %s rejected: %s", chat_id, exc)
+                break
+            except NetworkError as exc:
+                if attempt == self.max_retries:
+                    logger.warning("Notification to %s failed: %s", chat_id, exc)
+                    break
+                await asyncio.sleep(self.backoff_sec * 2**attempt)
+                attempt += 1
+            self._stats.retried += 1
+        self._stats.failed += 1
+        return False
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self._sweep_at:
+                self._evict_idle_buckets()
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+        return bucket
+
+    def _evict_idle_buckets(self) -> None:
+        for chat_id in [c for c, bucket in self._chat_buckets.items() if bucket.is_full() and c not in self._pending]:
+            del self._chat_buckets[chat_id]
+        # порог растёт вместе с живыми bucket'ами, чтобы чистка оставалась амортизированно O(1)
+        self._sweep_at = max(CHAT_BUCKETS_SWEEP_AT, 2 * len(self._chat_buckets))
+
+    @staticmethod
+    def _chunks(items: list[tuple[str, Callable[[], None] | None]]) -> list[tuple[str, list[Callable[[], None]]]]:
+        chunks: list[tuple[str, list[Callable[[], None]]]] = []
+        for text, on_sent in items:
+            if chunks and len(chunks[-1][0]) + 2 + len(text) <= MAX_MESSAGE_LENGTH:
+                chunks[-1] = (chunks[-1][0] + "\n\n" + text, chunks[-1][1])
+            else:
+                chunks.append((text[:MAX_MESSAGE_LENGTH], []))
+            if on_sent is not None:
+                chunks[-1][1].append(on_sent)
+        return chunks
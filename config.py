@@ -3,7 +3,16 @@ from __future__ import annotations
 from dataclasses import dataclass
 from functools import lru_cache
 import os
-from typing import List
+from typing import Dict, List
+
+
+def _parse_venue_map(raw: str) -> Dict[str, float]:
+    limits: Dict[str, float] = {}
+    for item in raw.split(","):
+        venue, _, value = item.partition(":")
+        if venue.strip() and value.strip():
+            limits[venue.strip()] = float(value)
+    return limits
 
 
 @dataclass(slots=True)
@@ -13,12 +22,63 @@ class Settings:
     scan_interval_sec: int
     min_profit_percent: float
     cache_ttl_sec: int
+    cache_stale_ttl_sec: int
+    cache_negative_ttl_sec: int
+    cache_max_entries: int
+    cache_max_bytes: int
+    cache_l2_enabled: bool
     coincap_base_url: str
     enabled_cex: List[str]
     p2p_fiats: List[str]
     p2p_banks: List[str]
     min_liquidity_usd: float
     max_api_calls_per_sec: int
+    markets_ttl_sec: int
+    scan_symbols: List[str]
+    cex_symbol_concurrency: int
+    currency_meta_ttl_sec: int
+    currency_meta_path: str
+    venue_rate_limits: Dict[str, float]
+    cex_streaming: bool
+    stream_depth: int
+    stream_max_age_sec: float
+    http_max_connections: int
+    http_max_connections_per_host: int
+    http_dns_ttl_sec: int
+    venue_timeouts: Dict[str, float]
+    p2p_scan_deadline_sec: float
+    p2p_page_size: int
+    p2p_max_pages: int
+    breaker_failure_threshold: int
+    breaker_reset_sec: float
+    breaker_min_timeout_sec: float
+    breaker_max_timeout_sec: float
+    graph_max_cycle_length: int
+    graph_time_budget_ms: float
+    orderbook_levels: int
+    depth_size_grid_usd: List[float]
+    notify_workers: int
+    notify_global_rate: float
+    notify_chat_rate: float
+    notify_max_retries: int
+    alert_cooldown_sec: float
+    alert_min_spread_delta: float
+    alert_state_max_entries: int
+    db_write_batch_size: int
+    db_write_flush_sec: float
+    db_write_queue_max: int
+    retention_raw_days: float
+    retention_hourly_days: float
+    retention_daily_days: float
+    retention_interval_sec: float
+    vacuum_pages: int
+    ticks_enabled: bool
+    ticks_dir: str
+    ticks_chunk_rows: int
+    ticks_max_pending_rows: int
+    ticks_max_buffer_sec: float
+    dex_fees_abs: float
+    p2p_fees_abs: float
 
 
 @lru_cache(maxsize=1)
@@ -29,11 +89,64 @@ def get_settings() -> Settings:
         scan_interval_sec=int(os.getenv("SCAN_INTERVAL_SEC", "60")),
         min_profit_percent=float(os.getenv("MIN_PROFIT_PERCENT", "1.0")),
         cache_ttl_sec=int(os.getenv("CACHE_TTL_SEC", "45")),
+        cache_stale_ttl_sec=int(os.getenv("CACHE_STALE_TTL_SEC", "600")),
+        cache_negative_ttl_sec=int(os.getenv("CACHE_NEGATIVE_TTL_SEC", "10")),
+        cache_max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "1024")),
+        cache_max_bytes=int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        cache_l2_enabled=os.getenv("CACHE_L2_ENABLED", "1").lower() in {"1", "true", "yes"},
         coincap_base_url=os.getenv("COINCAP_BASE_URL", "https://api.coincap.io/v2"),
         enabled_cex=[x.strip() for x in os.getenv("ENABLED_CEX", "binance,bybit,okx,kucoin,kraken,huobi,bitfinex,mexc,gateio,coinbase").split(",") if x.strip()],
         p2p_fiats=[x.strip().upper() for x in os.getenv("P2P_FIATS", "RUB,USD,EUR,UZS,KZT,UAH").split(",") if x.strip()],
         p2p_banks=[x.strip() for x in os.getenv("P2P_BANKS", "Tinkoff,Sberbank,Raiffeisen,QIWI,YooMoney").split(",") if x.strip()],
         min_liquidity_usd=float(os.getenv("MIN_LIQUIDITY_USD", "1000")),
         max_api_calls_per_sec=int(os.getenv("MAX_API_CALLS_PER_SEC", "5")),
+        markets_ttl_sec=int(os.getenv("MARKETS_TTL_SEC", "3600")),
+        scan_symbols=[x.strip().upper() for x in os.getenv("SCAN_SYMBOLS", "BTC/USDT,ETH/USDT,SOL/USDT,ETH/BTC").split(",") if x.strip()],
+        cex_symbol_concurrency=int(os.getenv("CEX_SYMBOL_CONCURRENCY", "4")),
+        currency_meta_ttl_sec=int(os.getenv("CURRENCY_META_TTL_SEC", "21600")),
+        currency_meta_path=os.getenv("CURRENCY_META_PATH", "data/currency_meta.json"),
+        venue_rate_limits=_parse_venue_map(os.getenv("VENUE_RATE_LIMITS", "binance:20,bybit:10,okx:10")),
+        cex_streaming=os.getenv("CEX_STREAMING", "0").lower() in {"1", "true", "yes"},
+        stream_depth=int(os.getenv("STREAM_DEPTH", "10")),
+        stream_max_age_sec=float(os.getenv("STREAM_MAX_AGE_SEC", "30")),
+        http_max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+        http_max_connections_per_host=int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "10")),
+        http_dns_ttl_sec=int(os.getenv("HTTP_DNS_TTL_SEC", "300")),
+        venue_timeouts=_parse_venue_map(
+            os.getenv("VENUE_TIMEOUTS", "coincap:15,thegraph:10,binance_p2p:20,bybit_p2p:20,garantex_p2p:20")
+        ),
+        p2p_scan_deadline_sec=float(os.getenv("P2P_SCAN_DEADLINE_SEC", "12")),
+        p2p_page_size=int(os.getenv("P2P_PAGE_SIZE", "20")),
+        p2p_max_pages=int(os.getenv("P2P_MAX_PAGES", "5")),
+        breaker_failure_threshold=int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3")),
+        breaker_reset_sec=float(os.getenv("BREAKER_RESET_SEC", "60")),
+        breaker_min_timeout_sec=float(os.getenv("BREAKER_MIN_TIMEOUT_SEC", "2")),
+        breaker_max_timeout_sec=float(os.getenv("BREAKER_MAX_TIMEOUT_SEC", "12")),
+        graph_max_cycle_length=int(os.getenv("GRAPH_MAX_CYCLE_LENGTH", "4")),
+        graph_time_budget_ms=float(os.getenv("GRAPH_TIME_BUDGET_MS", "100")),
+        orderbook_levels=int(os.getenv("ORDERBOOK_LEVELS", "20")),
+        depth_size_grid_usd=[float(x) for x in os.getenv("DEPTH_SIZE_GRID_USD", "100,500,1000,5000,10000,50000").split(",") if x.strip()],
+        notify_workers=int(os.getenv("NOTIFY_WORKERS", "8")),
+        notify_global_rate=float(os.getenv("NOTIFY_GLOBAL_RATE", "30")),
+        notify_chat_rate=float(os.getenv("NOTIFY_CHAT_RATE", "1")),
+        notify_max_retries=int(os.getenv("NOTIFY_MAX_RETRIES", "3")),
+        alert_cooldown_sec=float(os.getenv("ALERT_COOLDOWN_SEC", "1800")),
+        alert_min_spread_delta=float(os.getenv("ALERT_MIN_SPREAD_DELTA", "0.5")),
+        alert_state_max_entries=int(os.getenv("ALERT_STATE_MAX_ENTRIES", "100000")),
+        db_write_batch_size=int(os.getenv("DB_WRITE_BATCH_SIZE", "200")),
+        db_write_flush_sec=float(os.getenv("DB_WRITE_FLUSH_SEC", "1")),
+        db_write_queue_max=int(os.getenv("DB_WRITE_QUEUE_MAX", "10000")),
+        retention_raw_days=float(os.getenv("RETENTION_RAW_DAYS", "7")),
+        retention_hourly_days=float(os.getenv("RETENTION_HOURLY_DAYS", "90")),
+        retention_daily_days=float(os.getenv("RETENTION_DAILY_DAYS", "730")),
+        retention_interval_sec=float(os.getenv("RETENTION_INTERVAL_SEC", "3600")),
+        vacuum_pages=int(os.getenv("VACUUM_PAGES", "2000")),
+        ticks_enabled=os.getenv("TICKS_ENABLED", "0").lower() in {"1", "true", "yes"},
+        ticks_dir=os.getenv("TICKS_DIR", "data/ticks"),
+        ticks_chunk_rows=int(os.getenv("TICKS_CHUNK_ROWS", "50000")),
+        ticks_max_pending_rows=int(os.getenv("TICKS_MAX_PENDING_ROWS", "500000")),
+        ticks_max_buffer_sec=float(os.getenv("TICKS_MAX_BUFFER_SEC", "300")),
+        dex_fees_abs=float(os.getenv("DEX_FEES_ABS", "1.5")),
+        p2p_fees_abs=float(os.getenv("P2P_FEES_ABS", "1.0")),
     )
 
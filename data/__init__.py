@@ -1,3 +1,7 @@
+from .alert_state import AlertStateStore
 from .database import Database
+from .retention import RetentionManager
+from .ticks import TickRecorder, TickStore
+from .writer import OpportunityWriter
 
-__all__ = ["Database"]
+__all__ = ["Database", "AlertStateStore", "OpportunityWriter", "RetentionManager", "TickRecorder", "TickStore"]
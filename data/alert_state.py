@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+
+from data.database import Database
+
+
+class AlertStateStore:
+    """Последний отправленный спред и время отправки по (user_id, route).
+
+    Повтор маршрута отправляется, только если спред сдвинулся не меньше чем на
+    `min_spread_delta` п.п. или прошло `cooldown_sec`. `should_send` только проверяет; отправка
+    записывается через `mark_sent`, когда сообщение реально доставлено, так что недошедший алерт
+    уйдёт на следующем скане. Записи старше cooldown больше ни на что не влияют и вытесняются;
+    сверх `max_entries` вытесняются давно не обновлявшиеся (LRU). Состояние сохраняется в SQLite,
+    чтобы после рестарта не разослать всё заново.
+    """
+
+    def __init__(self, cooldown_sec: float = 1800.0, min_spread_delta: float = 0.5, max_entries: int = 100_000) -> None:
+        self.cooldown_sec = cooldown_sec
+        self.min_spread_delta = min_spread_delta
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[int, str], tuple[float, float]] = OrderedDict()
+        self._dirty: set[tuple[int, str]] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def should_send(self, user_id: int, route: str, spread_percent: float, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        last = self._entries.get((user_id, route))
+        if last is None:
+            return True
+        last_spread, sent_at = last
+        return now - sent_at >= self.cooldown_sec or abs(spread_percent - last_spread) >= self.min_spread_delta
+
+    def mark_sent(self, user_id: int, route: str, spread_percent: float, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        key = (user_id, route)
+        self._entries[key] = (spread_percent, now)
+        self._entries.move_to_end(key)
+        self._dirty.add(key)
+        self._evict(now)
+
+    async def load(self, db: Database, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        rows = await db.load_alert_state(since=now - self.cooldown_sec)
+        for user_id, route, spread_percent, sent_at in sorted(rows, key=lambda row: row[3]):
+            self._entries[(user_id, route)] = (spread_percent, sent_at)
+        self._evict(now)
+
+    async def flush(self, db: Database, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        rows = [(key[0], key[1], *self._entries[key]) for key in self._dirty if key in self._entries]
+        self._dirty.clear()
+        await db.save_alert_state(rows, expired_before=now - self.cooldown_sec)
+
+    def _evict(self, now: float) -> None:
+        # порядок OrderedDict совпадает с порядком отправки, поэтому истёкшие записи всегда в начале
+        while self._entries:
+            key, (_, sent_at) = next(iter(self._entries.items()))
+            if now - sent_at < self.cooldown_sec and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+            self._dirty.discard(key)
@@ -1,26 +1,83 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import logging
 import time
 from pathlib import Path
 from typing import Any
 
 import aiosqlite
 
+logger = logging.getLogger(__name__)
+
+PRAGMAS = (
+    # auto_vacuum действует только на новой БД; существующую разово переводит migrate_auto_vacuum()
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+# поля, уже лежащие в колонках opportunities: в metadata_json их не дублируем
+OPPORTUNITY_COLUMNS = frozenset({"type", "route", "buy_price", "sell_price", "fees", "spread_percent", "liquidity"})
+
+ROLLUP_UPSERT = """
+ON CONFLICT(granularity, bucket_start, opportunity_type, route) DO UPDATE SET
+  samples=samples + excluded.samples,
+  spread_sum=spread_sum + excluded.spread_sum,
+  spread_min=MIN(spread_min, excluded.spread_min),
+  spread_max=MAX(spread_max, excluded.spread_max),
+  liquidity_max=MAX(liquidity_max, excluded.liquidity_max),
+  last_seen=MAX(last_seen, excluded.last_seen)
+"""
+
 
 class Database:
-    def __init__(self, db_path: str) -> None:
+    """Одно долгоживущее соединение на процесс (WAL, кэш prepared statements sqlite3).
+
+    Соединение открывается при первом обращении; запись и commit идут под lock,
+    чтобы транзакции конкурентных хендлеров не перемешивались.
+    """
+
+    def __init__(self, db_path: str, cached_statements: int = 256) -> None:
         self.db_path = db_path
+        self.cached_statements = cached_statements
+        self._conn: aiosqlite.Connection | None = None
+        self._connect_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
 
     async def init(self) -> None:
-        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
-        async with aiosqlite.connect(self.db_path) as conn:
-            schema = Path("data/schema.sql").read_text(encoding="utf-8")
+        conn = await self._connection()
+        schema = Path("data/schema.sql").read_text(encoding="utf-8")
+        async with self._write_lock:
             await conn.executescript(schema)
             await conn.commit()
 
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    async def _connection(self) -> aiosqlite.Connection:
+        if self._conn is not None:
+            return self._conn
+        async with self._connect_lock:
+            if self._conn is None:
+                Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+                conn = await aiosqlite.connect(self.db_path, cached_statements=self.cached_statements)
+                conn.row_factory = aiosqlite.Row
+                for pragma in PRAGMAS:
+                    await conn.execute(pragma)
+                self._conn = conn
+        return self._conn
+
     async def upsert_user(self, user_id: int, username: str | None) -> None:
-        async with aiosqlite.connect(self.db_path) as conn:
+        conn = await self._connection()
+        async with self._write_lock:
             await conn.execute(
                 """
                 INSERT INTO users(user_id, username)
@@ -34,7 +91,8 @@ class Database:
             await conn.commit()
 
     async def update_user_settings(self, user_id: int, min_profit_percent: float, selected_strategy: str, notifications_enabled: bool) -> None:
-        async with aiosqlite.connect(self.db_path) as conn:
+        conn = await self._connection()
+        async with self._write_lock:
             await conn.execute(
                 """
                 UPDATE users
@@ -46,71 +104,223 @@ class Database:
             await conn.commit()
 
     async def get_user(self, user_id: int) -> dict[str, Any] | None:
-        async with aiosqlite.connect(self.db_path) as conn:
-            conn.row_factory = aiosqlite.Row
-            async with conn.execute("SELECT * FROM users WHERE user_id=?", (user_id,)) as cur:
-                row = await cur.fetchone()
-                return dict(row) if row else None
+        conn = await self._connection()
+        async with conn.execute("SELECT * FROM users WHERE user_id=?", (user_id,)) as cur:
+            row = await cur.fetchone()
+            return dict(row) if row else None
+
+    async def get_users(self) -> list[dict[str, Any]]:
+        conn = await self._connection()
+        async with conn.execute("SELECT * FROM users") as cur:
+            return [dict(row) for row in await cur.fetchall()]
 
     async def save_opportunity(self, user_id: int | None, opportunity: dict[str, Any]) -> None:
-        async with aiosqlite.connect(self.db_path) as conn:
-            await conn.execute(
+        await self.save_opportunities([self.opportunity_row(user_id, opportunity)])
+
+    async def save_opportunities(self, rows: list[tuple[Any, ...]]) -> None:
+        conn = await self._connection()
+        async with self._write_lock:
+            await conn.executemany(
                 """
                 INSERT INTO opportunities(user_id, opportunity_type, route, buy_price, sell_price, fees, spread_percent, liquidity, metadata_json)
                 VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
-                (
-                    user_id,
-                    opportunity.get("type", "unknown"),
-                    opportunity.get("route", ""),
-                    opportunity.get("buy_price"),
-                    opportunity.get("sell_price"),
-                    opportunity.get("fees", 0),
-                    opportunity.get("spread_percent"),
-                    opportunity.get("liquidity"),
-                    json.dumps(opportunity, ensure_ascii=False),
-                ),
+                rows,
             )
             await conn.commit()
 
+    @staticmethod
+    def opportunity_row(user_id: int | None, opportunity: dict[str, Any]) -> tuple[Any, ...]:
+        return (
+            user_id,
+            opportunity.get("type", "unknown"),
+            opportunity.get("route", ""),
+            opportunity.get("buy_price"),
+            opportunity.get("sell_price"),
+            opportunity.get("fees", 0),
+            opportunity.get("spread_percent"),
+            opportunity.get("liquidity"),
+            json.dumps(
+                {k: v for k, v in opportunity.items() if k not in OPPORTUNITY_COLUMNS},
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ),
+        )
+
     async def get_recent_opportunities(self, user_id: int, limit: int = 10) -> list[dict[str, Any]]:
-        async with aiosqlite.connect(self.db_path) as conn:
-            conn.row_factory = aiosqlite.Row
-            async with conn.execute(
-                """
-                SELECT * FROM opportunities
-                WHERE user_id=?
-                ORDER BY created_at DESC
-                LIMIT ?
-                """,
-                (user_id, limit),
-            ) as cur:
-                rows = await cur.fetchall()
-                return [dict(row) for row in rows]
+        conn = await self._connection()
+        async with conn.execute(
+            """
+            SELECT * FROM opportunities
+            WHERE user_id=?
+            ORDER BY created_at DESC
+            LIMIT ?
+            """,
+            (user_id, limit),
+        ) as cur:
+            rows = await cur.fetchall()
+            return [dict(row) for row in rows]
 
     async def set_cache(self, key: str, payload: dict[str, Any], ttl_sec: int) -> None:
         expires_at = int(time.time()) + ttl_sec
-        async with aiosqlite.connect(self.db_path) as conn:
+        conn = await self._connection()
+        async with self._write_lock:
             await conn.execute(
                 """
                 INSERT INTO scan_cache(cache_key, payload_json, expires_at)
                 VALUES(?, ?, ?)
                 ON CONFLICT(cache_key) DO UPDATE SET payload_json=excluded.payload_json, expires_at=excluded.expires_at
                 """,
-                (key, json.dumps(payload, ensure_ascii=False), expires_at),
+                (key, json.dumps(payload, ensure_ascii=False, separators=(",", ":")), expires_at),
             )
             await conn.commit()
 
     async def get_cache(self, key: str) -> dict[str, Any] | None:
-        async with aiosqlite.connect(self.db_path) as conn:
-            async with conn.execute(
-                "SELECT payload_json, expires_at FROM scan_cache WHERE cache_key=?",
-                (key,),
-            ) as cur:
-                row = await cur.fetchone()
-                if not row:
-                    return None
-                payload_json, expires_at = row
-                if expires_at < int(time.time()):
-                    return None
-                return json.loads(payload_json)
+        conn = await self._connection()
+        async with conn.execute(
+            "SELECT payload_json, expires_at FROM scan_cache WHERE cache_key=?",
+            (key,),
+        ) as cur:
+            row = await cur.fetchone()
+            if not row:
+                return None
+            payload_json, expires_at = row
+            if expires_at < int(time.time()):
+                return None
+            return json.loads(payload_json)
+
+    async def load_cache(self, prefix: str) -> list[tuple[str, dict[str, Any]]]:
+        conn = await self._connection()
+        async with conn.execute(
+            "SELECT cache_key, payload_json FROM scan_cache WHERE substr(cache_key, 1, ?)=? AND expires_at>=?",
+            (len(prefix), prefix, int(time.time())),
+        ) as cur:
+            return [(key, json.loads(payload_json)) for key, payload_json in await cur.fetchall()]
+
+    async def purge_cache(self) -> int:
+        conn = await self._connection()
+        async with self._write_lock:
+            cur = await conn.execute("DELETE FROM scan_cache WHERE expires_at<?", (int(time.time()),))
+            await conn.commit()
+            return cur.rowcount
+
+    async def load_alert_state(self, since: float) -> list[tuple[int, str, float, float]]:
+        conn = await self._connection()
+        async with conn.execute(
+            "SELECT user_id, route, spread_percent, sent_at FROM alert_state WHERE sent_at>=?",
+            (since,),
+        ) as cur:
+            return [tuple(row) for row in await cur.fetchall()]
+
+    async def save_alert_state(self, rows: list[tuple[int, str, float, float]], expired_before: float) -> None:
+        conn = await self._connection()
+        async with self._write_lock:
+            await conn.executemany(
+                """
+                INSERT INTO alert_state(user_id, route, spread_percent, sent_at)
+                VALUES(?, ?, ?, ?)
+                ON CONFLICT(user_id, route) DO UPDATE SET spread_percent=excluded.spread_percent, sent_at=excluded.sent_at
+                """,
+                rows,
+            )
+            await conn.execute("DELETE FROM alert_state WHERE sent_at<?", (expired_before,))
+            await conn.commit()
+
+    async def rollup_opportunities(self, raw_before: float, hourly_before: float, daily_before: float) -> dict[str, int]:
+        """Сворачивает сырые строки старше `raw_before` в часовые агрегаты по маршруту,
+        часовые старше `hourly_before` — в дневные, и удаляет дневные старше `daily_before`."""
+        raw_cutoff = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(raw_before))
+        conn = await self._connection()
+        async with self._write_lock:
+            # агрегаты и удаление исходных строк — одна транзакция: при сбое посередине откат,
+            # иначе следующий commit другого метода зафиксировал бы сумму без удаления (двойной счёт)
+            try:
+                await conn.execute("BEGIN IMMEDIATE")
+                return await self._rollup(conn, raw_cutoff, hourly_before, daily_before)
+            except BaseException:
+                await self._rollback(conn)
+                raise
+
+    @staticmethod
+    async def _rollback(conn: aiosqlite.Connection) -> None:
+        # открытая транзакция на общем соединении заблокировала бы всех следующих писателей
+        if not conn.in_transaction:
+            return
+        try:
+            await conn.rollback()
+        except Exception:  # noqa: BLE001
+            logger.exception("Rollback failed, connection may stay in a transaction")
+
+    async def _rollup(self, conn: aiosqlite.Connection, raw_cutoff: str, hourly_before: float, daily_before: float) -> dict[str, int]:
+        await conn.execute(
+            """
+            INSERT INTO opportunity_rollups(granularity, bucket_start, opportunity_type, route, samples, spread_sum, spread_min, spread_max, liquidity_max, last_seen)
+            SELECT 'hour', CAST(strftime('%s', created_at) AS INTEGER) / 3600 * 3600, opportunity_type, route,
+                   COUNT(*), SUM(spread_percent), MIN(spread_percent), MAX(spread_percent), MAX(liquidity), MAX(created_at)
+            FROM opportunities
+            WHERE created_at < ?
+            GROUP BY 2, 3, 4
+            """
+            + ROLLUP_UPSERT,
+            (raw_cutoff,),
+        )
+        raw = (await conn.execute("DELETE FROM opportunities WHERE created_at < ?", (raw_cutoff,))).rowcount
+        await conn.execute(
+            """
+            INSERT INTO opportunity_rollups(granularity, bucket_start, opportunity_type, route, samples, spread_sum, spread_min, spread_max, liquidity_max, last_seen)
+            SELECT 'day', bucket_start / 86400 * 86400, opportunity_type, route,
+                   SUM(samples), SUM(spread_sum), MIN(spread_min), MAX(spread_max), MAX(liquidity_max), MAX(last_seen)
+            FROM opportunity_rollups
+            WHERE granularity='hour' AND bucket_start < ?
+            GROUP BY 2, 3, 4
+            """
+            + ROLLUP_UPSERT,
+            (int(hourly_before),),
+        )
+        hourly = (
+            await conn.execute("DELETE FROM opportunity_rollups WHERE granularity='hour' AND bucket_start < ?", (int(hourly_before),))
+        ).rowcount
+        daily = (
+            await conn.execute("DELETE FROM opportunity_rollups WHERE granularity='day' AND bucket_start < ?", (int(daily_before),))
+        ).rowcount
+        await conn.commit()
+        return {"raw": raw, "hourly": hourly, "daily": daily}
+
+    async def get_rollups(self, route: str, granularity: str = "hour") -> list[dict[str, Any]]:
+        conn = await self._connection()
+        async with conn.execute(
+            """
+            SELECT *, spread_sum / samples AS spread_avg FROM opportunity_rollups
+            WHERE granularity=? AND route=?
+            ORDER BY bucket_start
+            """,
+            (granularity, route),
+        ) as cur:
+            return [dict(row) for row in await cur.fetchall()]
+
+    async def migrate_auto_vacuum(self) -> bool:
+        """Разовая миграция БД, созданной до auto_vacuum=INCREMENTAL: полный VACUUM.
+
+        На большой базе идёт долго и держит соединение, поэтому вызывается в фоне
+        (RetentionManager), а не из init(). Возвращает True, если миграция выполнялась.
+        """
+        conn = await self._connection()
+        async with self._write_lock:
+            async with conn.execute("PRAGMA auto_vacuum") as cur:
+                mode = (await cur.fetchone())[0]
+            if mode == 2:
+                return False
+            logger.info("Migrating %s to auto_vacuum=INCREMENTAL with a one-off VACUUM", self.db_path)
+            started = time.monotonic()
+            await conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            await conn.execute("VACUUM")
+            logger.info("VACUUM of %s finished in %.1fs", self.db_path, time.monotonic() - started)
+            return True
+
+    async def incremental_vacuum(self, pages: int) -> None:
+        conn = await self._connection()
+        async with self._write_lock:
+            # pragma освобождает страницы по мере чтения результата, поэтому дочитываем до конца
+            async with conn.execute(f"PRAGMA incremental_vacuum({int(pages)})") as cur:
+                await cur.fetchall()
+            await conn.commit()
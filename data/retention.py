@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from data.database import Database
+
+logger = logging.getLogger(__name__)
+
+DAY_SEC = 86400
+
+
+class RetentionManager:
+    """Периодически сворачивает историю возможностей и возвращает освободившееся место.
+
+    Сырые строки живут `raw_days`, часовые агрегаты по маршруту — `hourly_days`,
+    дневные — `daily_days`. Заодно удаляются истёкшие строки L2-кэша scan_cache.
+    После свёртки выполняется incremental vacuum на `vacuum_pages` страниц. Базу, созданную до
+    включения auto_vacuum, фоновая задача один раз переводит полным VACUUM перед первым проходом.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        raw_days: float = 7,
+        hourly_days: float = 90,
+        daily_days: float = 730,
+        interval_sec: float = 3600,
+        vacuum_pages: int = 2000,
+    ) -> None:
+        self.db = db
+        self.raw_days = raw_days
+        self.hourly_days = hourly_days
+        self.daily_days = daily_days
+        self.interval_sec = interval_sec
+        self.vacuum_pages = vacuum_pages
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self, now: float | None = None) -> dict[str, int]:
+        now = time.time() if now is None else now
+        removed = await self.db.rollup_opportunities(
+            raw_before=now - self.raw_days * DAY_SEC,
+            hourly_before=now - self.hourly_days * DAY_SEC,
+            daily_before=now - self.daily_days * DAY_SEC,
+        )
+        removed["cache"] = await self.db.purge_cache()
+        await self.db.incremental_vacuum(self.vacuum_pages)
+        return removed
+
+    async def _run(self) -> None:
+        try:
+            await self.db.migrate_auto_vacuum()
+        except Exception:  # noqa: BLE001
+            logger.exception("auto_vacuum migration failed")
+        while True:
+            try:
+                removed = await self.run_once()
+                logger.info(
+                    "Retention: rolled up %s raw, %s hourly rows; dropped %s daily, %s cache",
+                    removed["raw"],
+                    removed["hourly"],
+                    removed["daily"],
+                    removed["cache"],
+                )
+            except Exception:  # noqa: BLE001
+                logger.exception("Retention run failed")
+            await asyncio.sleep(self.interval_sec)
@@ -31,3 +31,28 @@ CREATE TABLE IF NOT EXISTS scan_cache (
     payload_json TEXT NOT NULL,
     expires_at INTEGER NOT NULL
 );
+
+CREATE TABLE IF NOT EXISTS alert_state (
+    user_id INTEGER NOT NULL,
+    route TEXT NOT NULL,
+    spread_percent REAL NOT NULL,
+    sent_at REAL NOT NULL,
+    PRIMARY KEY(user_id, route)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_opportunities_created
+ON opportunities(created_at);
+
+CREATE TABLE IF NOT EXISTS opportunity_rollups (
+    granularity TEXT NOT NULL,
+    bucket_start INTEGER NOT NULL,
+    opportunity_type TEXT NOT NULL,
+    route TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    spread_sum REAL NOT NULL,
+    spread_min REAL,
+    spread_max REAL,
+    liquidity_max REAL,
+    last_seen TEXT,
+    PRIMARY KEY(granularity, bucket_start, opportunity_type, route)
+) WITHOUT ROWID;
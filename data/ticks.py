@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("cex", "dex", "p2p")
+COLUMNS: dict[str, type] = {
+    "ts": np.float64,
+    "kind": np.uint8,
+    "symbol": np.int32,
+    "exchange": np.int32,
+    "bid": np.float64,
+    "ask": np.float64,
+    "price": np.float64,
+    "depth": np.float64,
+    "maker_fee": np.float32,
+    "taker_fee": np.float32,
+    "min_limit": np.float64,
+    "max_limit": np.float64,
+}
+DICTIONARY_FIELDS = ("symbol", "exchange")
+
+
+def _num(value: Any) -> float:
+    return float(value) if value is not None else float("nan")
+
+
+def tick_rows(
+    ts: float,
+    cex_data: list[dict[str, Any]],
+    dex_data: list[dict[str, Any]],
+    p2p_data: list[dict[str, Any]],
+) -> list[tuple[Any, ...]]:
+    """Снапшот скана в строки в порядке COLUMNS; символ и биржа пока строками.
+
+    Для P2P символ — `asset/fiat`; depth — глубина стакана CEX или ликвидность DEX.
+    Стаканы не сохраняются: только top-of-book и суммарная глубина.
+    """
+    nan = float("nan")
+    rows: list[tuple[Any, ...]] = []
+    for row in cex_data:
+        top = (_num(row.get("bid")), _num(row.get("ask")), _num(row.get("spot_price")), _num(row.get("orderbook_depth")))
+        fees = (_num(row.get("maker_fee")), _num(row.get("taker_fee")))
+        rows.append((ts, 0, row.get("symbol", ""), row.get("exchange", ""), *top, *fees, nan, nan))
+    for row in dex_data:
+        quote = (nan, nan, _num(row.get("price")), _num(row.get("liquidity")))
+        rows.append((ts, 1, row.get("symbol", ""), row.get("exchange", ""), *quote, nan, nan, nan, nan))
+    for ad in p2p_data:
+        limits = (_num(ad.get("min_limit")), _num(ad.get("max_limit")))
+        symbol = f"{ad.get('asset', '')}/{ad.get('fiat', '')}"
+        rows.append((ts, 2, symbol, ad.get("exchange", ""), nan, nan, _num(ad.get("price")), nan, nan, nan, *limits))
+    return rows
+
+
+class TickStore:
+    """Append-only колоночное хранилище тиков: `root/YYYY-MM-DD/chunk-NNNNNN/<column>.npy`.
+
+    Символы и биржи кодируются через общий словарь `root/dictionary.json` (код — позиция в списке,
+    список только растёт, поэтому старые чанки остаются валидными). Чанк пишется во временный
+    каталог и переименовывается целиком, словарь сохраняется раньше чанка. Чтение идёт через
+    np.load(mmap_mode="r"), так что скан месяцев истории не грузит всё в память.
+    Писатель должен быть один на каталог.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = Path(root)
+        self._dictionary: dict[str, list[str]] | None = None
+        self._codes: dict[str, dict[str, int]] = {}
+
+    @property
+    def dictionary(self) -> dict[str, list[str]]:
+        if self._dictionary is None:
+            self.reload()
+        assert self._dictionary is not None
+        return self._dictionary
+
+    def reload(self) -> None:
+        path = self.root / "dictionary.json"
+        loaded = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+        self._dictionary = {field: list(loaded.get(field, [])) for field in DICTIONARY_FIELDS}
+        self._codes = {field: {name: code for code, name in enumerate(names)} for field, names in self._dictionary.items()}
+
+    def code(self, field: str, name: str) -> int | None:
+        if self._dictionary is None or name not in self._codes[field]:
+            # словарь мог вырасти после последнего чтения (писатель в другом процессе)
+            self.reload()
+        return self._codes[field].get(name)
+
+    def decode(self, field: str, codes: np.ndarray) -> list[str]:
+        names = self.dictionary[field]
+        return [names[code] for code in codes.tolist()]
+
+    def append(self, rows: list[tuple[Any, ...]]) -> int:
+        """Пишет строки из `tick_rows` чанками по UTC-дням. Возвращает число записанных строк."""
+        if not rows:
+            return 0
+        names = self.dictionary
+        grew = False
+        by_day: dict[str, list[tuple[Any, ...]]] = {}
+        for row in rows:
+            encoded = list(row)
+            for n, field in ((2, "symbol"), (3, "exchange")):
+                code = self._codes[field].get(row[n])
+                if code is None:
+                    code = self._codes[field][row[n]] = len(names[field])
+                    names[field].append(row[n])
+                    grew = True
+                encoded[n] = code
+            by_day.setdefault(time.strftime("%Y-%m-%d", time.gmtime(row[0])), []).append(tuple(encoded))
+        if grew:
+            self._save_dictionary()
+        for day, day_rows in by_day.items():
+            self._write_chunk(day, day_rows)
+        return len(rows)
+
+    def days(self) -> list[str]:
+        if not self.root.exists():
+            return []
+        return sorted(p.name for p in self.root.iterdir() if p.is_dir() and not p.name.startswith("."))
+
+    def chunk_paths(self, start_day: str | None = None, end_day: str | None = None) -> list[Path]:
+        paths: list[Path] = []
+        for day in self.days():
+            if (start_day is None or day >= start_day) and (end_day is None or day <= end_day):
+                paths.extend(sorted(p for p in (self.root / day).iterdir() if p.name.startswith("chunk-")))
+        return paths
+
+    @staticmethod
+    def load_chunk(path: Path, columns: tuple[str, ...] | None = None) -> dict[str, np.ndarray]:
+        return {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in columns or tuple(COLUMNS)}
+
+    def iter_chunks(
+        self, start_day: str | None = None, end_day: str | None = None, columns: tuple[str, ...] | None = None
+    ) -> Iterator[dict[str, np.ndarray]]:
+        for path in self.chunk_paths(start_day, end_day):
+            yield self.load_chunk(path, columns)
+
+    def scan(
+        self,
+        start_day: str | None = None,
+        end_day: str | None = None,
+        kind: str | None = None,
+        symbol: str | None = None,
+        exchange: str | None = None,
+        columns: tuple[str, ...] | None = None,
+    ) -> dict[str, np.ndarray]:
+        """Отфильтрованные колонки за диапазон дней; фильтры считаются по кодам, без декодирования строк."""
+        columns = columns or tuple(COLUMNS)
+        filters: list[tuple[str, int]] = []
+        if kind is not None:
+            filters.append(("kind", KINDS.index(kind)))
+        for field, name in (("symbol", symbol), ("exchange", exchange)):
+            if name is not None:
+                code = self.code(field, name)
+                if code is None:
+                    return {c: np.empty(0, dtype=COLUMNS[c]) for c in columns}
+                filters.append((field, code))
+        needed = tuple(dict.fromkeys(columns + tuple(field for field, _ in filters)))
+        parts: dict[str, list[np.ndarray]] = {c: [] for c in columns}
+        for chunk in self.iter_chunks(start_day, end_day, needed):
+            mask = np.ones(len(chunk[needed[0]]), dtype=bool)
+            for field, value in filters:
+                mask &= chunk[field] == value
+            for c in columns:
+                parts[c].append(np.asarray(chunk[c][mask]))
+        return {c: np.concatenate(parts[c]) if parts[c] else np.empty(0, dtype=COLUMNS[c]) for c in columns}
+
+    def _save_dictionary(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / "dictionary.json.tmp"
+        tmp.write_text(json.dumps(self.dictionary, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.root / "dictionary.json")
+
+    def _write_chunk(self, day: str, rows: list[tuple[Any, ...]]) -> None:
+        day_dir = self.root / day
+        day_dir.mkdir(parents=True, exist_ok=True)
+        seq = sum(1 for p in day_dir.iterdir() if p.name.startswith("chunk-"))
+        tmp = day_dir / f".tmp-{seq:06d}"
+        tmp.mkdir(exist_ok=True)
+        for n, (name, dtype) in enumerate(COLUMNS.items()):
+            np.save(tmp / f"{name}.npy", np.fromiter((row[n] for row in rows), dtype=dtype, count=len(rows)))
+        tmp.rename(day_dir / f"chunk-{seq:06d}")
+
+
+class TickRecorder:
+    """Асинхронная запись снапшотов скана в TickStore.
+
+    `record` только раскладывает снапшот в кортежи и копит их в буфере. Буфер уходит на запись
+    готовым чанком, когда набралось `chunk_rows` строк, когда старейшей строке буфера больше
+    `max_buffer_sec` (проверяется и по таймеру: при падении теряется не больше этого окна), когда
+    снапшот пришёл уже в новых UTC-сутках (чанк не пересекает границу дня) и при `close`;
+    кодирование и запись файлов идут в потоке (asyncio.to_thread). Снапшот целиком попадает в один
+    чанк. Буфер ограничен `max_pending_rows`: при переполнении снапшот отбрасывается, а не тормозит скан.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        chunk_rows: int = 50_000,
+        max_pending_rows: int = 500_000,
+        max_buffer_sec: float = 300.0,
+    ) -> None:
+        self.store = TickStore(root)
+        self.chunk_rows = chunk_rows
+        self.max_buffer_sec = max_buffer_sec
+        self.max_pending_rows = max_pending_rows
+        self.written = 0
+        self.dropped = 0
+        self._buffer: list[tuple[Any, ...]] = []
+        self._buffer_day: str | None = None
+        self._buffer_started = 0.0
+        self._ready: list[list[tuple[Any, ...]]] = []
+        self._books_seen: dict[tuple[str, str], float] = {}
+        self._in_flight = 0
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._closing = False
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer) + sum(len(rows) for rows in self._ready) + self._in_flight
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    def record(
+        self,
+        cex_data: list[dict[str, Any]],
+        dex_data: list[dict[str, Any]],
+        p2p_data: list[dict[str, Any]],
+        ts: float | None = None,
+    ) -> None:
+        ts = time.time() if ts is None else ts
+        self._append(tick_rows(ts, cex_data, dex_data, p2p_data), ts)
+
+    def hook(self, kind: str) -> Callable[[str, list[dict[str, Any]], float], None]:
+        """`on_load`-хук кэша парсера: пишет только реально загруженные снапшоты `kind` с их временем."""
+
+        def on_load(key: str, rows: list[dict[str, Any]], fetched_at: float) -> None:
+            snapshot: dict[str, list[dict[str, Any]]] = {name: [] for name in KINDS}
+            snapshot[kind] = rows
+            self.record(snapshot["cex"], snapshot["dex"], snapshot["p2p"], ts=fetched_at)
+
+        return on_load
+
+    def record_books(self, rows: list[dict[str, Any]]) -> None:
+        """Строки стрима из `OrderBookStore.rows`: пишутся только стаканы, обновившиеся с прошлой записи."""
+        fresh = []
+        for row in rows:
+            key = (row["exchange"], row["symbol"])
+            if row["updated_at"] > self._books_seen.get(key, 0.0):
+                self._books_seen[key] = row["updated_at"]
+                fresh.append(row)
+        if fresh:
+            ticks = [(row["updated_at"],) + tick[1:] for row, tick in zip(fresh, tick_rows(0.0, fresh, [], []))]
+            self._append(ticks, max(row["updated_at"] for row in fresh))
+
+    def _append(self, rows: list[tuple[Any, ...]], ts: float) -> None:
+        if self.pending + len(rows) > self.max_pending_rows:
+            self.dropped += len(rows)
+            logger.warning("Tick recorder backlog is full, dropped snapshot of %s rows", len(rows))
+            return
+        self.start()
+        day = time.strftime("%Y-%m-%d", time.gmtime(ts))
+        if day != self._buffer_day:
+            self._seal()
+            self._buffer_day = day
+        if not self._buffer:
+            self._buffer_started = time.monotonic()
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.chunk_rows or self._buffer_expired():
+            self._seal()
+
+    async def flush(self) -> None:
+        """Пишет готовые чанки; недобранный буфер остаётся копиться (его дописывает `close`)."""
+        async with self._lock:
+            while self._ready:
+                rows = self._ready.pop(0)
+                self._in_flight = len(rows)
+                try:
+                    self.written += await asyncio.to_thread(self.store.append, rows)
+                except Exception:  # noqa: BLE001
+                    logger.exception("Failed writing %s ticks", len(rows))
+                finally:
+                    self._in_flight = 0
+
+    async def close(self) -> None:
+        # задачу не отменяем: прерванная посреди to_thread запись продолжилась бы параллельно финальной
+        if self._task is not None:
+            self._closing = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        self._seal()
+        await self.flush()
+
+    def _buffer_expired(self) -> bool:
+        return bool(self._buffer) and time.monotonic() - self._buffer_started >= self.max_buffer_sec
+
+    def _seal(self) -> None:
+        if self._buffer:
+            self._ready.append(self._buffer)
+            self._buffer = []
+            self._wake.set()
+
+    async def _run(self) -> None:
+        while not self._closing:
+            age = time.monotonic() - self._buffer_started if self._buffer else 0.0
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(self.max_buffer_sec - age, 0.0))
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._buffer_expired():
+                self._seal()
+            await self.flush()
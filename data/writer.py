@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any
+
+from data.database import Database
+
+logger = logging.getLogger(__name__)
+
+
+class OpportunityWriter:
+    """Write-behind запись возможностей: очередь строк и пакетный executemany в одной транзакции.
+
+    Пакет сбрасывается при `batch_size` строк или через `flush_interval_sec` после первой строки.
+    Очередь ограничена `max_queue`: при переполнении `enqueue` ждёт (backpressure).
+    `flush`/`close` кладут в очередь маркер, по которому текущий пакет пишется сразу.
+    `flush_user` ждёт только строки одного пользователя (для /history и экспорта), а не всю очередь.
+    """
+
+    def __init__(self, db: Database, batch_size: int = 200, flush_interval_sec: float = 1.0, max_queue: int = 10_000) -> None:
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval_sec = flush_interval_sec
+        self._queue: asyncio.Queue[tuple[Any, ...] | None] = asyncio.Queue(maxsize=max_queue)
+        self._task: asyncio.Task[None] | None = None
+        self._pending_by_user: dict[int | None, int] = {}
+        self._batch_done = asyncio.Condition()
+        self.written = 0
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def enqueue(self, user_id: int | None, opportunity: dict[str, Any]) -> None:
+        self.start()
+        # счётчик растёт до put: строку могут записать раньше, чем put вернёт управление
+        self._pending_by_user[user_id] = self._pending_by_user.get(user_id, 0) + 1
+        try:
+            await self._queue.put(Database.opportunity_row(user_id, opportunity))
+        except BaseException:
+            self._release([user_id])
+            raise
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def flush(self) -> None:
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._queue.join()
+
+    async def flush_user(self, user_id: int | None, timeout_sec: float = 2.0) -> bool:
+        """Ждёт записи уже поставленных строк `user_id`, но не дольше `timeout_sec`.
+
+        Возвращает False по таймауту: тогда вызывающий читает то, что уже успело лечь в БД.
+        """
+        if self._task is None or not self._pending_by_user.get(user_id):
+            return True
+        try:
+            # маркер обрывает ожидание добора пакета; при полной очереди пакет и так уйдёт скоро
+            self._queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+        try:
+            async with self._batch_done:
+                await asyncio.wait_for(self._batch_done.wait_for(lambda: not self._pending_by_user.get(user_id)), timeout_sec)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        await self.flush()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch: list[tuple[Any, ...]] = []
+            received = 0
+            item = await self._queue.get()
+            received += 1
+            deadline = loop.time() + self.flush_interval_sec
+            while item is not None:
+                batch.append(item)
+                timeout = deadline - loop.time()
+                if len(batch) >= self.batch_size or timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                received += 1
+            try:
+                if batch:
+                    await self.db.save_opportunities(batch)
+                    self.written += len(batch)
+            except Exception:  # noqa: BLE001
+                logger.exception("Failed writing %s opportunities", len(batch))
+            finally:
+                self._release([row[0] for row in batch])
+                async with self._batch_done:
+                    self._batch_done.notify_all()
+                for _ in range(received):
+                    self._queue.task_done()
+
+    def _release(self, user_ids: list[int | None]) -> None:
+        for user_id in user_ids:
+            left = self._pending_by_user.get(user_id, 0) - 1
+            if left > 0:
+                self._pending_by_user[user_id] = left
+            else:
+                self._pending_by_user.pop(user_id, None)
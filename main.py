@@ -2,12 +2,18 @@ from __future__ import annotations
 
 import asyncio
 import logging
+from functools import partial
 
 from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, filters
 
+from analyzers import OpportunityIndex
+from analyzers.incremental import IncrementalAnalyzer
 from bot import callbacks, export_history, history, scan, settings_handler, start
+from bot.messages import format_alert
+from bot.notifier import Notifier
 from config import get_settings
-from data import Database
+from data import AlertStateStore, RetentionManager
+from utils.http_client import get_http_client
 
 logging.basicConfig(
     level=logging.INFO,
@@ -15,45 +21,40 @@ logging.basicConfig(
 )
 
 
-async def periodic_scan(application: Application) -> None:
-    from bot.handlers import _collect_data, analyzer, db  # локальный import, чтобы не создавать циклы
+async def periodic_scan(notifier: Notifier) -> None:
+    from bot.handlers import _collect_data, analyzer, db, writer  # локальный import, чтобы не создавать циклы
 
     settings = get_settings()
+    incremental = IncrementalAnalyzer(analyzer, settings.min_profit_percent)
+    alerts = AlertStateStore(settings.alert_cooldown_sec, settings.alert_min_spread_delta, settings.alert_state_max_entries)
+    await alerts.load(db)
     while True:
         await asyncio.sleep(settings.scan_interval_sec)
-        users = await _get_users(db)
+        users = [user for user in await db.get_users() if bool(user["notifications_enabled"])]
         if not users:
             continue
 
-        cex_data, dex_data, p2p_data = await _collect_data(["BTC/USDT", "ETH/USDT", "SOL/USDT", "ETH/BTC"])
+        # состояние считается один раз на минимальном пороге пользователей, дальше только фильтр
+        floor = min(float(user["min_profit_percent"]) for user in users)
+        if floor != incremental.min_profit_percent:
+            incremental.reset(floor)
+        cex_data, dex_data, p2p_data = await _collect_data(settings.scan_symbols)
+        incremental.update(cex_data, dex_data, p2p_data)
+        # кандидаты — весь текущий набор: держащиеся возможности и новые пользователи тоже получают
+        # алерты, а повторы режет AlertStateStore по кулдауну и изменению спреда
+        index = OpportunityIndex(incremental.current())
         for user in users:
-            if not bool(user["notifications_enabled"]):
-                continue
-            opportunities = analyzer.find(
-                cex_data,
-                dex_data,
-                p2p_data,
-                min_profit_percent=float(user["min_profit_percent"]),
-                strategy=str(user["selected_strategy"]),
-            )
-            for op in opportunities[:3]:
-                await db.save_opportunity(user["user_id"], op)
-                try:
-                    await application.bot.send_message(
-                        chat_id=user["user_id"],
-                        text=(f"🚨 {op['route']}\nДоходность: {op['spread_percent']:.2f}%"),
-                    )
-                except Exception:  # noqa: BLE001
-                    logging.exception("Failed sending notification")
-
-
-async def _get_users(db: Database) -> list[dict]:
-    import aiosqlite
-
-    async with aiosqlite.connect(db.db_path) as conn:
-        conn.row_factory = aiosqlite.Row
-        async with conn.execute("SELECT * FROM users") as cur:
-            return [dict(r) for r in await cur.fetchall()]
+            opportunities = index.top(float(user["min_profit_percent"]), str(user["selected_strategy"]), limit=3)
+            for op in opportunities:
+                user_id, route, spread = user["user_id"], op["route"], float(op["spread_percent"])
+                if not alerts.should_send(user_id, route, spread):
+                    continue
+                await writer.enqueue(user_id, op)
+                # отправка фиксируется после доставки; пока алерт в очереди, повтор заменяет его, а не дублирует
+                notifier.enqueue(user_id, format_alert(op), key=route, on_sent=partial(alerts.mark_sent, user_id, route, spread))
+        await alerts.flush(db)
+        stats = notifier.stats()
+        logging.info("Notifications: queue=%s lag=%.1fs sent=%s failed=%s", stats.queue_depth, stats.last_lag_sec, stats.sent, stats.failed)
 
 
 def build_application() -> Application:
@@ -77,21 +78,59 @@ def build_application() -> Application:
 
 
 async def main() -> None:
+    from bot.handlers import cex_parser, db, dex_parser, p2p_parser, recorder, writer
+
     settings = get_settings()
-    db = Database(settings.database_path)
     await db.init()
+    # снапшоты прошлого запуска из L2: первый /scan отвечает сразу, обновление идёт в фоне
+    restored = await asyncio.gather(*(parser.cache.restore() for parser in (cex_parser, dex_parser, p2p_parser)))
+    logging.info("Restored %s cached snapshots from SQLite", sum(restored))
+    writer.start()
+    retention = RetentionManager(
+        db,
+        raw_days=settings.retention_raw_days,
+        hourly_days=settings.retention_hourly_days,
+        daily_days=settings.retention_daily_days,
+        interval_sec=settings.retention_interval_sec,
+        vacuum_pages=settings.vacuum_pages,
+    )
+    retention.start()
 
     app = build_application()
-    app.create_task(periodic_scan(app))
+    http = get_http_client()
+    await http.start()
+    if settings.cex_streaming:
+        cex_parser.start_streaming(settings.scan_symbols)
+    notifier = Notifier(
+        app.bot,
+        workers=settings.notify_workers,
+        global_rate=settings.notify_global_rate,
+        chat_rate=settings.notify_chat_rate,
+        max_retries=settings.notify_max_retries,
+    )
     await app.initialize()
+    notifier.start()
+    scanner = app.create_task(periodic_scan(notifier))
     await app.start()
     await app.updater.start_polling()
     try:
         while True:
             await asyncio.sleep(3600)
     finally:
+        # app.stop() ждёт все задачи из app.create_task, бесконечный цикл сканера надо снять заранее
+        scanner.cancel()
+        await asyncio.gather(scanner, return_exceptions=True)
+        await app.updater.stop()
+        await notifier.close()
         await app.stop()
         await app.shutdown()
+        await cex_parser.close()
+        await http.close()
+        await retention.close()
+        if recorder is not None:
+            await recorder.close()
+        await writer.close()
+        await db.close()
 
 
 if __name__ == "__main__":
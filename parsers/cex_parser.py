@@ -2,86 +2,185 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from typing import Any
-
-import ccxt.async_support as ccxt
+from typing import Any, Awaitable, Callable
 
 from config import get_settings
-from utils import AsyncRateLimiter, AsyncTTLCache
+from parsers.cex_stream import CEXStreamer
+from parsers.currency_metadata import CurrencyMetadataCache
+from parsers.exchange_pool import ExchangePool
+from parsers.order_book_store import CompactBook, OrderBookStore
+from utils import AsyncRateLimiter, CircuitBreaker, CircuitOpenError, TwoTierCache
+from utils.circuit_breaker import get_circuit_breaker
 
 logger = logging.getLogger(__name__)
 
+CEX_ENDPOINT_WEIGHTS = {
+    "load_markets": 10.0,
+    "fetch_currencies": 5.0,
+    "fetch_tickers": 4.0,
+    "fetch_order_books": 4.0,
+    "fetch_ticker": 1.0,
+    "fetch_order_book": 1.0,
+}
+
 
 class CEXParser:
-    def __init__(self) -> None:
+    def __init__(self, breaker: CircuitBreaker | None = None) -> None:
         self.settings = get_settings()
-        self.cache: AsyncTTLCache[list[dict[str, Any]]] = AsyncTTLCache(self.settings.cache_ttl_sec)
-        self.rate_limiter = AsyncRateLimiter(self.settings.max_api_calls_per_sec, 1.0)
+        self.breaker = breaker or get_circuit_breaker()
+        self.cache: TwoTierCache[list[dict[str, Any]]] = TwoTierCache(
+            self.settings.cache_ttl_sec,
+            namespace="cex",
+            encode=self._encode_rows,
+            decode=self._decode_rows,
+            max_entries=self.settings.cache_max_entries,
+            max_bytes=self.settings.cache_max_bytes,
+            stale_ttl_seconds=self.settings.cache_stale_ttl_sec,
+            negative_ttl_seconds=self.settings.cache_negative_ttl_sec,
+        )
+        self.rate_limiter = AsyncRateLimiter(
+            self.settings.max_api_calls_per_sec,
+            1.0,
+            venue_limits=self.settings.venue_rate_limits,
+            endpoint_weights=CEX_ENDPOINT_WEIGHTS,
+        )
+        self.exchanges = ExchangePool(
+            self.settings.markets_ttl_sec,
+            rate_limiter=self.rate_limiter,
+            breaker=self.breaker,
+        )
+        self.currency_meta = CurrencyMetadataCache(
+            self.settings.currency_meta_path,
+            self.settings.currency_meta_ttl_sec,
+            rate_limiter=self.rate_limiter,
+        )
+        self.book_store = OrderBookStore(depth=self.settings.stream_depth)
+        self.streamer = CEXStreamer(self.book_store, currency_meta=self.currency_meta)
+
+    @property
+    def streaming(self) -> bool:
+        return self.streamer.running and len(self.book_store) > 0
 
-    async def fetch_market_snapshot(self, symbols: list[str]) -> list[dict[str, Any]]:
+    def start_streaming(self, symbols: list[str]) -> None:
+        self.streamer.start(self.settings.enabled_cex, symbols)
+
+    async def fetch_market_snapshot(self, symbols: list[str], exchanges: list[str] | None = None) -> list[dict[str, Any]]:
+        """REST-снапшот по `exchanges` (по умолчанию все включённые биржи)."""
+        exchanges = self.settings.enabled_cex if exchanges is None else exchanges
         cache_key = f"cex:{','.join(sorted(symbols))}"
-        cached = await self.cache.get(cache_key)
-        if cached:
-            return cached
+        if sorted(exchanges) != sorted(self.settings.enabled_cex):
+            cache_key += f"@{','.join(sorted(exchanges))}"
+        return await self.cache.get_or_load(cache_key, lambda: self._fetch_all_exchanges(symbols, exchanges))
+
+    @staticmethod
+    def _encode_rows(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        return [{**row, "book": row["book"].to_levels()} if row.get("book") is not None else row for row in rows]
 
-        tasks = [self._fetch_exchange(exchange_id, symbols) for exchange_id in self.settings.enabled_cex]
+    @staticmethod
+    def _decode_rows(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        for row in rows:
+            if row.get("book") is not None:
+                row["book"] = CompactBook.from_levels(row["book"]["bids"], row["book"]["asks"])
+        return rows
+
+    async def _fetch_all_exchanges(self, symbols: list[str], exchanges: list[str]) -> list[dict[str, Any]]:
+        tasks = [self._fetch_exchange(exchange_id, symbols) for exchange_id in exchanges]
         results = [x for x in await asyncio.gather(*tasks, return_exceptions=True) if not isinstance(x, Exception)]
-        flattened = [item for sub in results for item in sub]
-        await self.cache.set(cache_key, flattened)
-        return flattened
+        return [item for sub in results for item in sub]
 
     async def _fetch_exchange(self, exchange_id: str, symbols: list[str]) -> list[dict[str, Any]]:
-        exchange_cls = getattr(ccxt, exchange_id, None)
-        if not exchange_cls:
-            return []
-
-        exchange = exchange_cls({"enableRateLimit": True, "timeout": 12000})
         try:
-            await self.rate_limiter.wait()
-            await exchange.load_markets()
-            out: list[dict[str, Any]] = []
-            for symbol in symbols:
-                if symbol not in exchange.markets:
-                    continue
-                await self.rate_limiter.wait()
-                ticker = await exchange.fetch_ticker(symbol)
-                await self.rate_limiter.wait()
-                order_book = await exchange.fetch_order_book(symbol, limit=10)
-                quote_asset = symbol.split("/")[-1]
-                network_fees = await self._get_network_fees(exchange, quote_asset)
-                out.append(
-                    {
-                        "source": "CCXT",
-                        "exchange": exchange_id,
-                        "symbol": symbol,
-                        "spot_price": ticker.get("last") or ticker.get("close"),
-                        "bid": ticker.get("bid"),
-                        "ask": ticker.get("ask"),
-                        "futures_price": None,
-                        "orderbook_depth": self._depth(order_book),
-                        "network_fees": network_fees,
-                        "maker_fee": exchange.fees.get("trading", {}).get("maker", 0.001),
-                        "taker_fee": exchange.fees.get("trading", {}).get("taker", 0.001),
-                    }
-                )
-            return out
+            exchange = await self.exchanges.get(exchange_id)
+            if exchange is None:
+                return []
+            return await self._fetch_exchange_rows(exchange_id, exchange, symbols)
+        except CircuitOpenError:
+            logger.debug("CEX %s skipped: circuit open", exchange_id)
+            return []
         except Exception as exc:  # noqa: BLE001
             logger.warning("CEX fetch error %s: %s", exchange_id, exc)
             return []
-        finally:
-            await exchange.close()
 
-    async def _get_network_fees(self, exchange: Any, currency: str) -> dict[str, float]:
-        try:
-            await self.rate_limiter.wait()
-            currencies = await exchange.fetch_currencies()
-            c = currencies.get(currency, {})
-            networks = c.get("networks", {})
-            return {name: float(net.get("fee") or 0) for name, net in networks.items()}
-        except Exception:  # noqa: BLE001
-            return {"TRC20": 1.0, "BEP20": 0.3, "ERC20": 5.0}
-
-    def _depth(self, order_book: dict[str, Any]) -> float:
-        bids = order_book.get("bids", [])[:10]
-        asks = order_book.get("asks", [])[:10]
-        return float(sum(level[1] for level in bids + asks if len(level) >= 2))
+    async def _fetch_exchange_rows(self, exchange_id: str, exchange: Any, symbols: list[str]) -> list[dict[str, Any]]:
+        listed = [symbol for symbol in symbols if symbol in exchange.markets]
+        if not listed:
+            return []
+        self.currency_meta.schedule_refresh(exchange_id, exchange)
+        tickers = await self._fetch_tickers(exchange, listed)
+        order_books = await self._fetch_order_books(exchange, listed)
+        out: list[dict[str, Any]] = []
+        for symbol in listed:
+            ticker = tickers.get(symbol)
+            if not ticker:
+                continue
+            quote_asset = symbol.split("/")[-1]
+            network_fees = self.currency_meta.network_fees(exchange_id, quote_asset)
+            order_book = order_books.get(symbol) or {}
+            book = CompactBook.from_levels(order_book.get("bids", []), order_book.get("asks", []), self.settings.orderbook_levels)
+            out.append(
+                {
+                    "source": "CCXT",
+                    "exchange": exchange_id,
+                    "symbol": symbol,
+                    "spot_price": ticker.get("last") or ticker.get("close"),
+                    "bid": ticker.get("bid"),
+                    "ask": ticker.get("ask"),
+                    "futures_price": None,
+                    "orderbook_depth": book.total_size(),
+                    "book": book,
+                    "network_fees": network_fees,
+                    "maker_fee": exchange.fees.get("trading", {}).get("maker", 0.001),
+                    "taker_fee": exchange.fees.get("trading", {}).get("taker", 0.001),
+                }
+            )
+        return out
+
+    # токены лимитера берутся до входа в breaker: ожидание своей очереди не должно съедать
+    # таймаут запроса и попадать в латентность площадки, по которой breaker считает p95
+    async def _fetch_tickers(self, exchange: Any, symbols: list[str]) -> dict[str, dict[str, Any]]:
+        if exchange.has.get("fetchTickers"):
+            await self.rate_limiter.wait(exchange.id, "fetch_tickers")
+            return await self.breaker.call(exchange.id, lambda: exchange.fetch_tickers(symbols))
+        return await self._fetch_per_symbol(exchange.id, "fetch_ticker", symbols, exchange.fetch_ticker)
+
+    async def _fetch_order_books(self, exchange: Any, symbols: list[str]) -> dict[str, dict[str, Any]]:
+        if exchange.has.get("fetchOrderBooks"):
+            await self.rate_limiter.wait(exchange.id, "fetch_order_books")
+            return await self.breaker.call(exchange.id, lambda: exchange.fetch_order_books(symbols, limit=self.settings.orderbook_levels))
+        return await self._fetch_per_symbol(
+            exchange.id, "fetch_order_book", symbols, lambda symbol: exchange.fetch_order_book(symbol, limit=self.settings.orderbook_levels)
+        )
+
+    async def _fetch_per_symbol(
+        self,
+        exchange_id: str,
+        endpoint: str,
+        symbols: list[str],
+        fetch: Callable[[str], Awaitable[dict[str, Any]]],
+    ) -> dict[str, dict[str, Any]]:
+        """Фолбэк для бирж без bulk-эндпоинтов: параллельно, но не более N запросов на биржу.
+
+        Если не удался ни один символ, пробрасывает первую ошибку (в том числе CircuitOpenError).
+        """
+        semaphore = asyncio.Semaphore(self.settings.cex_symbol_concurrency)
+
+        async def fetch_one(symbol: str) -> dict[str, Any]:
+            async with semaphore:
+                await self.rate_limiter.wait(exchange_id, endpoint)
+                return await self.breaker.call(exchange_id, lambda: fetch(symbol))
+
+        results = await asyncio.gather(*(fetch_one(symbol) for symbol in symbols), return_exceptions=True)
+        if results and all(isinstance(result, Exception) for result in results):
+            raise results[0]
+        out: dict[str, dict[str, Any]] = {}
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, Exception):
+                logger.warning("CEX per-symbol fetch error %s: %s", symbol, result)
+                continue
+            out[symbol] = result
+        return out
+
+    async def close(self) -> None:
+        await self.streamer.close()
+        await self.currency_meta.close()
+        await self.exchanges.close()
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Callable
+
+from parsers.currency_metadata import CurrencyMetadataCache
+from parsers.order_book_store import OrderBookStore
+
+logger = logging.getLogger(__name__)
+
+UpdateSource = Callable[[str, str], AsyncIterator[dict[str, Any]]]
+
+
+class CEXStreamer:
+    """WebSocket-подписки на стаканы (ccxt.pro), складывающие обновления в `OrderBookStore`.
+
+    `source` позволяет подменить источник обновлений, например воспроизведением записанного фида.
+    """
+
+    def __init__(
+        self,
+        store: OrderBookStore,
+        currency_meta: CurrencyMetadataCache | None = None,
+        source: UpdateSource | None = None,
+        reconnect_delay_sec: float = 5.0,
+    ) -> None:
+        self.store = store
+        self.currency_meta = currency_meta
+        self.reconnect_delay_sec = reconnect_delay_sec
+        self._source = source or self._ccxt_source
+        self._clients: dict[str, Any] = {}
+        self._client_locks: dict[str, asyncio.Lock] = {}
+        self._tasks: dict[tuple[str, str], asyncio.Task[None]] = {}
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks.values())
+
+    def start(self, exchange_ids: list[str], symbols: list[str]) -> None:
+        for exchange_id in exchange_ids:
+            for symbol in symbols:
+                key = (exchange_id, symbol)
+                if key not in self._tasks or self._tasks[key].done():
+                    self._tasks[key] = asyncio.create_task(self._run(exchange_id, symbol))
+
+    async def close(self) -> None:
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            try:
+                await client.close()
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Failed closing stream client: %s", exc)
+
+    async def _run(self, exchange_id: str, symbol: str) -> None:
+        while True:
+            try:
+                async for update in self._source(exchange_id, symbol):
+                    self.store.apply(exchange_id, symbol, update)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Stream error %s %s: %s", exchange_id, symbol, exc)
+                await asyncio.sleep(self.reconnect_delay_sec)
+
+    async def _ccxt_source(self, exchange_id: str, symbol: str) -> AsyncIterator[dict[str, Any]]:
+        client = await self._ccxt_client(exchange_id)
+        if client is None or not client.has.get("watchOrderBook"):
+            return
+        if symbol not in client.markets:
+            return
+        trading_fees = client.fees.get("trading", {})
+        self.store.set_meta(
+            exchange_id,
+            symbol,
+            maker_fee=trading_fees.get("maker", 0.001),
+            taker_fee=trading_fees.get("taker", 0.001),
+            network_fees=self.currency_meta.network_fees(exchange_id, symbol.split("/")[-1]) if self.currency_meta else {},
+        )
+        while True:
+            # ccxt.pro сам применяет дельты к локальной копии стакана, отдаём верхние уровни
+            order_book = await client.watch_order_book(symbol, self.store.depth)
+            yield {
+                "type": "snapshot",
+                "bids": order_book.get("bids", [])[: self.store.depth],
+                "asks": order_book.get("asks", [])[: self.store.depth],
+            }
+
+    async def _ccxt_client(self, exchange_id: str) -> Any | None:
+        async with self._client_locks.setdefault(exchange_id, asyncio.Lock()):
+            client = self._clients.get(exchange_id)
+            if client is not None:
+                return client
+            try:
+                import ccxt.pro as ccxtpro
+            except ImportError as exc:
+                raise RuntimeError("Для стриминга нужна ccxt с поддержкой ccxt.pro") from exc
+
+            exchange_cls = getattr(ccxtpro, exchange_id, None)
+            if not exchange_cls:
+                return None
+            client = exchange_cls({"enableRateLimit": True})
+            try:
+                await client.load_markets()
+            except Exception:
+                await client.close()
+                raise
+            self._clients[exchange_id] = client
+            return client
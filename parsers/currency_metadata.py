@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any
+
+from utils import AsyncRateLimiter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NETWORK_FEES = {"TRC20": 1.0, "BEP20": 0.3, "ERC20": 5.0}
+
+
+class CurrencyMetadataCache:
+    """Кэш currencies/networks/withdraw fees по биржам.
+
+    Обновляется в фоне по долгому TTL и сохраняется на диск, поэтому путь сканирования
+    никогда не ждёт `fetch_currencies()`.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int, rate_limiter: AsyncRateLimiter | None = None) -> None:
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.rate_limiter = rate_limiter
+        self._fees: dict[str, dict[str, dict[str, float]]] = {}
+        self._fetched_at: dict[str, float] = {}
+        self._refreshing: dict[str, asyncio.Task[None]] = {}
+        self._save_lock = asyncio.Lock()
+        self._load()
+
+    def network_fees(self, exchange_id: str, currency: str) -> dict[str, float]:
+        fees = self._fees.get(exchange_id, {}).get(currency)
+        return dict(fees) if fees is not None else dict(DEFAULT_NETWORK_FEES)
+
+    def is_stale(self, exchange_id: str) -> bool:
+        fetched_at = self._fetched_at.get(exchange_id)
+        return fetched_at is None or time.time() - fetched_at > self.ttl_seconds
+
+    def schedule_refresh(self, exchange_id: str, exchange: Any) -> None:
+        if not self.is_stale(exchange_id) or exchange_id in self._refreshing:
+            return
+        task = asyncio.create_task(self.refresh(exchange_id, exchange))
+        self._refreshing[exchange_id] = task
+        task.add_done_callback(lambda done: self._refresh_done(exchange_id, done))
+
+    async def refresh(self, exchange_id: str, exchange: Any) -> None:
+        try:
+            if self.rate_limiter:
+                await self.rate_limiter.wait(exchange_id, "fetch_currencies")
+            currencies = await exchange.fetch_currencies()
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Currency metadata refresh failed %s: %s", exchange_id, exc)
+            return
+
+        self._fees[exchange_id] = {
+            code: {name: float((net or {}).get("fee") or 0) for name, net in ((c or {}).get("networks") or {}).items()}
+            for code, c in (currencies or {}).items()
+        }
+        self._fetched_at[exchange_id] = time.time()
+        await self._save()
+
+    async def close(self) -> None:
+        tasks = list(self._refreshing.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            payload = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as exc:
+            logger.warning("Failed loading currency metadata %s: %s", self.path, exc)
+            return
+        for exchange_id, entry in payload.get("exchanges", {}).items():
+            self._fees[exchange_id] = entry.get("currencies", {})
+            self._fetched_at[exchange_id] = float(entry.get("fetched_at", 0))
+
+    def _refresh_done(self, exchange_id: str, task: asyncio.Task[None]) -> None:
+        self._refreshing.pop(exchange_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Currency metadata refresh crashed %s: %s", exchange_id, task.exception())
+
+    async def _save(self) -> None:
+        # JSON собирается на event loop (словари меняются только там), в поток уходит готовая строка;
+        # лок не даёт двум сохранениям писать один .tmp и гоняться на replace
+        async with self._save_lock:
+            payload = {
+                "exchanges": {
+                    exchange_id: {"fetched_at": self._fetched_at.get(exchange_id, 0), "currencies": fees}
+                    for exchange_id, fees in self._fees.items()
+                }
+            }
+            text = json.dumps(payload, ensure_ascii=False)
+            try:
+                await asyncio.to_thread(self._write, text)
+            except OSError as exc:
+                logger.warning("Failed saving currency metadata %s: %s", self.path, exc)
+
+    def _write(self, text: str) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(text, encoding="utf-8")
+        tmp.replace(self.path)
@@ -9,46 +9,69 @@ from web3 import AsyncWeb3
 from web3.providers.async_rpc import AsyncHTTPProvider
 
 from config import get_settings
-from utils import AsyncRateLimiter, AsyncTTLCache, retry_async
+from utils import AsyncRateLimiter, CircuitBreaker, CircuitOpenError, TwoTierCache, retry_async
+from utils.circuit_breaker import get_circuit_breaker
+from utils.http_client import HttpClient, get_http_client
 
 logger = logging.getLogger(__name__)
 
 
 class DEXParser:
-    def __init__(self) -> None:
+    def __init__(self, http: HttpClient | None = None, breaker: CircuitBreaker | None = None) -> None:
         self.settings = get_settings()
-        self.cache: AsyncTTLCache[list[dict[str, Any]]] = AsyncTTLCache(self.settings.cache_ttl_sec)
-        self.last_success: dict[str, list[dict[str, Any]]] = {}
-        self.rate_limiter = AsyncRateLimiter(self.settings.max_api_calls_per_sec, 1.0)
+        self.http = http or get_http_client()
+        self.breaker = breaker or get_circuit_breaker()
+        self.cache: TwoTierCache[list[dict[str, Any]]] = TwoTierCache(
+            self.settings.cache_ttl_sec,
+            namespace="coincap",
+            max_entries=self.settings.cache_max_entries,
+            max_bytes=self.settings.cache_max_bytes,
+            stale_ttl_seconds=self.settings.cache_stale_ttl_sec,
+            negative_ttl_seconds=self.settings.cache_negative_ttl_sec,
+        )
+        self.rate_limiter = AsyncRateLimiter(
+            self.settings.max_api_calls_per_sec, 1.0, venue_limits=self.settings.venue_rate_limits
+        )
         self.graph_endpoints = {
             "ethereum": "https://api.thegraph.com/subgraphs/name/uniswap/uniswap-v3",
             "bsc": "https://api.thegraph.com/subgraphs/name/pancakeswap/exchange-v3-bsc",
             "polygon": "https://api.thegraph.com/subgraphs/name/ianlapham/uniswap-v3-polygon",
         }
 
-    @retry_async(retries=2, delay=1)
     async def fetch_coincap_prices(self, assets: list[str]) -> list[dict[str, Any]]:
         cache_key = f"coincap:{','.join(sorted(assets))}"
-        cached = await self.cache.get(cache_key)
-        if cached:
-            return cached
-
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=15)) as session:
-                tasks = [self._fetch_asset(session, asset) for asset in assets]
-                prices = [x for x in await asyncio.gather(*tasks, return_exceptions=False) if x]
-                await self.cache.set(cache_key, prices)
-                self.last_success[cache_key] = prices
-                return prices
+            prices = await self.cache.get_or_load(cache_key, lambda: self._load_coincap_prices(assets))
         except Exception as exc:  # noqa: BLE001
             logger.warning("DEX fetch failed, fallback to stale cache: %s", exc)
-            return self.last_success.get(cache_key, [])
+            return await self.cache.get_stale(cache_key) or []
+        return prices
+
+    # открытый breaker не лечится повтором через секунду: сразу отдаём stale из кеша
+    @retry_async(retries=2, delay=1, no_retry=(CircuitOpenError,))
+    async def _load_coincap_prices(self, assets: list[str]) -> list[dict[str, Any]]:
+        session = self.http.session()
+        results = await asyncio.gather(*(self._fetch_asset(session, asset) for asset in assets), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors and len(errors) == len(results):
+            raise errors[0]
+        for error in errors:
+            logger.warning("CoinCap asset fetch failed: %s", error)
+        return [x for x in results if x and not isinstance(x, Exception)]
 
     async def _fetch_asset(self, session: aiohttp.ClientSession, asset: str) -> dict[str, Any] | None:
-        await self.rate_limiter.wait()
-        async with session.get(f"{self.settings.coincap_base_url}/assets/{asset.lower()}") as resp:
-            if resp.status != 200:
+        # токен берётся до breaker: ожидание лимита не входит в таймаут и латентность CoinCap
+        await self.rate_limiter.wait("coincap")
+        return await self.breaker.call("coincap", lambda: self._request_asset(session, asset))
+
+    async def _request_asset(self, session: aiohttp.ClientSession, asset: str) -> dict[str, Any] | None:
+        url = f"{self.settings.coincap_base_url}/assets/{asset.lower()}"
+        async with session.get(url, timeout=self.http.timeout("coincap")) as resp:
+            if resp.status == 404:
+                # актив не листится на CoinCap — это не сбой площадки
                 return None
+            # остальные не-200 (429, 5xx) — ошибки, которые должен посчитать breaker
+            resp.raise_for_status()
             data = await resp.json()
             asset_data = data.get("data", {})
             return {
@@ -75,24 +98,26 @@ class DEXParser:
             """
             % (token0, token1)
         }
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
-            await self.rate_limiter.wait()
-            async with session.post(endpoint, json=query) as resp:
-                if resp.status != 200:
-                    return None
-                data = await resp.json()
-                pools = data.get("data", {}).get("pools", [])
-                if not pools:
-                    return None
-                p = pools[0]
-                return {
-                    "source": "TheGraph",
-                    "exchange": f"{network}-dex",
-                    "symbol": f"{token0}/{token1}",
-                    "price": float(p.get("token0Price", 0)),
-                    "liquidity": float(p.get("totalValueLockedUSD", 0)),
-                    "network": network,
-                }
+        await self.rate_limiter.wait("thegraph")
+        return await self.breaker.call("thegraph", lambda: self._query_graph_pool(endpoint, query, network, token0, token1))
+
+    async def _query_graph_pool(self, endpoint: str, query: dict[str, str], network: str, token0: str, token1: str) -> dict[str, Any] | None:
+        session = self.http.session()
+        async with session.post(endpoint, json=query, timeout=self.http.timeout("thegraph")) as resp:
+            resp.raise_for_status()
+            data = await resp.json()
+            pools = data.get("data", {}).get("pools", [])
+            if not pools:
+                return None
+            p = pools[0]
+            return {
+                "source": "TheGraph",
+                "exchange": f"{network}-dex",
+                "symbol": f"{token0}/{token1}",
+                "price": float(p.get("token0Price", 0)),
+                "liquidity": float(p.get("totalValueLockedUSD", 0)),
+                "network": network,
+            }
 
     async def fetch_gas_price_gwei(self, rpc_url: str) -> float:
         w3 = AsyncWeb3(AsyncHTTPProvider(rpc_url))
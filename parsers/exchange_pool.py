@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable
+
+import ccxt.async_support as ccxt
+
+from utils import AsyncRateLimiter, CircuitBreaker, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+
+def _default_factory(exchange_id: str, timeout_ms: int) -> Any | None:
+    exchange_cls = getattr(ccxt, exchange_id, None)
+    if not exchange_cls:
+        return None
+    return exchange_cls({"enableRateLimit": True, "timeout": timeout_ms})
+
+
+class ExchangePool:
+    """Реестр долгоживущих ccxt-клиентов: одна HTTP-сессия и один набор markets на биржу.
+
+    Markets перезагружаются по TTL или по требованию через `reload_markets`. Если передан `breaker`,
+    через него идёт только сетевая загрузка markets (площадка `<exchange>:markets`): `get` с уже
+    загруженными markets возвращается мгновенно и не должен попадать в статистику латентности.
+    """
+
+    def __init__(
+        self,
+        markets_ttl_sec: int,
+        timeout_ms: int = 12000,
+        rate_limiter: AsyncRateLimiter | None = None,
+        factory: Callable[[str, int], Any | None] | None = None,
+        breaker: CircuitBreaker | None = None,
+    ) -> None:
+        self.markets_ttl_sec = markets_ttl_sec
+        self.timeout_ms = timeout_ms
+        self.rate_limiter = rate_limiter
+        self.breaker = breaker
+        self._factory = factory or _default_factory
+        self._clients: dict[str, Any] = {}
+        self._markets_loaded_at: dict[str, float] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    async def get(self, exchange_id: str) -> Any | None:
+        client = self._clients.get(exchange_id)
+        if client is None:
+            client = self._factory(exchange_id, self.timeout_ms)
+            if client is None:
+                return None
+            self._clients[exchange_id] = client
+
+        if self._markets_stale(exchange_id):
+            lock = self._locks.setdefault(exchange_id, asyncio.Lock())
+            async with lock:
+                if self._markets_stale(exchange_id):
+                    try:
+                        await self._load_markets(exchange_id, client)
+                    except Exception as exc:  # noqa: BLE001
+                        # при неудачной перезагрузке работаем на прежних markets, повтор на следующем get
+                        if not getattr(client, "markets", None):
+                            raise
+                        level = logging.DEBUG if isinstance(exc, CircuitOpenError) else logging.WARNING
+                        logger.log(level, "Markets reload failed for %s, keeping previous: %s", exchange_id, exc)
+        return client
+
+    async def reload_markets(self, exchange_id: str | None = None) -> None:
+        targets = [exchange_id] if exchange_id else list(self._clients)
+        for target in targets:
+            self._markets_loaded_at.pop(target, None)
+            if target in self._clients:
+                await self.get(target)
+
+    async def close(self) -> None:
+        clients = list(self._clients.items())
+        self._clients.clear()
+        self._markets_loaded_at.clear()
+        for exchange_id, client in clients:
+            try:
+                await client.close()
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Failed closing exchange client %s: %s", exchange_id, exc)
+
+    def _markets_stale(self, exchange_id: str) -> bool:
+        loaded_at = self._markets_loaded_at.get(exchange_id)
+        return loaded_at is None or time.monotonic() - loaded_at > self.markets_ttl_sec
+
+    async def _load_markets(self, exchange_id: str, client: Any) -> None:
+        if self.rate_limiter:
+            await self.rate_limiter.wait(exchange_id, "load_markets")
+        reload = bool(getattr(client, "markets", None))
+        if self.breaker:
+            await self.breaker.call(f"{exchange_id}:markets", lambda: client.load_markets(reload=reload))
+        else:
+            await client.load_markets(reload=reload)
+        self._markets_loaded_at[exchange_id] = time.monotonic()
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+
+import numpy as np
+
+
+@dataclass(slots=True)
+class CompactBook:
+    """Стакан в виде массивов цена/объём по сторонам, лучший уровень первым."""
+
+    bid_prices: np.ndarray
+    bid_sizes: np.ndarray
+    ask_prices: np.ndarray
+    ask_sizes: np.ndarray
+
+    @classmethod
+    def from_levels(cls, bids: Iterable[list[float]], asks: Iterable[list[float]], depth: int | None = None) -> CompactBook:
+        bid_prices, bid_sizes = cls._side(bids, depth)
+        ask_prices, ask_sizes = cls._side(asks, depth)
+        return cls(bid_prices, bid_sizes, ask_prices, ask_sizes)
+
+    def to_levels(self) -> dict[str, list[list[float]]]:
+        return {
+            "bids": np.column_stack((self.bid_prices, self.bid_sizes)).tolist(),
+            "asks": np.column_stack((self.ask_prices, self.ask_sizes)).tolist(),
+        }
+
+    def total_size(self) -> float:
+        return float(self.bid_sizes.sum() + self.ask_sizes.sum())
+
+    def __sizeof__(self) -> int:
+        return 64 + self.bid_prices.nbytes + self.bid_sizes.nbytes + self.ask_prices.nbytes + self.ask_sizes.nbytes
+
+    @staticmethod
+    def _side(levels: Iterable[list[float]], depth: int | None) -> tuple[np.ndarray, np.ndarray]:
+        rows = [(float(level[0]), float(level[1])) for level in levels if len(level) >= 2 and level[1]]
+        if depth is not None:
+            rows = rows[:depth]
+        data = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        return np.ascontiguousarray(data[:, 0]), np.ascontiguousarray(data[:, 1])
+
+
+@dataclass
+class LiveBook:
+    bids: dict[float, float] = field(default_factory=dict)
+    asks: dict[float, float] = field(default_factory=dict)
+    updated_at: float = 0.0
+
+    def best_bid(self) -> float | None:
+        return max(self.bids) if self.bids else None
+
+    def best_ask(self) -> float | None:
+        return min(self.asks) if self.asks else None
+
+    def levels(self, side: str, depth: int) -> list[list[float]]:
+        book = self.bids if side == "bids" else self.asks
+        prices = sorted(book, reverse=side == "bids")[:depth]
+        return [[price, book[price]] for price in prices]
+
+
+class OrderBookStore:
+    """In-memory стакан по (exchange, symbol), обновляемый снапшотами и дельтами из стрима."""
+
+    def __init__(self, depth: int = 10) -> None:
+        self.depth = depth
+        self._books: dict[tuple[str, str], LiveBook] = {}
+        self._meta: dict[tuple[str, str], dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._books)
+
+    def apply(self, exchange: str, symbol: str, update: dict[str, Any]) -> None:
+        if update.get("type", "snapshot") == "snapshot":
+            self.apply_snapshot(exchange, symbol, update.get("bids", []), update.get("asks", []))
+        else:
+            self.apply_delta(exchange, symbol, update.get("bids", []), update.get("asks", []))
+
+    def apply_snapshot(self, exchange: str, symbol: str, bids: Iterable[list[float]], asks: Iterable[list[float]]) -> None:
+        book = LiveBook()
+        self._merge(book.bids, bids)
+        self._merge(book.asks, asks)
+        book.updated_at = time.time()
+        self._books[(exchange, symbol)] = book
+
+    def apply_delta(self, exchange: str, symbol: str, bids: Iterable[list[float]], asks: Iterable[list[float]]) -> None:
+        book = self._books.setdefault((exchange, symbol), LiveBook())
+        self._merge(book.bids, bids)
+        self._merge(book.asks, asks)
+        # дальние уровни из дельт не нужны для расчёта, не даём стакану расти бесконечно
+        if len(book.bids) > self.depth * 4:
+            book.bids = dict(book.levels("bids", self.depth * 2))
+        if len(book.asks) > self.depth * 4:
+            book.asks = dict(book.levels("asks", self.depth * 2))
+        book.updated_at = time.time()
+
+    def set_meta(self, exchange: str, symbol: str, **meta: Any) -> None:
+        self._meta.setdefault((exchange, symbol), {}).update(meta)
+
+    def top(self, exchange: str, symbol: str) -> tuple[float | None, float | None]:
+        book = self._books.get((exchange, symbol))
+        if not book:
+            return None, None
+        return book.best_bid(), book.best_ask()
+
+    def exchanges(self, max_age_sec: float | None = None) -> set[str]:
+        """Биржи, у которых есть хотя бы один стакан свежее `max_age_sec`."""
+        now = time.time()
+        return {exchange for (exchange, _), book in self._books.items() if max_age_sec is None or now - book.updated_at <= max_age_sec}
+
+    def rows(self, symbols: Iterable[str] | None = None, max_age_sec: float | None = None) -> list[dict[str, Any]]:
+        """Строки в том же формате, что и `CEXParser.fetch_market_snapshot`."""
+        wanted = set(symbols) if symbols is not None else None
+        now = time.time()
+        out: list[dict[str, Any]] = []
+        for (exchange, symbol), book in self._books.items():
+            if wanted is not None and symbol not in wanted:
+                continue
+            if max_age_sec is not None and now - book.updated_at > max_age_sec:
+                continue
+            bid, ask = book.best_bid(), book.best_ask()
+            if bid is None or ask is None:
+                continue
+            meta = self._meta.get((exchange, symbol), {})
+            bids, asks = book.levels("bids", self.depth), book.levels("asks", self.depth)
+            out.append(
+                {
+                    "source": "stream",
+                    "exchange": exchange,
+                    "symbol": symbol,
+                    "spot_price": (bid + ask) / 2,
+                    "bid": bid,
+                    "ask": ask,
+                    "futures_price": None,
+                    "orderbook_depth": float(sum(level[1] for level in bids + asks)),
+                    "book": CompactBook.from_levels(bids, asks),
+                    "network_fees": meta.get("network_fees", {}),
+                    "maker_fee": meta.get("maker_fee", 0.001),
+                    "taker_fee": meta.get("taker_fee", 0.001),
+                    "updated_at": book.updated_at,
+                }
+            )
+        return out
+
+    def _merge(self, side: dict[float, float], levels: Iterable[list[float]]) -> None:
+        for level in levels:
+            if len(level) < 2:
+                continue
+            price, amount = float(level[0]), float(level[1])
+            if amount <= 0:
+                side.pop(price, None)
+            else:
+                side[price] = amount
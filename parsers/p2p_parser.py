@@ -1,22 +1,37 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-from typing import Any
+from typing import Any, AsyncIterator
 
 import aiohttp
 
 from config import get_settings
-from utils import AsyncRateLimiter, AsyncTTLCache
+from utils import AsyncRateLimiter, CircuitBreaker, TwoTierCache
+from utils.circuit_breaker import get_circuit_breaker
+from utils.http_client import HttpClient, get_http_client
 
 logger = logging.getLogger(__name__)
 
+P2P_VENUES = ("binance_p2p", "bybit_p2p", "garantex_p2p")
+
 
 class P2PParser:
-    def __init__(self) -> None:
+    def __init__(self, http: HttpClient | None = None, breaker: CircuitBreaker | None = None) -> None:
         self.settings = get_settings()
-        self.cache: AsyncTTLCache[list[dict[str, Any]]] = AsyncTTLCache(self.settings.cache_ttl_sec)
-        self.last_success: dict[str, list[dict[str, Any]]] = {}
-        self.rate_limiter = AsyncRateLimiter(self.settings.max_api_calls_per_sec, 1.0)
+        self.http = http or get_http_client()
+        self.breaker = breaker or get_circuit_breaker()
+        self.cache: TwoTierCache[list[dict[str, Any]]] = TwoTierCache(
+            self.settings.cache_ttl_sec,
+            namespace="p2p",
+            max_entries=self.settings.cache_max_entries,
+            max_bytes=self.settings.cache_max_bytes,
+            stale_ttl_seconds=self.settings.cache_stale_ttl_sec,
+            negative_ttl_seconds=self.settings.cache_negative_ttl_sec,
+        )
+        self.rate_limiter = AsyncRateLimiter(
+            self.settings.max_api_calls_per_sec, 1.0, venue_limits=self.settings.venue_rate_limits
+        )
 
     async def fetch_all(
         self,
@@ -28,124 +43,210 @@ class P2PParser:
     ) -> list[dict[str, Any]]:
         fiats = fiats or self.settings.p2p_fiats
         banks = banks or self.settings.p2p_banks
-        cache_key = f"p2p:{asset}:{','.join(fiats)}:{','.join(banks)}:{min_limit}:{max_limit}"
-        cached = await self.cache.get(cache_key)
-        if cached:
-            return cached
+        session = self.http.session()
 
         opportunities: list[dict[str, Any]] = []
+        pending: dict[asyncio.Task[tuple[str, list[dict[str, Any]]]], str] = {}
+        for fiat in fiats:
+            for venue in P2P_VENUES:
+                cache_key = f"p2p:{venue}:{asset}:{fiat}:{','.join(banks)}:{min_limit}:{max_limit}"
+                task = asyncio.create_task(self._cached_venue(session, cache_key, venue, asset, fiat, banks, min_limit, max_limit))
+                pending[task] = cache_key
+
+        # сетка (fiat x venue) опрашивается параллельно, медленная площадка не блокирует остальные
+        fetched: set[str] = set()
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=20)) as session:
-                for fiat in fiats:
-                    opportunities.extend(await self._binance(session, asset, fiat, banks, min_limit, max_limit))
-                    opportunities.extend(await self._bybit(session, asset, fiat, banks, min_limit, max_limit))
-                    opportunities.extend(await self._garantex(session, asset, fiat, min_limit, max_limit))
-            await self.cache.set(cache_key, opportunities)
-            self.last_success[cache_key] = opportunities
-            return opportunities
-        except Exception as exc:  # noqa: BLE001
-            logger.warning("P2P fetch failed, fallback to stale cache: %s", exc)
-            return self.last_success.get(cache_key, [])
-
-    async def _binance(self, session: aiohttp.ClientSession, asset: str, fiat: str, banks: list[str], min_limit: float, max_limit: float) -> list[dict[str, Any]]:
+            for next_done in asyncio.as_completed(pending, timeout=self.settings.p2p_scan_deadline_sec):
+                try:
+                    cache_key, rows = await next_done
+                except Exception as exc:  # noqa: BLE001
+                    logger.warning("P2P venue fetch failed: %s", exc)
+                    continue
+                fetched.add(cache_key)
+                opportunities.extend(rows)
+        except asyncio.TimeoutError:
+            logger.warning("P2P scan deadline exceeded, using stale results for slow venues")
+        finally:
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+
+        for cache_key in pending.values():
+            if cache_key not in fetched:
+                opportunities.extend(await self.cache.get_stale(cache_key) or [])
+        return opportunities
+
+    async def _cached_venue(
+        self,
+        session: aiohttp.ClientSession,
+        cache_key: str,
+        venue: str,
+        asset: str,
+        fiat: str,
+        banks: list[str],
+        min_limit: float,
+        max_limit: float,
+    ) -> tuple[str, list[dict[str, Any]]]:
+        rows = await self.cache.get_or_load(
+            cache_key, lambda: self._fetch_venue(session, venue, asset, fiat, banks, min_limit, max_limit)
+        )
+        return cache_key, rows
+
+    async def _fetch_venue(
+        self,
+        session: aiohttp.ClientSession,
+        venue: str,
+        asset: str,
+        fiat: str,
+        banks: list[str],
+        min_limit: float,
+        max_limit: float,
+    ) -> list[dict[str, Any]]:
+        if venue in ("binance_p2p", "bybit_p2p"):
+            # в снапшот для анализатора идёт только вершина стакана (одна страница подходящих объявлений),
+            # глубину по цене листает `iter_ads(..., price_cutoff=...)` там, где она нужна
+            top: list[dict[str, Any]] = []
+            ads = self.iter_ads(venue, asset, fiat, banks, min_limit, max_limit)
+            try:
+                async for ad in ads:
+                    top.append(ad)
+                    if len(top) >= self.settings.p2p_page_size:
+                        break
+            finally:
+                await ads.aclose()
+            return top
+        return await self._garantex(session, asset, fiat, min_limit, max_limit)
+
+    async def iter_ads(
+        self,
+        venue: str,
+        asset: str,
+        fiat: str,
+        banks: list[str] | None = None,
+        min_limit: float = 0,
+        max_limit: float = 1_000_000,
+        price_cutoff: float | None = None,
+        page_size: int | None = None,
+        max_pages: int | None = None,
+    ) -> AsyncIterator[dict[str, Any]]:
+        """Лениво листает объявления площадки страница за страницей.
+
+        Фильтры по лимитам и банкам применяются к каждой странице. Объявления идут по возрастанию
+        цены, поэтому обход прекращается на первом объявлении дороже `price_cutoff`. Глубина обхода
+        ограничена `max_pages` (по умолчанию P2P_MAX_PAGES).
+        """
+        banks = banks if banks is not None else self.settings.p2p_banks
+        page_size = page_size or self.settings.p2p_page_size
+        max_pages = max_pages or self.settings.p2p_max_pages
+        fetch_page = self._binance_page if venue == "binance_p2p" else self._bybit_page
+        session = self.http.session()
+        page = 1
+        while page <= max_pages:
+            try:
+                ads = await fetch_page(session, asset, fiat, banks, page, page_size)
+            except Exception as exc:  # noqa: BLE001
+                # ошибка первой страницы — отказ площадки, её видит вызывающий код,
+                # ошибка на глубоких страницах лишь обрезает уже полученный стакан
+                if page == 1:
+                    raise
+                logger.warning("%s page %s error: %s", venue, page, exc)
+                return
+            for ad in ads:
+                if price_cutoff is not None and ad["price"] > price_cutoff:
+                    return
+                if ad["min_limit"] <= max_limit and ad["max_limit"] >= min_limit and self._matches_banks(ad, banks):
+                    yield ad
+            if len(ads) < page_size:
+                return
+            page += 1
+
+    async def _binance_page(self, session: aiohttp.ClientSession, asset: str, fiat: str, banks: list[str], page: int, rows: int) -> list[dict[str, Any]]:
         url = "https://p2p.binance.com/bapi/c2c/v2/friendly/c2c/adv/search"
         payload = {
             "asset": asset,
             "fiat": fiat,
-            "page": 1,
-            "rows": 10,
+            "page": page,
+            "rows": rows,
             "tradeType": "BUY",
             "payTypes": banks,
         }
-        try:
-            await self.rate_limiter.wait()
-            async with session.post(url, json=payload) as resp:
-                if resp.status != 200:
-                    return []
-                data = await resp.json()
-                out = []
-                for adv in data.get("data", []):
-                    price = float(adv["adv"].get("price", 0))
-                    min_amt = float(adv["adv"].get("minSingleTransAmount", 0))
-                    max_amt = float(adv["adv"].get("dynamicMaxSingleTransAmount", 0))
-                    merchant = adv.get("advertiser", {}).get("userType") == "merchant"
-                    if min_amt <= max_limit and max_amt >= min_limit:
-                        out.append(
-                            {
-                                "exchange": "binance_p2p",
-                                "asset": asset,
-                                "fiat": fiat,
-                                "price": price,
-                                "min_limit": min_amt,
-                                "max_limit": max_amt,
-                                "merchant": merchant,
-                                "payments": adv["adv"].get("tradeMethods", []),
-                            }
-                        )
-                return out
-        except Exception as exc:  # noqa: BLE001
-            logger.warning("Binance P2P error: %s", exc)
-            return []
+        data = await self._request_json(session, "binance_p2p", "POST", url, json=payload)
+        return [
+            {
+                "exchange": "binance_p2p",
+                "asset": asset,
+                "fiat": fiat,
+                "price": float(adv["adv"].get("price", 0)),
+                "min_limit": float(adv["adv"].get("minSingleTransAmount", 0)),
+                "max_limit": float(adv["adv"].get("dynamicMaxSingleTransAmount", 0)),
+                "merchant": adv.get("advertiser", {}).get("userType") == "merchant",
+                "payments": adv["adv"].get("tradeMethods", []),
+            }
+            for adv in data.get("data") or []
+        ]
 
-    async def _bybit(self, session: aiohttp.ClientSession, asset: str, fiat: str, banks: list[str], min_limit: float, max_limit: float) -> list[dict[str, Any]]:
+    async def _bybit_page(self, session: aiohttp.ClientSession, asset: str, fiat: str, banks: list[str], page: int, rows: int) -> list[dict[str, Any]]:
         url = "https://api2.bybit.com/fiat/otc/item/online"
-        payload = {"tokenId": asset, "currencyId": fiat, "side": "1", "size": "10", "page": "1", "payment": banks}
-        try:
-            await self.rate_limiter.wait()
-            async with session.post(url, json=payload) as resp:
-                if resp.status != 200:
-                    return []
-                data = await resp.json()
-                result: list[dict[str, Any]] = []
-                for item in data.get("result", {}).get("items", []):
-                    price = float(item.get("price", 0))
-                    min_amt = float(item.get("minAmount", 0))
-                    max_amt = float(item.get("maxAmount", 0))
-                    if min_amt <= max_limit and max_amt >= min_limit:
-                        result.append(
-                            {
-                                "exchange": "bybit_p2p",
-                                "asset": asset,
-                                "fiat": fiat,
-                                "price": price,
-                                "min_limit": min_amt,
-                                "max_limit": max_amt,
-                                "merchant": bool(item.get("authTag")),
-                                "payments": item.get("payments", []),
-                            }
-                        )
-                return result
-        except Exception:
-            return []
+        payload = {"tokenId": asset, "currencyId": fiat, "side": "1", "size": str(rows), "page": str(page), "payment": banks}
+        data = await self._request_json(session, "bybit_p2p", "POST", url, json=payload)
+        return [
+            {
+                "exchange": "bybit_p2p",
+                "asset": asset,
+                "fiat": fiat,
+                "price": float(item.get("price", 0)),
+                "min_limit": float(item.get("minAmount", 0)),
+                "max_limit": float(item.get("maxAmount", 0)),
+                "merchant": bool(item.get("authTag")),
+                "payments": item.get("payments", []),
+            }
+            for item in (data.get("result") or {}).get("items") or []
+        ]
+
+    async def _request_json(self, session: aiohttp.ClientSession, venue: str, method: str, url: str, **kwargs: Any) -> Any:
+        """Один запрос к площадке: токен лимитера берётся до breaker, ответ не-200 считается отказом."""
+        await self.rate_limiter.wait(venue)
+
+        async def request() -> Any:
+            async with session.request(method, url, timeout=self.http.timeout(venue), **kwargs) as resp:
+                resp.raise_for_status()
+                return await resp.json()
+
+        return await self.breaker.call(venue, request)
+
+    def _matches_banks(self, ad: dict[str, Any], banks: list[str]) -> bool:
+        # Bybit отдаёт платёжные методы числовыми id, фильтр по ним делает сам API
+        if not banks or ad["exchange"] != "binance_p2p":
+            return True
+        wanted = [b.lower() for b in banks]
+        for method in ad.get("payments", []):
+            names = f"{method.get('identifier', '')} {method.get('tradeMethodName', '')}".lower()
+            if any(bank in names for bank in wanted):
+                return True
+        return False
 
     async def _garantex(self, session: aiohttp.ClientSession, asset: str, fiat: str, min_limit: float, max_limit: float) -> list[dict[str, Any]]:
         if fiat != "RUB":
             return []
-        try:
-            await self.rate_limiter.wait()
-            async with session.get("https://garantex.org/api/v2/depth?market=usdtrub") as resp:
-                if resp.status != 200:
-                    return []
-                data = await resp.json()
-                asks = data.get("asks", [])[:5]
-                out = []
-                for ask in asks:
-                    price = float(ask[0])
-                    amount = float(ask[1])
-                    rub_volume = price * amount
-                    if min_limit <= rub_volume <= max_limit:
-                        out.append(
-                            {
-                                "exchange": "garantex_p2p",
-                                "asset": asset,
-                                "fiat": fiat,
-                                "price": price,
-                                "min_limit": min_limit,
-                                "max_limit": rub_volume,
-                                "merchant": True,
-                                "payments": ["bank_transfer"],
-                            }
-                        )
-                return out
-        except Exception:
-            return []
+        url = "https://garantex.org/api/v2/depth?market=usdtrub"
+        data = await self._request_json(session, "garantex_p2p", "GET", url)
+        asks = data.get("asks", [])[:5]
+        out = []
+        for ask in asks:
+            price = float(ask[0])
+            amount = float(ask[1])
+            rub_volume = price * amount
+            if min_limit <= rub_volume <= max_limit:
+                out.append(
+                    {
+                        "exchange": "garantex_p2p",
+                        "asset": asset,
+                        "fiat": fiat,
+                        "price": price,
+                        "min_limit": min_limit,
+                        "max_limit": rub_volume,
+                        "merchant": True,
+                        "payments": ["bank_transfer"],
+                    }
+                )
+        return out
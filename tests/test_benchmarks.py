@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from benchmarks.run import compare
+
+
+def report(**medians: float) -> dict:
+    return {"meta": {"scale": "small"}, "results": {name: {"items": 100, "median_sec": median} for name, median in medians.items()}}
+
+
+def test_compare_flags_only_medians_above_threshold() -> None:
+    baseline = report(find_graph=0.10, find_vectorized=0.010, db_save_batch=0.05)
+    current = report(find_graph=0.13, find_vectorized=0.011, db_save_batch=0.02)
+    assert compare(current, baseline, threshold=1.2) == ["find_graph"]
+    assert compare(current, baseline, threshold=1.5) == []
+    assert compare(baseline, baseline, threshold=1.0) == []
+
+
+def test_compare_skips_benchmarks_missing_from_baseline() -> None:
+    baseline = report(find_graph=0.0)
+    current = report(find_graph=1.0, excel_parse=5.0)
+    assert compare(current, baseline, threshold=1.2) == []
+    assert compare(current, {"meta": {}}, threshold=1.2) == []
@@ -1,9 +1,26 @@
 from __future__ import annotations
 
+import asyncio
+import random
+import time
+
+import pytest
+
 from analyzers.arbitrage_analyzer import ArbitrageAnalyzer
-from analyzers.opportunity_finder import filter_opportunities
+from analyzers.execution import ExecutableSpreadCalculator
+from analyzers.graph_arbitrage import GraphArbitrageEngine
+from analyzers.incremental import IncrementalAnalyzer
+from analyzers.opportunity_finder import OpportunityIndex, filter_opportunities
+from analyzers.replay import ReplayConfig, ReplayEngine
 from analyzers.spread_calculator import calculate_international_profit, calculate_p2p_profit, calculate_spread_percent
+from data.ticks import TickStore, tick_rows
+from parsers.cex_stream import CEXStreamer
+from parsers.currency_metadata import DEFAULT_NETWORK_FEES, CurrencyMetadataCache
 from parsers.excel_parser import ExcelStrategyParser
+from parsers.exchange_pool import ExchangePool
+from parsers.order_book_store import CompactBook, OrderBookStore
+from parsers.p2p_parser import P2PParser
+from utils import CircuitBreaker
 from utils.validators import validate_profit_threshold
 
 
@@ -43,6 +60,21 @@ def test_filter_by_strategy() -> None:
     assert result[0]["type"] == "p2p"
 
 
+def test_opportunity_index_matches_filter() -> None:
+    rng = random.Random(3)
+    data = [
+        {"type": rng.choice(["p2p", "cex-cex", "triangle"]), "route": str(i), "spread_percent": round(rng.uniform(0, 6), 1)}
+        for i in range(200)
+    ]
+    index = OpportunityIndex(data)
+    assert len(index) == 200
+    for min_profit in (0.0, 1.0, 2.5, 5.9, 7.0):
+        for strategy in ("all", "p2p", "cex-cex", "dex-cex"):
+            expected = filter_opportunities(data, min_profit=min_profit, strategy=strategy)
+            assert index.top(min_profit, strategy) == expected
+            assert index.top(min_profit, strategy, limit=3) == expected[:3]
+
+
 def test_arbitrage_analyzer_find() -> None:
     analyzer = ArbitrageAnalyzer()
     cex_data = [
@@ -60,3 +92,411 @@ def test_arbitrage_analyzer_find() -> None:
     result = analyzer.find(cex_data, dex_data, p2p_data, min_profit_percent=0.1)
     assert result
     assert any(x["type"] == "p2p" for x in result)
+
+
+def test_p2p_pairs_one_route_per_venue_pair_from_top_of_book() -> None:
+    rng = random.Random(3)
+    ads = [
+        {"exchange": venue, "asset": "USDT", "fiat": "RUB", "price": round(rng.uniform(88, 94), 2), "max_limit": 50000}
+        for venue in ("binance_p2p", "bybit_p2p", "garantex_p2p")
+        for _ in range(300)
+    ]
+    analyzer = ArbitrageAnalyzer()
+    found = [x for x in analyzer.find([], [], ads, min_profit_percent=0.1) if x["type"] == "p2p"]
+    routes = [x["route"] for x in found]
+    assert len(routes) == len(set(routes)) == 6
+
+    cheapest = min(ad["price"] for ad in ads if ad["exchange"] == "binance_p2p")
+    dearest = max(ad["price"] for ad in ads if ad["exchange"] == "bybit_p2p")
+    best = next(x for x in found if x["route"] == "binance_p2p -> bybit_p2p (USDT/RUB)")
+    assert (best["buy_price"], best["sell_price"]) == (cheapest, dearest)
+
+    incremental = IncrementalAnalyzer(analyzer, 0.1)
+    incremental.update([], [], ads)
+    assert sorted(x["route"] for x in incremental.current()) == sorted(routes)
+
+
+def test_vectorized_engine_matches_python_path() -> None:
+    rng = random.Random(7)
+    exchanges = ["binance", "bybit", "okx", "kraken", "kucoin"]
+    symbols = ["BTC/USDT", "ETH/USDT", "SOL/USDT", "ETH/BTC"]
+    cex_data = []
+    for _ in range(60):
+        price = rng.choice([0.0, None, rng.uniform(90, 110)])
+        cex_data.append(
+            {
+                "exchange": rng.choice(exchanges),
+                "symbol": rng.choice(symbols),
+                "ask": price,
+                "bid": rng.choice([None, rng.uniform(90, 110)]),
+                "spot_price": rng.uniform(90, 110),
+                "orderbook_depth": rng.uniform(0, 1000),
+                "maker_fee": 0.001,
+                "taker_fee": rng.choice([0.001, 0.002]),
+            }
+        )
+    dex_data = [
+        {"exchange": "ethereum-dex", "symbol": symbol, "price": rng.uniform(85, 105), "liquidity": 5000}
+        for symbol in symbols + ["DOGE/USDT"]
+    ]
+
+    for min_profit in (-100.0, 0.5, 3.0):
+        expected = ArbitrageAnalyzer(vectorized=False).find(cex_data, dex_data, [], min_profit_percent=min_profit)
+        actual = ArbitrageAnalyzer().find(cex_data, dex_data, [], min_profit_percent=min_profit)
+        assert actual == expected
+    assert any(x["type"] == "dex-cex" for x in expected)
+
+
+def test_find_at_50_exchanges_x_500_symbols_stays_within_budget() -> None:
+    rng = random.Random(3)
+    symbols = ["BTC/USDT", "ETH/USDT", "ETH/BTC"] + [f"T{i:03d}/{'BTC' if i % 5 == 0 else 'USDT'}" for i in range(497)]
+    fair = {symbol: rng.lognormvariate(0, 2) for symbol in symbols}
+    cex_data = []
+    for symbol in symbols:
+        for ex in range(50):
+            price = fair[symbol] * rng.uniform(0.997, 1.003)
+            cex_data.append(
+                {
+                    "exchange": f"cex{ex:02d}",
+                    "symbol": symbol,
+                    "bid": price * 0.9997,
+                    "ask": price * 1.0003,
+                    "orderbook_depth": 10.0,
+                    "maker_fee": 0.001,
+                    "taker_fee": 0.001,
+                }
+            )
+    dex_data = [{"exchange": "dex", "symbol": s, "price": fair[s] * rng.uniform(0.98, 1.01), "liquidity": 1e6} for s in symbols[:100]]
+    analyzer = ArbitrageAnalyzer(graph_time_budget_sec=0.05)
+
+    runs = []
+    for _ in range(3):
+        started = time.perf_counter()
+        result = analyzer.find(cex_data, dex_data, [], min_profit_percent=0.5)
+        runs.append(time.perf_counter() - started)
+    assert result
+    # векторный cex-cex/dex-cex + граф в пределах бюджета; запас на медленные CI-машины
+    assert min(runs) < 0.5
+
+
+def test_graph_engine_time_budget_resumes_with_skipped_exchanges() -> None:
+    rows = [
+        {"exchange": exchange, "symbol": symbol, "bid": bid, "ask": bid * 1.001, "taker_fee": 0.001}
+        for exchange in ("binance", "bybit", "okx")
+        for symbol, bid in (("BTC/USDT", 100.0), ("ETH/USDT", 10.0), ("ETH/BTC", 0.12))
+    ]
+    engine = GraphArbitrageEngine(max_cycle_length=3, time_budget_sec=0.0)
+    # нулевой бюджет: за скан считается одна биржа, следующий скан продолжает со следующей
+    seen = [{x["route"].split(":")[0] for x in engine.find(rows)} for _ in range(3)]
+    assert seen == [{"binance"}, {"bybit"}, {"okx"}]
+    assert len(GraphArbitrageEngine(max_cycle_length=3).find(rows)) == 3
+
+
+def test_executable_spread_walks_the_book() -> None:
+    def row(exchange: str, bids: list, asks: list) -> dict:
+        book = CompactBook.from_levels(bids, asks)
+        return {
+            "exchange": exchange,
+            "symbol": "BTC/USDT",
+            "bid": bids[0][0],
+            "ask": asks[0][0],
+            "orderbook_depth": book.total_size(),
+            "book": book,
+            "maker_fee": 0.0,
+            "taker_fee": 0.0,
+        }
+
+    cex_data = [
+        row("binance", [[99.0, 10.0]], [[100.0, 1.0], [101.0, 1.0], [110.0, 5.0]]),
+        row("bybit", [[103.0, 1.5], [102.0, 10.0]], [[104.0, 10.0]]),
+    ]
+    analyzer = ArbitrageAnalyzer(depth_sizes_usd=(100, 150, 201, 1000))
+    [opp] = analyzer.find(cex_data, [], [], min_profit_percent=1.5, strategy="cex-cex")
+
+    grid = {level["size_usd"]: level for level in opp["depth_grid"]}
+    assert grid[100]["buy_price"] == 100.0 and grid[100]["sell_price"] == 103.0
+    # 201 USDT: 1 BTC по 100 и 1 BTC по 101; продажа 1.5 по 103 и 0.5 по 102
+    assert grid[201]["buy_price"] == 100.5
+    assert grid[201]["sell_price"] == (1.5 * 103 + 0.5 * 102) / 2
+    assert set(grid) == {100, 150, 201}
+    assert opp["liquidity"] == 201
+    assert opp["spread_percent"] == 3.0
+
+    calculator = ExecutableSpreadCalculator([100, 1000])
+    opp = dict(opp)
+    calculator.apply([opp], cex_data, min_profit=5.0)
+    assert opp["liquidity"] == 0.0
+
+
+def test_incremental_analyzer_tracks_changes_and_matches_full_scan() -> None:
+    def quote(exchange: str, symbol: str, bid: float, ask: float) -> dict:
+        return {"exchange": exchange, "symbol": symbol, "bid": bid, "ask": ask, "orderbook_depth": 10, "maker_fee": 0.001, "taker_fee": 0.001}
+
+    cex_data = [
+        quote("binance", "BTC/USDT", 100.0, 100.1),
+        quote("bybit", "BTC/USDT", 100.0, 100.1),
+        quote("okx", "ETH/USDT", 10.0, 10.01),
+        quote("kraken", "ETH/USDT", 10.0, 10.01),
+    ]
+    dex_data = [{"exchange": "uniswap", "symbol": "ETH/USDT", "price": 8.0, "liquidity": 5000}]
+    p2p_data = [
+        {"exchange": "binance_p2p", "asset": "USDT", "fiat": "RUB", "price": 90.5, "max_limit": 100000},
+        {"exchange": "garantex_p2p", "asset": "USDT", "fiat": "RUB", "price": 92.3, "max_limit": 120000},
+    ]
+    full = ArbitrageAnalyzer()
+    shared = ArbitrageAnalyzer()
+    incremental = IncrementalAnalyzer(shared, min_profit_percent=0.5)
+    assert incremental.graph is not shared.graph
+
+    def routes(opportunities: list) -> list:
+        return sorted(x["route"] for x in opportunities)
+
+    changes = incremental.update(cex_data, dex_data, p2p_data)
+    assert routes(changes.appeared) == ["binance_p2p -> garantex_p2p (USDT/RUB)", "uniswap -> kraken (ETH/USDT)", "uniswap -> okx (ETH/USDT)"]
+
+    assert not incremental.update(cex_data, dex_data, p2p_data)
+    # держащиеся возможности остаются в текущем наборе — из него main строит кандидатов в алерты
+    assert len(incremental.current()) == 3
+
+    cex_data[1] = quote("bybit", "BTC/USDT", 102.0, 102.1)
+    cex_data.pop(3)
+    changes = incremental.update(cex_data, dex_data, p2p_data)
+    assert routes(changes.appeared) == ["binance -> bybit (BTC/USDT)"]
+    assert routes(changes.disappeared) == ["uniswap -> kraken (ETH/USDT)"]
+    assert changes.changed == []
+
+    changes = incremental.update(p2p_data=[dict(p2p_data[1], price=92.0)], partial=True)
+    assert routes(changes.changed) == ["binance_p2p -> garantex_p2p (USDT/RUB)"]
+
+    p2p_data[1]["price"] = 92.0
+    assert incremental.current() == full.find(cex_data, dex_data, p2p_data, min_profit_percent=0.5)
+
+
+def test_graph_engine_finds_cycles_beyond_fixed_triangle() -> None:
+    def market(symbol: str, bid: float, ask: float) -> dict:
+        return {"exchange": "okx", "symbol": symbol, "bid": bid, "ask": ask, "taker_fee": 0.001}
+
+    fair = [
+        market("BTC/USDT", 99.9, 100.0),
+        market("ETH/USDT", 9.99, 10.0),
+        market("ETH/BTC", 0.0999, 0.1),
+        market("SOL/ETH", 0.0999, 0.1),
+        market("SOL/USDT", 0.999, 1.0),
+    ]
+    engine = GraphArbitrageEngine(max_cycle_length=4)
+    assert engine.find(fair) == []
+
+    # SOL/USDT bid завышен: USDT -> BTC -> ETH -> SOL -> USDT и короткий USDT -> ETH -> SOL -> USDT
+    mispriced = fair[:4] + [market("SOL/USDT", 1.05, 1.06)]
+    result = engine.find(mispriced)
+    routes = {x["route"] for x in result}
+    assert "okx: USDT -> ETH -> SOL -> USDT" in routes
+    assert "okx: USDT -> BTC -> ETH -> SOL -> USDT" in routes
+    assert all(x["type"] == "triangle" and x["spread_percent"] > 0 for x in result)
+    best = max(result, key=lambda x: x["spread_percent"])
+    assert round(best["spread_percent"], 4) == round((1 / 10.0 / 0.1 * 1.05 * 0.999**3 - 1) * 100, 4)
+
+    assert GraphArbitrageEngine(max_cycle_length=3).find(mispriced)[0]["route"] == "okx: USDT -> ETH -> SOL -> USDT"
+    assert engine.find(fair) == []
+
+
+def test_currency_metadata_cache_persists_and_falls_back(tmp_path) -> None:
+    class FakeExchange:
+        calls = 0
+
+        async def fetch_currencies(self) -> dict:
+            FakeExchange.calls += 1
+            return {"USDT": {"networks": {"TRC20": {"fee": "0.8"}, "ERC20": {"fee": None}}}}
+
+    path = tmp_path / "currency_meta.json"
+    cache = CurrencyMetadataCache(str(path), ttl_seconds=3600)
+    assert cache.network_fees("binance", "USDT") == DEFAULT_NETWORK_FEES
+
+    asyncio.run(cache.refresh("binance", FakeExchange()))
+    assert cache.network_fees("binance", "USDT") == {"TRC20": 0.8, "ERC20": 0.0}
+
+    restored = CurrencyMetadataCache(str(path), ttl_seconds=3600)
+    assert not restored.is_stale("binance")
+    assert restored.network_fees("binance", "USDT") == {"TRC20": 0.8, "ERC20": 0.0}
+    assert FakeExchange.calls == 1
+
+    async def refresh_many(target: CurrencyMetadataCache) -> None:
+        await asyncio.gather(*(target.refresh(exchange_id, FakeExchange()) for exchange_id in ("okx", "bybit", "kraken", "kucoin")))
+
+    # параллельные сохранения сериализуются и не теряют биржи, ошибка записи только логируется
+    asyncio.run(refresh_many(restored))
+    assert set(CurrencyMetadataCache(str(path), ttl_seconds=3600)._fees) == {"binance", "okx", "bybit", "kraken", "kucoin"}
+    assert not path.with_suffix(".json.tmp").exists()
+    (tmp_path / "blocked").write_text("")
+    broken = CurrencyMetadataCache(str(tmp_path / "blocked" / "meta.json"), ttl_seconds=3600)
+    asyncio.run(broken.refresh("okx", FakeExchange()))
+    assert broken.network_fees("okx", "USDT") == {"TRC20": 0.8, "ERC20": 0.0}
+
+
+def test_exchange_pool_breaker_sees_only_real_markets_loads() -> None:
+    class FakeClient:
+        def __init__(self) -> None:
+            self.markets: dict = {}
+            self.loads = 0
+
+        async def load_markets(self, reload: bool = False) -> None:
+            self.loads += 1
+            if self.loads > 2:
+                raise ConnectionError("reset")
+            await asyncio.sleep(0.02)
+            self.markets = {"BTC/USDT": {}}
+
+    client = FakeClient()
+    breaker = CircuitBreaker(failure_threshold=2, min_timeout_sec=0.001, max_timeout_sec=1)
+    pool = ExchangePool(3600, factory=lambda exchange_id, timeout_ms: client, breaker=breaker)
+
+    async def run() -> None:
+        for _ in range(20):
+            assert await pool.get("okx") is client
+        await pool.reload_markets("okx")
+        # упавшая перезагрузка не отбирает клиента с уже загруженными markets
+        await pool.reload_markets("okx")
+        assert await pool.get("okx") is client
+
+    asyncio.run(run())
+    assert list(breaker.health("okx:markets").latencies) == [pytest.approx(0.02, abs=0.05)] * 2
+    assert breaker.state("okx:markets") == "open"
+
+
+def test_p2p_non_200_pages_are_breaker_failures_not_empty_books() -> None:
+    class FakeResponse:
+        def __init__(self, status: int, data: dict) -> None:
+            self.status = status
+            self.data = data
+
+        async def __aenter__(self) -> "FakeResponse":
+            return self
+
+        async def __aexit__(self, *exc: object) -> None:
+            return None
+
+        def raise_for_status(self) -> None:
+            if self.status != 200:
+                raise ConnectionError(f"HTTP {self.status}")
+
+        async def json(self) -> dict:
+            return self.data
+
+    class FakeHttp:
+        def __init__(self, statuses: list[int]) -> None:
+            self.statuses = statuses
+
+        def session(self) -> "FakeHttp":
+            return self
+
+        def timeout(self, venue: str) -> None:
+            return None
+
+        def request(self, method: str, url: str, **kwargs: object) -> FakeResponse:
+            ad = {"adv": {"price": "90", "minSingleTransAmount": "0", "dynamicMaxSingleTransAmount": "1000"}}
+            return FakeResponse(self.statuses.pop(0), {"data": [ad, ad]})
+
+    breaker = CircuitBreaker(failure_threshold=2)
+
+    async def collect(parser: P2PParser) -> list[dict]:
+        return [ad async for ad in parser.iter_ads("binance_p2p", "USDT", "RUB", banks=[], page_size=2, max_pages=5)]
+
+    # сбой глубокой страницы обрезает выдачу, но засчитывается площадке
+    assert len(asyncio.run(collect(P2PParser(http=FakeHttp([200, 503]), breaker=breaker)))) == 2
+    assert breaker.state("binance_p2p") == "closed"
+    with pytest.raises(ConnectionError):
+        asyncio.run(collect(P2PParser(http=FakeHttp([503]), breaker=breaker)))
+    assert breaker.state("binance_p2p") == "open"
+
+
+RECORDED_FEED = {
+    ("binance", "BTC/USDT"): [
+        {"type": "snapshot", "bids": [[99.0, 1.0], [98.5, 2.0]], "asks": [[100.0, 1.0], [100.5, 3.0]]},
+        {"type": "delta", "bids": [[99.5, 0.5]], "asks": [[100.0, 0]]},
+    ],
+    ("bybit", "BTC/USDT"): [
+        {"type": "snapshot", "bids": [[103.0, 2.0]], "asks": [[104.0, 1.0]]},
+    ],
+}
+
+
+def test_streamer_replays_feed_into_store_and_analyzer_reads_it() -> None:
+    async def replay(exchange_id: str, symbol: str):
+        for update in RECORDED_FEED.get((exchange_id, symbol), []):
+            await asyncio.sleep(0)
+            yield update
+
+    store = OrderBookStore(depth=5)
+
+    async def run() -> None:
+        streamer = CEXStreamer(store, source=replay)
+        streamer.start(["binance", "bybit"], ["BTC/USDT"])
+        await asyncio.sleep(0.01)
+        await streamer.close()
+
+    asyncio.run(run())
+    assert store.top("binance", "BTC/USDT") == (99.5, 100.5)
+    assert store.top("bybit", "BTC/USDT") == (103.0, 104.0)
+
+    analyzer = ArbitrageAnalyzer(book_store=store)
+    result = analyzer.find([], [], [], min_profit_percent=1.0, strategy="cex-cex")
+    assert [x["route"] for x in result] == ["binance -> bybit (BTC/USDT)"]
+    assert result[0]["buy_price"] == 100.5
+
+    # биржа без стрима (kraken) остаётся на REST, стримящиеся берутся из стакана
+    assert store.exchanges() == {"binance", "bybit"}
+    rest = [
+        {"exchange": "binance", "symbol": "BTC/USDT", "bid": 90.0, "ask": 91.0, "orderbook_depth": 10},
+        {"exchange": "kraken", "symbol": "BTC/USDT", "bid": 98.0, "ask": 98.5, "orderbook_depth": 10},
+    ]
+    rows = analyzer.live_cex(rest)
+    assert sorted((row["exchange"], row["bid"]) for row in rows) == [("binance", 99.5), ("bybit", 103.0), ("kraken", 98.0)]
+    routes = [x["route"] for x in analyzer.find(rest, [], [], min_profit_percent=1.0, strategy="cex-cex")]
+    assert "kraken -> bybit (BTC/USDT)" in routes
+
+
+def test_replay_engine_reports_spreads_and_persistence(tmp_path) -> None:
+    store = TickStore(str(tmp_path / "ticks"))
+    start = 1_700_000_000
+    for n in range(6):
+        # binance -> bybit держится 4 снапшота подряд (через границы чанков), потом пропадает
+        ask = 100.0 if n < 4 else 104.0
+        cex = [
+            {"exchange": "binance", "symbol": "BTC/USDT", "bid": 99.0, "ask": ask, "spot_price": ask},
+            {"exchange": "bybit", "symbol": "BTC/USDT", "bid": 103.0, "ask": 104.0, "spot_price": 103.5},
+        ]
+        dex = [{"exchange": "dex-aggregated", "symbol": "BTC/USDT", "price": 100.0, "liquidity": 1e6}]
+        store.append(tick_rows(start + 60 * n, cex, dex, []))
+
+    config = ReplayConfig(min_profit_percent=0.5, dex_fees_abs=0.0)
+    serial = ReplayEngine(str(tmp_path / "ticks"), config, workers=1).run()
+    parallel = ReplayEngine(str(tmp_path / "ticks"), config, workers=3).run()
+
+    assert serial.snapshots == parallel.snapshots == 6
+    assert serial.by_type == parallel.by_type == {"cex-cex": 4, "dex-cex": 6}
+    assert serial.spread == parallel.spread
+    assert serial.persistence == parallel.persistence
+    assert serial.persistence["episodes"] == 2
+    assert serial.persistence["max_sec"] == 300.0
+    assert ReplayEngine(str(tmp_path / "ticks"), ReplayConfig(dex_fees_abs=10.0), workers=1).run().by_type == {"cex-cex": 4}
+
+
+def test_replay_merges_per_parser_tick_groups_into_market_state(tmp_path) -> None:
+    store = TickStore(str(tmp_path / "ticks"))
+    cex = [
+        {"exchange": "binance", "symbol": "BTC/USDT", "bid": 99.0, "ask": 100.0},
+        {"exchange": "bybit", "symbol": "BTC/USDT", "bid": 103.0, "ask": 104.0},
+    ]
+    start = 1_700_000_000
+    for n in range(4):
+        # рекордер пишет каждую загрузку парсера отдельной группой тиков со своим временем
+        store.append(tick_rows(start + 60 * n, cex, [], []))
+        p2p = [{"exchange": "garantex_p2p", "asset": "USDT", "fiat": "RUB", "price": 90.0 + n, "max_limit": 1e5}]
+        store.append(tick_rows(start + 60 * n + 5, [], [], p2p))
+
+    serial = ReplayEngine(str(tmp_path / "ticks"), ReplayConfig(min_profit_percent=0.5), workers=1).run()
+    parallel = ReplayEngine(str(tmp_path / "ticks"), ReplayConfig(min_profit_percent=0.5), workers=3).run()
+    assert serial.snapshots == parallel.snapshots == 8
+    # P2P-группа не обрывает CEX-маршрут, хотя CEX-строк в ней нет
+    assert serial.persistence == parallel.persistence
+    assert (serial.persistence["episodes"], serial.persistence["max_sec"]) == (1, 185.0)
@@ -0,0 +1,517 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+
+import numpy as np
+import pytest
+from telegram.error import Forbidden, RetryAfter
+
+from bot.notifier import Notifier
+from data import AlertStateStore, Database, OpportunityWriter, RetentionManager, TickRecorder, TickStore
+from utils import AsyncRateLimiter, AsyncTTLCache, CircuitBreaker, CircuitOpenError, TokenBucket, TwoTierCache, retry_async
+
+
+def test_token_bucket_burst_then_throttle() -> None:
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert 0.09 < bucket.reserve() <= 0.1
+    assert 0.19 < bucket.reserve() <= 0.2
+
+
+def test_token_bucket_clamps_heavy_weight_and_refunds_cancelled_waits() -> None:
+    # вес 10 при burst 5 на пустом бакете проходит сразу, а не через секунду
+    bucket = TokenBucket(rate=5, capacity=5)
+    assert bucket.reserve(10) == 0
+    assert 0.19 < bucket.reserve() <= 0.2
+
+    async def run() -> float:
+        waiter = asyncio.create_task(bucket.acquire(5))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return bucket.reserve(0.0)
+
+    # отменённый резерв вернулся: остался только долг за первый одиночный токен
+    assert asyncio.run(run()) < 0.2
+
+
+def test_rate_limiter_venues_do_not_block_each_other() -> None:
+    limiter = AsyncRateLimiter(2, 0.1, endpoint_weights={"heavy": 2})
+
+    async def run() -> float:
+        await limiter.wait("binance", "heavy")
+        start = time.monotonic()
+        await asyncio.gather(limiter.wait("binance"), limiter.wait("bybit"), limiter.wait("bybit"))
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(run())
+    stats = limiter.stats()
+    assert elapsed < 0.2
+    assert stats["binance"].requests == 2
+    assert stats["binance"].delayed == 1
+    assert stats["bybit"].delayed == 0
+
+
+def test_ttl_cache_coalesces_concurrent_loads() -> None:
+    cache: AsyncTTLCache[list[int]] = AsyncTTLCache(ttl_seconds=60)
+    calls = 0
+
+    async def loader() -> list[int]:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return [calls]
+
+    async def run() -> list[list[int]]:
+        results = await asyncio.gather(*(cache.get_or_load("cex", loader) for _ in range(5)))
+        results.append(await cache.get_or_load("cex", loader))
+        return results
+
+    results = asyncio.run(run())
+    assert calls == 1
+    assert all(r == [1] for r in results)
+    assert (cache.stats.misses, cache.stats.coalesced, cache.stats.hits) == (1, 4, 1)
+
+
+def test_ttl_cache_lru_eviction_and_negative_ttl() -> None:
+    cache: AsyncTTLCache[list[int]] = AsyncTTLCache(ttl_seconds=60, max_entries=2, negative_ttl_seconds=0)
+
+    async def run() -> None:
+        await cache.set("a", [1])
+        await cache.set("b", [2])
+        assert await cache.get("a") == [1]
+        await cache.set("c", [3])
+        assert await cache.get("b") is None
+        assert await cache.get("a") == [1]
+
+        await cache.set("empty", [])
+        await asyncio.sleep(0.01)
+        assert await cache.get("empty") is None
+
+    asyncio.run(run())
+    assert cache.stats.evictions >= 1
+    assert cache.size_bytes > 0
+
+
+def test_ttl_cache_serves_stale_while_revalidating() -> None:
+    cache: AsyncTTLCache[list[str]] = AsyncTTLCache(ttl_seconds=0, stale_ttl_seconds=60)
+
+    async def fresh() -> list[str]:
+        await asyncio.sleep(0.01)
+        return ["fresh"]
+
+    async def run() -> tuple[list[str], list[str] | None]:
+        await cache.set("p2p", ["old"])
+        await asyncio.sleep(0.01)
+        served = await cache.get_or_load("p2p", fresh)
+        await asyncio.sleep(0.05)
+        return served, await cache.get_stale("p2p")
+
+    served, refreshed = asyncio.run(run())
+    assert served == ["old"]
+    assert refreshed == ["fresh"]
+    assert cache.stats.stale_hits == 1
+
+
+def test_circuit_breaker_opens_probes_and_adapts_timeout() -> None:
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout_sec=0.05, min_timeout_sec=0.5, max_timeout_sec=10)
+
+    async def boom() -> None:
+        raise ConnectionError("geo-blocked")
+
+    async def ok() -> str:
+        return "ok"
+
+    async def run() -> None:
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await breaker.call("kraken", boom)
+        assert breaker.state("kraken") == "open"
+        with pytest.raises(CircuitOpenError):
+            await breaker.call("kraken", ok)
+
+        await asyncio.sleep(0.06)
+        assert await breaker.call("kraken", ok) == "ok"
+        assert breaker.state("kraken") == "closed"
+
+    asyncio.run(run())
+    assert breaker.timeout("binance") == 10
+    for _ in range(10):
+        breaker.record_success("binance", 0.1)
+    assert breaker.timeout("binance") == 0.5
+
+
+def test_retry_async_does_not_retry_open_circuit() -> None:
+    calls: list[str] = []
+
+    @retry_async(retries=3, delay=0, no_retry=(CircuitOpenError,))
+    async def load(error: Exception) -> None:
+        calls.append(type(error).__name__)
+        raise error
+
+    async def run() -> None:
+        with pytest.raises(CircuitOpenError):
+            await load(CircuitOpenError("circuit open for coincap"))
+        with pytest.raises(ConnectionError):
+            await load(ConnectionError("reset"))
+
+    asyncio.run(run())
+    assert calls == ["CircuitOpenError"] + ["ConnectionError"] * 3
+
+
+def test_notifier_coalesces_per_chat_and_honors_retry_after() -> None:
+    class FakeBot:
+        def __init__(self) -> None:
+            self.sent: list[tuple[int, str]] = []
+            self.flood = True
+
+        async def send_message(self, chat_id: int, text: str) -> None:
+            if self.flood:
+                self.flood = False
+                raise RetryAfter(0)
+            if chat_id == 3:
+                raise Forbidden("bot was blocked by the user")
+            self.sent.append((chat_id, text))
+
+    delivered: list[str] = []
+
+    async def run() -> tuple[FakeBot, Notifier]:
+        bot = FakeBot()
+        notifier = Notifier(bot, workers=2, global_rate=100, chat_rate=100)
+        notifier.start()
+        notifier.enqueue(1, "a", key="r1", on_sent=lambda: delivered.append("a"))
+        notifier.enqueue(1, "b")
+        notifier.enqueue(1, "a2", key="r1", on_sent=lambda: delivered.append("a2"))  # заменяет неотправленный "a"
+        notifier.enqueue(2, "c")
+        notifier.enqueue(3, "d", on_sent=lambda: delivered.append("d"))
+        await notifier.join()
+        await notifier.close()
+        return bot, notifier
+
+    bot, notifier = asyncio.run(run())
+    assert sorted(bot.sent) == [(1, "a2\n\nb"), (2, "c")]
+    assert delivered == ["a2"]
+    stats = notifier.stats()
+    assert (stats.enqueued, stats.coalesced, stats.sent, stats.retried, stats.failed) == (5, 2, 2, 1, 1)
+    assert stats.queue_depth == 0
+
+
+def test_notifier_retries_after_every_flood_wait_and_evicts_idle_chat_buckets(monkeypatch) -> None:
+    class FloodBot:
+        def __init__(self, floods: int) -> None:
+            self.floods = floods
+            self.sent: list[int] = []
+
+        async def send_message(self, chat_id: int, text: str) -> None:
+            if self.floods:
+                self.floods -= 1
+                raise RetryAfter(0.01)
+            self.sent.append(chat_id)
+
+    async def run(floods: int, max_retries: int) -> tuple[FloodBot, Notifier]:
+        bot = FloodBot(floods)
+        notifier = Notifier(bot, workers=1, global_rate=1000, chat_rate=1000, max_retries=max_retries)
+        notifier.start()
+        notifier.enqueue(1, "a")
+        await notifier.join()
+        await notifier.close()
+        return bot, notifier
+
+    # последняя flood-пауза тоже заканчивается попыткой, а не засчитанным провалом
+    bot, notifier = asyncio.run(run(floods=2, max_retries=2))
+    assert bot.sent == [1] and notifier.stats().failed == 0
+    bot, notifier = asyncio.run(run(floods=2, max_retries=1))
+    assert bot.sent == [] and notifier.stats().failed == 1
+
+    bucket = TokenBucket(rate=100, capacity=100)
+    bucket.pause(0.5)
+    bucket.pause(0.1)
+    assert 0.49 < bucket.reserve() <= 0.52
+
+    monkeypatch.setattr("bot.notifier.CHAT_BUCKETS_SWEEP_AT", 4)
+    notifier = Notifier(FloodBot(0), chat_rate=1)
+    for chat_id in range(4):
+        notifier._chat_bucket(chat_id)
+    notifier._chat_bucket(0).reserve()  # чат 0 только что писал, его bucket ещё не восполнился
+    notifier._chat_bucket(99)
+    assert set(notifier._chat_buckets) == {0, 99}
+
+
+def test_alert_state_suppresses_repeats_and_survives_restart(tmp_path) -> None:
+    db = Database(str(tmp_path / "bot.db"))
+    route = "binance -> bybit (BTC/USDT)"
+
+    async def run() -> None:
+        await db.init()
+        alerts = AlertStateStore(cooldown_sec=600, min_spread_delta=0.5, max_entries=2)
+        assert alerts.should_send(1, route, 2.0, now=1000)
+        # проверка ничего не записывает: пока отправка не подтверждена, алерт снова кандидат
+        assert alerts.should_send(1, route, 2.0, now=1050) and len(alerts) == 0
+        alerts.mark_sent(1, route, 2.0, now=1050)
+        assert not alerts.should_send(1, route, 2.3, now=1100)
+        assert alerts.should_send(1, route, 2.6, now=1200)
+        alerts.mark_sent(1, route, 2.6, now=1200)
+        alerts.mark_sent(2, route, 2.0, now=1300)
+        await alerts.flush(db, now=1300)
+
+        restored = AlertStateStore(cooldown_sec=600, min_spread_delta=0.5)
+        await restored.load(db, now=1400)
+        assert len(restored) == 2
+        assert not restored.should_send(1, route, 2.7, now=1400)
+        assert restored.should_send(1, route, 2.7, now=1800)
+
+        alerts.mark_sent(3, route, 1.0, now=1400)
+        assert len(alerts) == 2
+        assert alerts.should_send(1, route, 2.6, now=1400)
+        await db.close()
+
+    asyncio.run(run())
+
+
+def test_opportunity_writer_batches_rows_and_flushes_on_close(tmp_path) -> None:
+    db = Database(str(tmp_path / "bot.db"))
+    batches: list[int] = []
+
+    async def run() -> list[dict]:
+        await db.init()
+        save = db.save_opportunities
+
+        async def counting_save(rows: list) -> None:
+            batches.append(len(rows))
+            await save(rows)
+
+        db.save_opportunities = counting_save  # type: ignore[method-assign]
+        writer = OpportunityWriter(db, batch_size=4, flush_interval_sec=60, max_queue=8)
+        for i in range(10):
+            await writer.enqueue(7, {"type": "p2p", "route": f"r{i}", "spread_percent": 1.0})
+        await writer.close()
+        rows = await db.get_recent_opportunities(7, limit=20)
+        await db.close()
+        return rows
+
+    rows = asyncio.run(run())
+    assert len(rows) == 10
+    assert batches[:2] == [4, 4]
+    assert sum(batches) == 10
+
+
+def test_opportunity_writer_flushes_one_user_without_draining_the_queue(tmp_path) -> None:
+    db = Database(str(tmp_path / "bot.db"))
+
+    async def run() -> None:
+        await db.init()
+        try:
+            save = db.save_opportunities
+            gate = asyncio.Event()
+
+            async def slow_save(rows: list) -> None:
+                # пакеты пользователя 9 «застревают» — как длинная очередь чужих строк
+                if any(row[0] == 9 for row in rows):
+                    await gate.wait()
+                await save(rows)
+
+            db.save_opportunities = slow_save  # type: ignore[method-assign]
+            writer = OpportunityWriter(db, batch_size=2, flush_interval_sec=60, max_queue=16)
+            for user_id in (7, 7, 9, 9, 9, 9):
+                await writer.enqueue(user_id, {"type": "p2p", "route": f"u{user_id}", "spread_percent": 1.0})
+
+            assert await writer.flush_user(7, timeout_sec=1.0)
+            assert len(await db.get_recent_opportunities(7)) == 2
+            assert not await writer.flush_user(9, timeout_sec=0.05)
+            assert await writer.flush_user(8)  # у пользователя нет строк в очереди
+
+            gate.set()
+            assert await writer.flush_user(9, timeout_sec=1.0)
+            assert len(await db.get_recent_opportunities(9)) == 4
+            await writer.close()
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_retention_rolls_up_and_prunes_history(tmp_path) -> None:
+    db = Database(str(tmp_path / "bot.db"))
+    route = "binance -> bybit (BTC/USDT)"
+    now = 1_700_000_000
+
+    async def run() -> None:
+        await db.init()
+        try:
+            rows = [
+                Database.opportunity_row(1, {"type": "cex-cex", "route": route, "spread_percent": spread, "liquidity": 100.0, "grade": "low"})
+                for spread in (1.0, 2.0, 3.0)
+            ]
+            await db.save_opportunities(rows)
+            conn = await db._connection()
+            ages = (10 * 86400, 10 * 86400 + 60, 3600)
+            for row_id, age in zip((1, 2, 3), ages):
+                created_at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now - age))
+                await conn.execute("UPDATE opportunities SET created_at=? WHERE id=?", (created_at, row_id))
+            await conn.commit()
+
+            stored = await db.get_recent_opportunities(1)
+            assert json.loads(stored[0]["metadata_json"]) == {"grade": "low"}
+
+            # новая БД создаётся сразу с auto_vacuum=INCREMENTAL, миграция не нужна
+            assert await db.migrate_auto_vacuum() is False
+
+            # сбой удаления после вставки агрегатов откатывает и агрегаты: иначе строки посчитаются дважды
+            await conn.execute("CREATE TEMP TRIGGER fail_purge BEFORE DELETE ON opportunities BEGIN SELECT RAISE(ABORT, 'boom'); END")
+            retention = RetentionManager(db, raw_days=7, hourly_days=90)
+            with pytest.raises(Exception, match="boom"):
+                await retention.run_once(now=now)
+            assert await db.get_rollups(route) == []
+            assert not conn.in_transaction
+            await conn.execute("DROP TRIGGER fail_purge")
+
+            # сбой ещё до BEGIN (висящая неявная транзакция) тоже не оставляет соединение в транзакции
+            await conn.execute("UPDATE opportunities SET liquidity=liquidity WHERE id=3")
+            with pytest.raises(Exception, match="within a transaction"):
+                await retention.run_once(now=now)
+            assert not conn.in_transaction
+
+            assert (await retention.run_once(now=now))["raw"] == 2
+            assert [r["spread_percent"] for r in await db.get_recent_opportunities(1)] == [3.0]
+            [hourly] = await db.get_rollups(route)
+            assert (hourly["samples"], hourly["spread_min"], hourly["spread_max"], hourly["spread_avg"]) == (2, 1.0, 2.0, 1.5)
+
+            assert (await retention.run_once(now=now + 100 * 86400))["hourly"] >= 1
+            assert await db.get_rollups(route) == []
+            daily = await db.get_rollups(route, granularity="day")
+            assert [row["samples"] for row in daily] == [2, 1]
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+def test_two_tier_cache_restores_snapshots_from_sqlite(tmp_path) -> None:
+    db = Database(str(tmp_path / "bot.db"))
+    calls: list[str] = []
+
+    async def loader() -> list[dict]:
+        calls.append("load")
+        return [{"exchange": "binance", "bid": 100.0}]
+
+    async def run() -> tuple[list[dict], list[dict], int]:
+        await db.init()
+        try:
+            first: TwoTierCache[list[dict]] = TwoTierCache(ttl_seconds=60, namespace="cex", stale_ttl_seconds=600)
+            first.attach(db)
+            await first.get_or_load("cex:BTC/USDT", loader)
+
+            # новый процесс: L1 пуст, снапшот поднимается из scan_cache без обращения к загрузчику
+            second: TwoTierCache[list[dict]] = TwoTierCache(ttl_seconds=60, namespace="cex", stale_ttl_seconds=600)
+            second.attach(db)
+            restored = await second.restore()
+            from_restore = await second.get_or_load("cex:BTC/USDT", loader)
+
+            third: TwoTierCache[list[dict]] = TwoTierCache(ttl_seconds=60, namespace="cex", stale_ttl_seconds=600)
+            third.attach(db)
+            from_l2 = await third.get_or_load("cex:BTC/USDT", loader)
+            assert await db.purge_cache() == 0
+
+            # без окна stale (CACHE_STALE_TTL_SEC=0) L2 всё равно пишется; пустые результаты — нет
+            no_stale: TwoTierCache[list[dict]] = TwoTierCache(ttl_seconds=60, namespace="dex", stale_ttl_seconds=0, negative_ttl_seconds=5)
+            no_stale.attach(db)
+            await no_stale.get_or_load("dex:ETH", loader)
+            await no_stale.get_or_load("dex:DOGE", lambda: asyncio.sleep(0, result=[]))
+            assert [key for key, _ in await db.load_cache("dex:")] == ["dex:ETH"]
+            return from_restore, from_l2, restored
+        finally:
+            await db.close()
+
+    from_restore, from_l2, restored = asyncio.run(run())
+    assert restored == 1
+    assert from_restore == from_l2 == [{"exchange": "binance", "bid": 100.0}]
+    assert calls == ["load", "load"]
+
+
+def test_tick_recorder_writes_daily_columnar_chunks(tmp_path) -> None:
+    cex = [
+        {"exchange": "binance", "symbol": "BTC/USDT", "bid": 100.0, "ask": 101.0, "orderbook_depth": 5.0, "taker_fee": 0.001},
+        {"exchange": "bybit", "symbol": "BTC/USDT", "bid": 102.0, "ask": 103.0},
+    ]
+    dex = [{"exchange": "dex-aggregated", "symbol": "BTC/USDT", "price": 99.0, "liquidity": 1e6}]
+    p2p = [{"exchange": "binance_p2p", "asset": "USDT", "fiat": "RUB", "price": 90.0, "min_limit": 1000.0, "max_limit": 5000.0}]
+    day = 86400 * 20000
+    # недописанный чанк от упавшего процесса не должен мешать нумерации
+    leftover = tmp_path / "ticks" / time.strftime("%Y-%m-%d", time.gmtime(day + 86400)) / ".tmp-000000"
+    leftover.mkdir(parents=True)
+    (leftover / "ts.npy").write_bytes(b"partial")
+
+    async def run() -> TickRecorder:
+        recorder = TickRecorder(str(tmp_path / "ticks"), chunk_rows=100, max_pending_rows=12)
+        recorder.record(cex, dex, p2p, ts=day + 10)
+        recorder.record(cex, dex, p2p, ts=day + 86400 + 10)  # новые сутки: чанк первого дня уходит на запись
+        recorder.record(cex, dex, p2p, ts=day + 86400 + 20)
+        recorder.record(cex, dex, p2p, ts=day + 86400 + 30)  # не влезает в буфер
+        await asyncio.sleep(0.05)
+        assert recorder.written == 4 and recorder.pending == 8
+        await recorder.close()
+        return recorder
+
+    recorder = asyncio.run(run())
+    assert (recorder.written, recorder.dropped) == (12, 4)
+
+    async def idle() -> int:
+        # недобранный чанк уходит на диск по возрасту буфера, без close и без новых снапшотов
+        aged = TickRecorder(str(tmp_path / "aged"), max_buffer_sec=0.05)
+        aged.record(cex, dex, p2p, ts=day)
+        await asyncio.sleep(0.2)
+        written = aged.written
+        await aged.close()
+        return written
+
+    assert asyncio.run(idle()) == 4
+
+    store = TickStore(str(tmp_path / "ticks"))
+    assert len(store.days()) == 2
+    assert [p.name for p in store.chunk_paths()] == ["chunk-000000", "chunk-000000"]
+    assert not leftover.exists()
+    chunk = next(store.iter_chunks())
+    assert isinstance(chunk["bid"], np.memmap)
+    bybit = store.scan(kind="cex", exchange="bybit")
+    assert bybit["ask"].tolist() == [103.0, 103.0, 103.0]
+    assert store.decode("symbol", bybit["symbol"]) == ["BTC/USDT"] * 3
+    p2p_ticks = store.scan(start_day=store.days()[1], symbol="USDT/RUB", columns=("price", "max_limit"))
+    assert (p2p_ticks["price"].tolist(), p2p_ticks["max_limit"].tolist()) == ([90.0, 90.0], [5000.0, 5000.0])
+    assert store.scan(exchange="kraken")["ts"].size == 0
+
+
+def test_tick_recorder_records_only_fetched_snapshots_with_fetch_time(tmp_path) -> None:
+    recorder = TickRecorder(str(tmp_path / "ticks"))
+    cache: TwoTierCache[list] = TwoTierCache(60, namespace="cex", stale_ttl_seconds=60)
+    cache.on_load = recorder.hook("cex")
+    cex = [
+        {"exchange": "binance", "symbol": "BTC/USDT", "bid": 99.0, "ask": 100.0},
+        {"exchange": "bybit", "symbol": "BTC/USDT", "bid": 103.0, "ask": 104.0},
+    ]
+    books = [{"exchange": "okx", "symbol": "BTC/USDT", "bid": 98.0, "ask": 99.0, "updated_at": 1_700_000_000.0}]
+
+    async def load() -> list:
+        await asyncio.sleep(0.01)
+        return cex
+
+    async def run() -> float:
+        before = time.time()
+        for _ in range(3):
+            await cache.get_or_load("cex:BTC/USDT", load)
+        # стрим: неизменившийся стакан второй раз не пишется
+        recorder.record_books(books)
+        recorder.record_books(books)
+        await recorder.close()
+        return before
+
+    before = asyncio.run(run())
+    store = TickStore(str(tmp_path / "ticks"))
+    ticks = store.scan(kind="cex")
+    assert store.decode("exchange", ticks["exchange"]) == ["okx", "binance", "bybit"]
+    assert ticks["ts"][0] == 1_700_000_000.0
+    assert ticks["ts"][1] == ticks["ts"][2] >= before + 0.01
+
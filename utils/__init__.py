@@ -1,9 +1,16 @@
-from .helpers import AsyncRateLimiter, AsyncTTLCache, retry_async
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .helpers import AsyncRateLimiter, AsyncTTLCache, CacheStats, LimiterStats, TokenBucket, TwoTierCache, retry_async
 from .validators import normalize_banks, validate_profit_threshold, validate_symbol
 
 __all__ = [
     "AsyncRateLimiter",
     "AsyncTTLCache",
+    "CacheStats",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "LimiterStats",
+    "TokenBucket",
+    "TwoTierCache",
     "retry_async",
     "normalize_banks",
     "validate_profit_threshold",
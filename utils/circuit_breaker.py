@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Awaitable, Callable, Deque, Dict, TypeVar
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+@dataclass
+class VenueHealth:
+    state: str = CLOSED
+    consecutive_failures: int = 0
+    opened_at: float = 0.0
+    probe_in_flight: bool = False
+    outcomes: Deque[bool] = field(default_factory=deque)
+    latencies: Deque[float] = field(default_factory=deque)
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class CircuitBreaker:
+    """Circuit breaker по площадкам с таймаутами от наблюдаемой p95-латентности.
+
+    После `failure_threshold` ошибок подряд (или доли ошибок выше `error_rate_threshold` в окне)
+    площадка пропускается `reset_timeout_sec`, затем пропускается один пробный запрос (half-open).
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        error_rate_threshold: float = 0.5,
+        window: int = 20,
+        reset_timeout_sec: float = 60.0,
+        min_timeout_sec: float = 2.0,
+        max_timeout_sec: float = 12.0,
+        timeout_multiplier: float = 2.0,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.window = window
+        self.reset_timeout_sec = reset_timeout_sec
+        self.min_timeout_sec = min_timeout_sec
+        self.max_timeout_sec = max_timeout_sec
+        self.timeout_multiplier = timeout_multiplier
+        self._venues: Dict[str, VenueHealth] = {}
+
+    def health(self, venue: str) -> VenueHealth:
+        health = self._venues.get(venue)
+        if health is None:
+            health = VenueHealth(outcomes=deque(maxlen=self.window), latencies=deque(maxlen=self.window))
+            self._venues[venue] = health
+        return health
+
+    def state(self, venue: str) -> str:
+        return self.health(venue).state
+
+    def allow(self, venue: str) -> bool:
+        health = self.health(venue)
+        if health.state == CLOSED:
+            return True
+        if health.state == OPEN:
+            if time.monotonic() - health.opened_at < self.reset_timeout_sec:
+                return False
+            health.state = HALF_OPEN
+        if health.probe_in_flight:
+            return False
+        health.probe_in_flight = True
+        return True
+
+    def timeout(self, venue: str) -> float:
+        latencies = sorted(self.health(venue).latencies)
+        if len(latencies) < 5:
+            return self.max_timeout_sec
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return min(self.max_timeout_sec, max(self.min_timeout_sec, p95 * self.timeout_multiplier))
+
+    def record_success(self, venue: str, latency_sec: float) -> None:
+        health = self.health(venue)
+        health.outcomes.append(True)
+        health.latencies.append(latency_sec)
+        health.consecutive_failures = 0
+        health.probe_in_flight = False
+        if health.state != CLOSED:
+            logger.info("Circuit closed for %s", venue)
+            health.state = CLOSED
+            health.outcomes.clear()
+
+    def record_failure(self, venue: str) -> None:
+        health = self.health(venue)
+        health.outcomes.append(False)
+        health.consecutive_failures += 1
+        health.probe_in_flight = False
+        too_many = health.consecutive_failures >= self.failure_threshold
+        too_often = len(health.outcomes) >= self.failure_threshold * 2 and health.error_rate >= self.error_rate_threshold
+        if health.state == HALF_OPEN or too_many or too_often:
+            if health.state != OPEN:
+                logger.warning("Circuit opened for %s after %s failures", venue, health.consecutive_failures)
+            health.state = OPEN
+            health.opened_at = time.monotonic()
+
+    async def call(self, venue: str, func: Callable[[], Awaitable[T]]) -> T:
+        if not self.allow(venue):
+            raise CircuitOpenError(f"circuit open for {venue}")
+        started = time.monotonic()
+        try:
+            async with asyncio.timeout(self.timeout(venue)):
+                result = await func()
+        except asyncio.CancelledError:
+            self.health(venue).probe_in_flight = False
+            raise
+        except Exception:
+            self.record_failure(venue)
+            raise
+        self.record_success(venue, time.monotonic() - started)
+        return result
+
+
+@lru_cache(maxsize=1)
+def get_circuit_breaker() -> CircuitBreaker:
+    settings = get_settings()
+    return CircuitBreaker(
+        failure_threshold=settings.breaker_failure_threshold,
+        reset_timeout_sec=settings.breaker_reset_sec,
+        min_timeout_sec=settings.breaker_min_timeout_sec,
+        max_timeout_sec=settings.breaker_max_timeout_sec,
+    )
@@ -2,10 +2,11 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import sys
 import time
-from collections import deque
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Any, Awaitable, Callable, Deque, Dict, Generic, Optional, TypeVar
+from typing import Any, Awaitable, Callable, Dict, Generic, Optional, Sized, TypeVar
 
 logger = logging.getLogger(__name__)
 T = TypeVar("T")
@@ -15,54 +16,375 @@ T = TypeVar("T")
 class CacheItem(Generic[T]):
     value: T
     expires_at: float
+    stale_until: float = 0.0
+    size: int = 0
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    stale_hits: int = 0
+    evictions: int = 0
+
+
+def estimate_size(value: Any, _depth: int = 0) -> int:
+    """Грубая оценка памяти значения: sys.getsizeof с обходом вложенных контейнеров."""
+    size = sys.getsizeof(value)
+    if _depth >= 4:
+        return size
+    if isinstance(value, dict):
+        size += sum(estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(x, _depth + 1) for x in value)
+    return size
 
 
 class AsyncTTLCache(Generic[T]):
-    """Простой async-safe TTL cache."""
+    """Async-safe LRU + TTL cache с ограничением по числу ключей и по памяти.
+
+    `get_or_load` держит не более одной загрузки на ключ: конкурентные промахи ждут тот же future.
+    После истечения TTL значение ещё `stale_ttl_seconds` отдаётся сразу, а обновление идёт в фоне
+    (stale-while-revalidate). Пустые результаты кэшируются на `negative_ttl_seconds`.
+    `on_load(key, value, fetched_at)` вызывается только для значений, реально полученных загрузчиком.
+    """
 
-    def __init__(self, ttl_seconds: int) -> None:
+    def __init__(
+        self,
+        ttl_seconds: int,
+        max_entries: int = 1024,
+        max_bytes: int | None = None,
+        stale_ttl_seconds: int = 0,
+        negative_ttl_seconds: int | None = None,
+    ) -> None:
         self.ttl_seconds = ttl_seconds
-        self._data: Dict[str, CacheItem[T]] = {}
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_ttl_seconds = stale_ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.stats = CacheStats()
+        self.size_bytes = 0
+        self._data: OrderedDict[str, CacheItem[T]] = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task[T]] = {}
         self._lock = asyncio.Lock()
+        self._swept_at = time.time()
+        self.on_load: Callable[[str, T, float], None] | None = None
+
+    def __len__(self) -> int:
+        return len(self._data)
 
     async def get(self, key: str) -> Optional[T]:
         async with self._lock:
+            now = time.time()
             item = self._data.get(key)
-            if not item:
+            if item is None or item.expires_at < now:
+                self.stats.misses += 1
+                if item is not None and item.stale_until < now:
+                    self._remove(key)
                 return None
-            if item.expires_at < time.time():
-                self._data.pop(key, None)
+            self._data.move_to_end(key)
+            self.stats.hits += 1
+            return item.value
+
+    async def get_stale(self, key: str) -> Optional[T]:
+        """Последнее значение, даже просроченное, пока не вышло окно stale."""
+        async with self._lock:
+            item = self._data.get(key)
+            if item is None or item.stale_until < time.time():
                 return None
             return item.value
 
     async def set(self, key: str, value: T, ttl_seconds: Optional[int] = None) -> None:
-        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
         async with self._lock:
-            self._data[key] = CacheItem(value=value, expires_at=time.time() + ttl)
+            self._store(key, value, ttl_seconds)
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[T]], ttl_seconds: Optional[int] = None) -> T:
+        async with self._lock:
+            now = time.time()
+            item = self._data.get(key)
+            if item is not None and item.expires_at >= now:
+                self._data.move_to_end(key)
+                self.stats.hits += 1
+                return item.value
+            task = self._inflight.get(key)
+            if item is not None and item.stale_until >= now:
+                self.stats.stale_hits += 1
+                if task is None:
+                    task = asyncio.create_task(self._load(key, loader, ttl_seconds))
+                    task.add_done_callback(self._log_refresh_error)
+                    self._inflight[key] = task
+                return item.value
+            if task is None:
+                self.stats.misses += 1
+                task = asyncio.create_task(self._load(key, loader, ttl_seconds))
+                self._inflight[key] = task
+            else:
+                self.stats.coalesced += 1
+        # shield: отмена одного из ожидающих не должна отменять общую загрузку
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[T]], ttl_seconds: Optional[int]) -> T:
+        try:
+            value = await loader()
+            self._loaded(key, value)
+            await self.set(key, value, ttl_seconds)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _loaded(self, key: str, value: T) -> None:
+        if self.on_load is None:
+            return
+        try:
+            self.on_load(key, value, time.time())
+        except Exception:  # noqa: BLE001
+            logger.exception("Cache on_load hook failed for %s", key)
+
+    def _store(self, key: str, value: T, ttl_seconds: Optional[int]) -> CacheItem[T]:
+        now = time.time()
+        empty = self._is_empty(value)
+        if ttl_seconds is None:
+            use_negative = empty and self.negative_ttl_seconds is not None
+            ttl_seconds = self.negative_ttl_seconds if use_negative else self.ttl_seconds
+        return self._put(key, value, now + ttl_seconds, now + ttl_seconds + (0 if empty else self.stale_ttl_seconds), now)
+
+    @staticmethod
+    def _is_empty(value: Any) -> bool:
+        return value is None or (isinstance(value, Sized) and len(value) == 0)
+
+    def _put(self, key: str, value: T, expires_at: float, stale_until: float, now: float) -> CacheItem[T]:
+        self._remove(key)
+        item = CacheItem(value=value, expires_at=expires_at, stale_until=stale_until, size=estimate_size(value))
+        self._data[key] = item
+        self.size_bytes += item.size
+        self._evict(now)
+        return item
+
+    def _evict(self, now: float) -> None:
+        if now - self._swept_at > self.ttl_seconds:
+            self._swept_at = now
+            for key in [k for k, item in self._data.items() if item.stale_until < now]:
+                self._remove(key)
+                self.stats.evictions += 1
+        while self._data and (
+            len(self._data) > self.max_entries or (self.max_bytes is not None and self.size_bytes > self.max_bytes)
+        ):
+            self._remove(next(iter(self._data)))
+            self.stats.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.size_bytes -= item.size
+
+    @staticmethod
+    def _log_refresh_error(task: asyncio.Task[Any]) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Background cache refresh failed: %s", task.exception())
+
+
+class TwoTierCache(AsyncTTLCache[T]):
+    """AsyncTTLCache (L1) поверх персистентного L2 — таблицы scan_cache через `Database`.
+
+    Каждое непустое загруженное значение пишется в L2 вместе со своими сроками fresh/stale.
+    Промах L1 сначала проверяет L2 и только потом идёт в сеть. `restore` поднимает в L1 все
+    ещё не вышедшие из окна stale записи с префиксом `namespace`: после рестарта они отдаются
+    сразу, а обновление идёт в фоне, как для обычного stale-hit.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int,
+        namespace: str,
+        encode: Callable[[T], Any] | None = None,
+        decode: Callable[[Any], T] | None = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(ttl_seconds, **kwargs)
+        self.namespace = namespace
+        self.encode = encode or (lambda value: value)
+        self.decode = decode or (lambda payload: payload)
+        self.l2: Any = None
+
+    def attach(self, store: Any) -> None:
+        """Подключает L2: объект с `get_cache`/`set_cache`/`load_cache` (обычно `Database`)."""
+        self.l2 = store
+
+    async def restore(self) -> int:
+        if self.l2 is None:
+            return 0
+        restored = 0
+        async with self._lock:
+            now = time.time()
+            for key, payload in await self.l2.load_cache(f"{self.namespace}:"):
+                if key in self._data:
+                    continue
+                try:
+                    value = self.decode(payload["value"])
+                except Exception as exc:  # noqa: BLE001
+                    logger.warning("Skipping unreadable L2 cache entry %s: %s", key, exc)
+                    continue
+                self._put(key, value, float(payload["expires_at"]), float(payload["stale_until"]), now)
+                restored += 1
+        return restored
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[T]], ttl_seconds: Optional[int]) -> T:
+        try:
+            payload = await self._read_l2(key)
+            if payload is not None:
+                value = self.decode(payload["value"])
+                async with self._lock:
+                    now = time.time()
+                    self._put(key, value, float(payload["expires_at"]), float(payload["stale_until"]), now)
+                return value
+            value = await loader()
+            self._loaded(key, value)
+            # сроки берутся из только что сохранённой записи, а не из _data позже: к моменту
+            # записи в L2 ключ мог уже вытесниться или перезаписаться
+            async with self._lock:
+                item = self._store(key, value, ttl_seconds)
+            if not self._is_empty(value):
+                await self._write_l2(key, item)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _read_l2(self, key: str) -> dict[str, Any] | None:
+        if self.l2 is None:
+            return None
+        try:
+            payload = await self.l2.get_cache(key)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("L2 cache read failed for %s: %s", key, exc)
+            return None
+        # в L2 строка живёт до конца окна stale, а свежей считается только до expires_at
+        if payload is None or float(payload["expires_at"]) < time.time():
+            return None
+        return payload
+
+    async def _write_l2(self, key: str, item: CacheItem[T]) -> None:
+        if self.l2 is None:
+            return
+        payload = {"expires_at": item.expires_at, "stale_until": item.stale_until, "value": self.encode(item.value)}
+        try:
+            await self.l2.set_cache(key, payload, ttl_sec=int(item.stale_until - time.time()) + 1)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("L2 cache write failed for %s: %s", key, exc)
+
+
+@dataclass
+class LimiterStats:
+    requests: int = 0
+    delayed: int = 0
+    total_wait_sec: float = 0.0
+    max_wait_sec: float = 0.0
+
+    @property
+    def avg_wait_sec(self) -> float:
+        return self.total_wait_sec / self.requests if self.requests else 0.0
+
+
+class TokenBucket:
+    """Token bucket: `rate` токенов в секунду, не более `capacity` в запасе.
+
+    Токены резервируются синхронно (баланс может уйти в минус), а ждёт каждый вызывающий
+    сам, поэтому никакой lock не удерживается во время сна и очередь остаётся FIFO. Вес больше
+    `capacity` урезается до неё: иначе такой запрос ждал бы даже на пустом бакете.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.stats = LimiterStats()
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def reserve(self, weight: float = 1.0) -> float:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+        self._tokens -= min(weight, self.capacity)
+        return max(-self._tokens / self.rate, 0.0)
+
+    def refund(self, weight: float = 1.0) -> None:
+        """Возвращает резерв, который так и не был использован (ожидание отменили)."""
+        self._tokens += min(weight, self.capacity)
+
+    def pause(self, seconds: float) -> None:
+        """Следующий `reserve` подождёт не меньше `seconds` (например, после flood control API).
+
+        Паузы не складываются: несколько одновременных вызовов дают самую длинную из них.
+        """
+        self.reserve(0.0)
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+    def is_full(self) -> bool:
+        """Бакет восполнился до `capacity` — он неотличим от нового, его можно выбросить."""
+        return self._tokens + (time.monotonic() - self._updated_at) * self.rate >= self.capacity
+
+    async def acquire(self, weight: float = 1.0) -> float:
+        delay = self.reserve(weight)
+        self.stats.requests += 1
+        if delay > 0:
+            self.stats.delayed += 1
+            self.stats.total_wait_sec += delay
+            self.stats.max_wait_sec = max(self.stats.max_wait_sec, delay)
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.refund(weight)
+                raise
+        return delay
 
 
 class AsyncRateLimiter:
-    """Token bucket-like limiter: не более `max_calls` за `period_sec`."""
+    """Лимитер с отдельным token bucket на каждую площадку/хост.
+
+    По умолчанию `max_calls` за `period_sec` с burst `max_calls`; для отдельных площадок лимит
+    переопределяется через `venue_limits`, а `endpoint_weights` задаёт стоимость тяжёлых эндпоинтов.
+    """
 
-    def __init__(self, max_calls: int, period_sec: float) -> None:
+    def __init__(
+        self,
+        max_calls: int,
+        period_sec: float,
+        burst: float | None = None,
+        venue_limits: Optional[Dict[str, float]] = None,
+        endpoint_weights: Optional[Dict[str, float]] = None,
+    ) -> None:
         self.max_calls = max_calls
         self.period_sec = period_sec
-        self._calls: Deque[float] = deque()
-        self._lock = asyncio.Lock()
+        self.burst = burst
+        self.venue_limits = venue_limits or {}
+        self.endpoint_weights = endpoint_weights or {}
+        self._buckets: Dict[str, TokenBucket] = {}
 
-    async def wait(self) -> None:
-        async with self._lock:
-            now = time.monotonic()
-            while self._calls and now - self._calls[0] > self.period_sec:
-                self._calls.popleft()
+    def bucket(self, venue: str) -> TokenBucket:
+        bucket = self._buckets.get(venue)
+        if bucket is None:
+            calls = self.venue_limits.get(venue, self.max_calls)
+            bucket = TokenBucket(rate=calls / self.period_sec, capacity=self.burst or max(calls, 1))
+            self._buckets[venue] = bucket
+        return bucket
+
+    async def wait(self, venue: str = "default", endpoint: str | None = None, weight: float | None = None) -> float:
+        if weight is None:
+            weight = self.endpoint_weights.get(endpoint, 1.0) if endpoint else 1.0
+        return await self.bucket(venue).acquire(weight)
+
+    def stats(self) -> Dict[str, LimiterStats]:
+        return {venue: bucket.stats for venue, bucket in self._buckets.items()}
 
-            if len(self._calls) >= self.max_calls:
-                sleep_for = self.period_sec - (now - self._calls[0])
-                await asyncio.sleep(max(sleep_for, 0))
-            self._calls.append(time.monotonic())
 
+def retry_async(
+    retries: int = 3,
+    delay: float = 1.0,
+    backoff: float = 2.0,
+    no_retry: tuple[type[Exception], ...] = (),
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Повторяет корутину с экспоненциальной паузой; исключения из `no_retry` пробрасываются сразу."""
 
-def retry_async(retries: int = 3, delay: float = 1.0, backoff: float = 2.0) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
     def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
         async def wrapper(*args: Any, **kwargs: Any) -> T:
             current_delay = delay
@@ -70,6 +392,8 @@ def retry_async(retries: int = 3, delay: float = 1.0, backoff: float = 2.0) -> C
             for attempt in range(retries):
                 try:
                     return await func(*args, **kwargs)
+                except no_retry:
+                    raise
                 except Exception as exc:  # noqa: BLE001
                     last_error = exc
                     logger.warning("Retry %s/%s for %s due to: %s", attempt + 1, retries, func.__name__, exc)
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from functools import lru_cache
+
+import aiohttp
+
+from config import get_settings
+
+
+class HttpClient:
+    """Общий для процесса keep-alive aiohttp-клиент.
+
+    Один connector на всё приложение: лимит соединений на хост, DNS-кэш, сжатые ответы и
+    таймауты по площадкам. Создаётся при старте и закрывается при остановке бота.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 10,
+        dns_ttl_sec: int = 300,
+        keepalive_sec: float = 30.0,
+        default_timeout_sec: float = 15.0,
+        venue_timeouts: dict[str, float] | None = None,
+    ) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl_sec = dns_ttl_sec
+        self.keepalive_sec = keepalive_sec
+        self.default_timeout_sec = default_timeout_sec
+        self.venue_timeouts = venue_timeouts or {}
+        self._session: aiohttp.ClientSession | None = None
+
+    async def start(self) -> None:
+        self.session()
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl_sec,
+                keepalive_timeout=self.keepalive_sec,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.default_timeout_sec),
+                headers={"Accept-Encoding": "gzip, deflate"},
+                auto_decompress=True,
+            )
+        return self._session
+
+    def timeout(self, venue: str) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(total=self.venue_timeouts.get(venue, self.default_timeout_sec))
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+@lru_cache(maxsize=1)
+def get_http_client() -> HttpClient:
+    settings = get_settings()
+    return HttpClient(
+        limit=settings.http_max_connections,
+        limit_per_host=settings.http_max_connections_per_host,
+        dns_ttl_sec=settings.http_dns_ttl_sec,
+        venue_timeouts=settings.venue_timeouts,
+    )